@@ -0,0 +1,252 @@
+"""Keyword-based aisle classifier for grocery product names.
+
+AISLE_RULES is the heuristic from data_insepction.ipynb: aisles are tried in
+order and a name gets the first aisle with any matching pattern. Instead of
+running every pattern against every name, the rules are compiled once:
+
+- single-word patterns (e.g. r'\\bapple(s)?\\b') are expanded into a
+  word -> aisle lookup, so a name is tokenized once with one regex call;
+- multi-word patterns (e.g. r'\\bice cream\\b') are combined into one
+  alternation per aisle and only tried when they could beat the word match;
+- classify_series() classifies each distinct name in a column once.
+
+The result is identical to the original rule loop.
+
+Usage:
+    python aisle_classifier.py --benchmark [--rows N]
+"""
+import argparse
+import random
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_AISLE = 'Other'
+
+# Heuristic aisle assignment based on product_name keywords (first matching aisle wins)
+AISLE_RULES = [
+    ('Produce', [
+        r'\bapple(s)?\b', r'\bbanana(s)?\b', r'\bavocado(s)?\b', r'\bberry(ies)?\b',
+        r'\bgrape(s)?\b', r'\bcitrus\b', r'\blemon(s)?\b', r'\blime(s)?\b',
+        r'\borange(s)?\b', r'\btomato(es)?\b', r'\bonion(s)?\b', r'\bgarlic\b',
+        r'\blettuce\b', r'\bspinach\b', r'\bcarrot(s)?\b', r'\bcucumber(s)?\b',
+        r'\bpepper(s)?\b', r'\bbroccoli\b', r'\bcauliflower\b', r'\bpotato(es)?\b',
+        r'\bmushroom(s)?\b', r'\bherb(s)?\b', r'\bcilantro\b', r'\bparsley\b',
+        r'\bbasil\b', r'\bsalad\b', r'\bfruit\b', r'\bvegetable(s)?\b',
+    ]),
+    ('Dairy', [
+        r'\bmilk\b', r'\bcheese\b', r'\byogurt\b', r'\bbutter\b', r'\bcream\b',
+        r'\bcheddar\b', r'\bmozzarella\b', r'\bparmesan\b', r'\bcottage cheese\b',
+        r'\bsour cream\b', r'\bwhipped\b', r'\bhalf\s*&\s*half\b', r'\bkefir\b',
+        r'\begg(s)?\b',
+    ]),
+    ('Meat', [
+        r'\bbeef\b', r'\bpork\b', r'\bchicken\b', r'\bturkey\b', r'\bsausage\b',
+        r'\bbacon\b', r'\bham\b', r'\bsteak\b', r'\bground\b', r'\bsalami\b',
+        r'\bpepperoni\b', r'\blamb\b', r'\bseafood\b', r'\bshrimp\b', r'\bfish\b',
+        r'\bsalmon\b', r'\btuna\b', r'\bcod\b', r'\bcrab\b', r'\blobster\b',
+        r'\bdeli\b', r'\bprosciutto\b',
+    ]),
+    ('Frozen', [
+        r'\bfrozen\b', r'\bice cream\b', r'\bgelato\b', r'\bpopsicle(s)?\b',
+        r'\bice pop(s)?\b', r'\bfrozen pizza\b', r'\bfries\b', r'\bnugget(s)?\b',
+    ]),
+    ('Beverages', [
+        r'\bsoda\b', r'\bjuice\b', r'\bwater\b', r'\btea\b', r'\bcoffee\b',
+        r'\bbeer\b', r'\bwine\b', r'\bcider\b', r'\bkombucha\b', r'\bsparkling\b',
+        r'\bdrink(s)?\b', r'\bcola\b', r'\benergy\b', r'\bsports drink\b',
+    ]),
+    ('Bakery', [
+        r'\bbread\b', r'\bbagel(s)?\b', r'\bbun(s)?\b', r'\broll(s)?\b',
+        r'\bcroissant(s)?\b', r'\bmuffin(s)?\b', r'\bcake\b', r'\bcookie(s)?\b',
+        r'\bpastry\b', r'\bdonut(s)?\b', r'\btortilla(s)?\b', r'\bpita\b', r'\bnaan\b',
+    ]),
+    ('Snacks', [
+        r'\bchip(s)?\b', r'\bcracker(s)?\b', r'\bpopcorn\b', r'\bpretzel(s)?\b',
+        r'\btrail mix\b', r'\bgranola bar(s)?\b', r'\bprotein bar(s)?\b',
+        r'\bsnack(s)?\b', r'\bnut(s)?\b', r'\bcandy\b', r'\bchocolate\b',
+    ]),
+    ('Pantry', [
+        r'\bpasta\b', r'\brice\b', r'\bflour\b', r'\bsugar\b', r'\bsalt\b',
+        r'\bspice(s)?\b', r'\boil\b', r'\bvinegar\b', r'\bsauce\b', r'\bketchup\b',
+        r'\bmustard\b', r'\bmayonnaise\b', r'\bcereal\b', r'\boats\b', r'\bbean(s)?\b',
+        r'\blentil(s)?\b', r'\bsoup\b', r'\bbroth\b', r'\bcanned\b', r'\bjar\b',
+        r'\bcan\b', r'\bpackaged\b',
+    ]),
+]
+
+TOKEN_RE = re.compile(r'\w+')
+_WORD_PATTERN_RE = re.compile(r'\\b(.*)\\b')
+_OPTIONAL_GROUP_RE = re.compile(r'\(([^()]*)\)\?')
+
+
+def _expand_optional_groups(body):
+    """Expand r'apple(s)?' into {'apple', 'apples'}."""
+    match = _OPTIONAL_GROUP_RE.search(body)
+    if match is None:
+        return {body}
+    before, after = body[:match.start()], body[match.end():]
+    return (_expand_optional_groups(before + match.group(1) + after)
+            | _expand_optional_groups(before + after))
+
+
+def _non_capturing(pattern):
+    return re.sub(r'(?<!\\)\((?!\?)', '(?:', pattern)
+
+
+def _word_alternatives(pattern):
+    """Literal words matched by a r'\\b...\\b' single-word pattern, or None if it isn't one."""
+    match = _WORD_PATTERN_RE.fullmatch(pattern)
+    if match is None:
+        return None
+    words = _expand_optional_groups(match.group(1))
+    if all(TOKEN_RE.fullmatch(word) for word in words):
+        return words
+    return None
+
+
+class AisleClassifier:
+    """Assigns each product name the first aisle in `rules` with a matching pattern."""
+
+    def __init__(self, rules=AISLE_RULES, default=DEFAULT_AISLE):
+        self.aisles = [aisle for aisle, _ in rules]
+        self.default = default
+        # A \b-delimited single word matches iff the name has that \w+ token, so
+        # those patterns become a lookup; the lowest aisle index wins
+        self.word_aisle = {}
+        phrase_patterns = {}
+        for index, (_, patterns) in enumerate(rules):
+            for pattern in patterns:
+                words = _word_alternatives(pattern)
+                if words is None:
+                    phrase_patterns.setdefault(index, []).append(pattern)
+                    continue
+                for word in words:
+                    self.word_aisle.setdefault(word, index)
+        self.phrase_res = [
+            (index, re.compile('|'.join(f'(?:{_non_capturing(p)})' for p in patterns)))
+            for index, patterns in sorted(phrase_patterns.items())
+        ]
+
+    def _classify_index(self, text):
+        best = len(self.aisles)
+        for token in TOKEN_RE.findall(text):
+            index = self.word_aisle.get(token)
+            if index is not None and index < best:
+                best = index
+        for index, phrase_re in self.phrase_res:
+            if index >= best:
+                break
+            if phrase_re.search(text):
+                return index
+        return best
+
+    def classify(self, name):
+        if not isinstance(name, str):
+            return self.default
+        index = self._classify_index(name.lower())
+        return self.aisles[index] if index < len(self.aisles) else self.default
+
+    def classify_series(self, names):
+        """Classify a whole column at once; returns a Series aligned with `names`.
+
+        Each distinct name is classified once, which matters for catalogs where
+        the same product name is listed by several vendors.
+        """
+        names = pd.Series(names)
+        codes, uniques = pd.factorize(names.to_numpy(dtype=object))
+        # factorize marks missing names with -1, which picks the trailing default
+        labels = np.array([self.classify(name) for name in uniques] + [self.default], dtype=object)
+        return pd.Series(labels[codes], index=names.index, name='aisle')
+
+
+_default_classifier = None
+
+
+def _get_default_classifier():
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = AisleClassifier()
+    return _default_classifier
+
+
+def assign_aisle(name):
+    """Aisle for a single product name using the default rules."""
+    return _get_default_classifier().classify(name)
+
+
+def assign_aisles(names):
+    """Aisles for a column of product names using the default rules."""
+    return _get_default_classifier().classify_series(names)
+
+
+def assign_aisle_rule_loop(name):
+    """The original notebook implementation: one re.search per pattern. Kept for benchmarking."""
+    if not isinstance(name, str):
+        return DEFAULT_AISLE
+    text = name.lower()
+    for aisle, patterns in AISLE_RULES:
+        for pattern in patterns:
+            if re.search(pattern, text):
+                return aisle
+    return DEFAULT_AISLE
+
+
+def synthetic_names(n_rows, seed=0):
+    """Product-like names mixing rule keywords with filler words."""
+    rng = random.Random(seed)
+    keywords = sorted({word for _, patterns in AISLE_RULES for p in patterns
+                       for word in (_word_alternatives(p) or [])})
+    keywords += ['ice cream', 'sour cream', 'half & half', 'half&half', 'trail mix',
+                 'granola bars', 'ice pops', 'sports drink', 'frozen pizza']
+    filler = ['organic', 'original', 'family', 'size', 'classic', 'no', 'name', 'pc',
+              'select', 'light', 'extra', 'fresh', 'large', 'mini', 'value', 'pack']
+    names = []
+    for _ in range(n_rows):
+        words = rng.sample(filler, rng.randint(1, 4))
+        if rng.random() < 0.7:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        names.append(' '.join(word.title() if rng.random() < 0.5 else word for word in words))
+    return names
+
+
+def benchmark(n_rows):
+    names = synthetic_names(n_rows)
+    series = pd.Series(names)
+
+    start = time.perf_counter()
+    expected = series.apply(assign_aisle_rule_loop)
+    loop_sec = time.perf_counter() - start
+
+    classifier = AisleClassifier()
+    start = time.perf_counter()
+    per_name = series.apply(classifier.classify)
+    per_name_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = classifier.classify_series(series)
+    vectorized_sec = time.perf_counter() - start
+
+    assert per_name.equals(expected), "classify() disagrees with the rule loop"
+    assert (vectorized.to_numpy() == expected.to_numpy()).all(), "classify_series() disagrees with the rule loop"
+    print(f"{n_rows} names")
+    print(f"  rule loop (notebook):     {loop_sec:8.3f}s")
+    print(f"  AisleClassifier.classify: {per_name_sec:8.3f}s ({loop_sec / per_name_sec:.1f}x)")
+    print(f"  classify_series:          {vectorized_sec:8.3f}s ({loop_sec / vectorized_sec:.1f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aisle classifier benchmark')
+    parser.add_argument('--benchmark', action='store_true', help='compare against the notebook rule loop')
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark(args.rows)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Prefix autocomplete over catalog product names: sorted keys, binary-search ranges, cached top-k.
+
+Each distinct product name (normalized as in catalog_matcher: lowercase
+alphanumeric tokens, accents stripped so "creme" finds "Crème") is one
+suggestion, ranked at build time by popularity (catalog listings carrying the
+name, e.g. across vendors) or by cheapest price. Suggestions are numbered in
+rank order, so the best suggestions for a prefix are simply the smallest
+suggestion numbers among its matches.
+
+The index keys are every suffix of a name that starts at a token ("organic
+whole milk 4l" is found by "org", "whole m" and "milk"), truncated to
+MAX_KEY_BYTES and sorted in one fixed-width byte array. A prefix's matches are
+one contiguous range of it, found with two np.searchsorted calls:
+
+- ranges of up to SCAN_LIMIT keys are answered by taking the smallest distinct
+  suggestion numbers in the range;
+- every prefix whose range is longer than that (short prefixes such as "c" or
+  "ch") has its top k precomputed at build time, found with a third
+  searchsorted over those prefixes.
+
+Prefixes longer than MAX_KEY_BYTES are matched on their first MAX_KEY_BYTES
+and checked against the full name.
+
+All arrays are written as .npy files plus meta.json and memory-mapped on load,
+so a server process opens the index instantly and shares its pages.
+
+Usage:
+    python autocomplete_index.py build --catalog cleaned_grocery_data.json [--rank popularity|price]
+    python autocomplete_index.py query "chick" "2% mi" [-k 10]
+    python autocomplete_index.py benchmark [--rows 1000000] [--replay keystrokes.txt]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog_matcher import normalize_name, synthetic_names
+
+INDEX_PATH = 'autocomplete_index'
+CATALOG_PATH = 'cleaned_grocery_data.json'
+RANKINGS = ('popularity', 'price')
+DEFAULT_K = 10
+# Key width in bytes; longer prefixes are matched on this much and then checked against the name
+MAX_KEY_BYTES = 24
+# Ranges up to this many keys are ranked at query time; longer ones are precomputed
+SCAN_LIMIT = 256
+# Sorted keys compared at once when finding shared prefix lengths (x MAX_KEY_BYTES bytes)
+LCP_CHUNK = 1_000_000
+
+
+def _prices(values):
+    """Float prices from numbers or strings like "$1,299.00" (NaN when unparseable)."""
+    prices = pd.to_numeric(values, errors='coerce')
+    dirty = prices.isna() & values.notna()
+    if dirty.any():
+        prices[dirty] = pd.to_numeric(values[dirty].astype(str).str.replace(r'[$,\s]', '', regex=True),
+                                      errors='coerce')
+    return prices.to_numpy(dtype=float)
+
+
+def suggestions(ids, names, prices, rank='popularity'):
+    """One row per normalized name, in rank order: display name, cheapest listing's id and price, listings."""
+    frame = pd.DataFrame({'id': list(ids), 'name': list(names), 'price': _prices(pd.Series(list(prices)))})
+    frame['key'] = [normalize_name(name) for name in frame['name']]
+    frame = frame[frame['key'] != ''].sort_values(['key', 'price'], na_position='last', kind='stable')
+    entries = frame.groupby('key', sort=False).agg(
+        name=('name', 'first'), id=('id', 'first'), price=('price', 'first'), listings=('id', 'size')).reset_index()
+    length = entries['key'].str.len()
+    if rank == 'popularity':
+        order = np.lexsort((entries['key'], length, entries['price'].fillna(np.inf), -entries['listings']))
+    else:
+        order = np.lexsort((entries['key'], length, -entries['listings'], entries['price'].fillna(np.inf)))
+    return entries.iloc[order].reset_index(drop=True)
+
+
+def _shared_prefix_lengths(keys):
+    """Length of the common prefix of each sorted key with the one before it (len(keys) - 1 values)."""
+    width = keys.dtype.itemsize
+    shared = np.empty(max(len(keys) - 1, 0), dtype=np.int16)
+    for lo in range(0, len(shared), LCP_CHUNK):
+        block = keys[lo:lo + LCP_CHUNK + 1].view(np.uint8).reshape(-1, width)
+        same = block[1:] == block[:-1]
+        shared[lo:lo + len(same)] = np.where(same.all(axis=1), width, same.argmin(axis=1))
+    return shared
+
+
+def _smallest_per_range(values, starts, ends, k):
+    """(n_ranges, k) smallest distinct values of values[start:end] per range, ascending, -1 padded."""
+    counts = ends - starts
+    group = np.repeat(np.arange(len(starts)), counts)
+    positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    combined = np.unique(group.astype(np.int64) << 32 | values[positions])
+    group, value = combined >> 32, combined & 0xFFFFFFFF
+    first = np.searchsorted(group, np.arange(len(starts)))
+    column = np.arange(len(group)) - first[group]
+    keep = column < k
+    top = np.full((len(starts), k), -1, dtype=np.int32)
+    top[group[keep], column[keep]] = value[keep]
+    return top
+
+
+class AutocompleteIndex:
+    """Sorted token-suffix keys -> suggestion numbers, with precomputed top-k for long ranges."""
+
+    FILES = ('keys', 'key_entries', 'prefixes', 'prefix_top', 'ids', 'names', 'name_offsets', 'prices',
+             'listings')
+
+    def __init__(self, arrays, meta):
+        for name in self.FILES:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.k = meta['k']
+        self.key_bytes = meta['key_bytes']
+        self.scan_limit = meta['scan_limit']
+
+    @classmethod
+    def build(cls, ids, names, prices, rank='popularity', k=DEFAULT_K, key_bytes=MAX_KEY_BYTES,
+              scan_limit=SCAN_LIMIT):
+        entries = suggestions(ids, names, prices, rank)
+        suffixes, owners = [], []
+        for entry, key in enumerate(entries['key']):
+            start = 0
+            while start >= 0:
+                suffixes.append(key[start:start + key_bytes])
+                owners.append(entry)
+                start = key.find(' ', start)
+                start = start + 1 if start >= 0 else -1
+        keys = np.array(suffixes, dtype=f'S{key_bytes}')
+        # Stable, so equal keys keep their suggestions in rank order
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        key_entries = np.asarray(owners, dtype=np.int32)[order]
+
+        # A prefix of d bytes matches a run of keys whose shared prefix is at least d long
+        shared = _shared_prefix_lengths(keys)
+        lengths = np.char.str_len(keys)
+        prefixes, tops = [], []
+        for depth in range(1, key_bytes + 1):
+            starts = np.r_[0, np.flatnonzero(shared < depth) + 1]
+            ends = np.r_[starts[1:], len(keys)]
+            long_run = (ends - starts > scan_limit) & (lengths[starts] >= depth)
+            if not long_run.any():
+                break
+            starts, ends = starts[long_run], ends[long_run]
+            prefixes.append(keys[starts].astype(f'S{depth}').astype(f'S{key_bytes}'))
+            tops.append(_smallest_per_range(key_entries, starts, ends, k))
+        prefixes = np.concatenate(prefixes) if prefixes else np.zeros(0, dtype=f'S{key_bytes}')
+        tops = np.concatenate(tops) if tops else np.zeros((0, k), dtype=np.int32)
+        order = np.argsort(prefixes, kind='stable')
+
+        encoded = [name.encode('utf-8') for name in entries['name'].astype(str)]
+        ids = entries['id'].to_numpy()
+        if ids.dtype == object:
+            ids = ids.astype(str)
+        arrays = {
+            'keys': keys,
+            'key_entries': key_entries,
+            'prefixes': prefixes[order],
+            'prefix_top': tops[order],
+            'ids': ids,
+            'names': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'name_offsets': np.r_[0, np.cumsum([len(name) for name in encoded])].astype(np.int64),
+            'prices': entries['price'].to_numpy(dtype=float),
+            'listings': entries['listings'].to_numpy(dtype=np.int32),
+        }
+        meta = {'rank': rank, 'k': k, 'key_bytes': key_bytes, 'scan_limit': scan_limit,
+                'suggestions': len(entries), 'keys': len(keys), 'cached_prefixes': len(prefixes),
+                'built': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+        return cls(arrays, meta)
+
+    @classmethod
+    def from_catalog(cls, path=CATALOG_PATH, rank='popularity', k=DEFAULT_K, id_column='id',
+                     name_column='product_name', price_column='current_price'):
+        """Index the cleaned catalog (JSON lines from data_insepction.ipynb, or Parquet)."""
+        columns = [id_column, name_column, price_column]
+        if str(path).endswith('.parquet'):
+            df = pd.read_parquet(path, columns=columns)
+        else:
+            df = pd.read_json(path, lines=True)[columns]
+        df = df.dropna(subset=[name_column])
+        return cls.build(df[id_column], df[name_column], df[price_column], rank, k)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, path=INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls({name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cls.FILES}, meta)
+
+    def name(self, entry):
+        return bytes(self.names[self.name_offsets[entry]:self.name_offsets[entry + 1]]).decode('utf-8')
+
+    def top(self, text, k=None):
+        """Suggestion numbers (best first) of names with a token starting with the typed text."""
+        k = k or self.k
+        prefix = normalize_name(text)
+        if not prefix:
+            return []
+        # A trailing space means the last token is complete
+        if text[-1].isspace():
+            prefix += ' '
+        query = prefix.encode('ascii')
+        truncated = len(query) > self.key_bytes
+        query = query[:self.key_bytes]
+        lo = int(np.searchsorted(self.keys, query))
+        hi = int(np.searchsorted(self.keys, query + b'\x7f'))
+        if hi - lo > self.scan_limit and k <= self.k and not truncated:
+            i = int(np.searchsorted(self.prefixes, query))
+            if i < len(self.prefixes) and self.prefixes[i] == query:
+                top = self.prefix_top[i]
+                return [int(entry) for entry in top[:k] if entry >= 0]
+        entries = np.unique(self.key_entries[lo:hi])
+        if not truncated:
+            return entries[:k].tolist()
+        found = []
+        for entry in entries.tolist():
+            if (' ' + normalize_name(self.name(entry))).find(' ' + prefix) >= 0:
+                found.append(entry)
+                if len(found) == k:
+                    break
+        return found
+
+    def complete(self, text, k=None):
+        """Top-k suggestions for the typed text as dicts of id, name, price and listings."""
+        return [{'id': self.ids[entry].item(), 'name': self.name(entry),
+                 'price': None if np.isnan(self.prices[entry]) else float(self.prices[entry]),
+                 'listings': int(self.listings[entry])} for entry in self.top(text, k)]
+
+
+def synthetic_catalog(n_rows, seed=0):
+    """Catalog rows whose names repeat with Zipf-like popularity (the same product at several vendors)."""
+    rng = np.random.default_rng(seed)
+    distinct = synthetic_names(max(1, n_rows // 3), seed)
+    weights = 1.0 / np.arange(1, len(distinct) + 1) ** 0.8
+    picks = rng.choice(len(distinct), n_rows, p=weights / weights.sum())
+    names = [distinct[i] for i in picks]
+    prices = [f'${price:.2f}' for price in rng.lognormal(1.3, 0.6, n_rows)]
+    return np.arange(n_rows), names, prices
+
+
+def keystroke_sequences(index, n_sequences, seed=1):
+    """Texts as a user would type them: a token-start suffix of a popular suggestion's name."""
+    rng = random.Random(seed)
+    weights = 1.0 / np.arange(1, len(index) + 1)
+    targets = np.random.default_rng(seed).choice(len(index), n_sequences, p=weights / weights.sum())
+    sequences = []
+    for target in targets.tolist():
+        words = normalize_name(index.name(target)).split()
+        sequences.append((target, ' '.join(words[rng.randrange(len(words)):])))
+    return sequences
+
+
+def replay(index, sequences, k=DEFAULT_K):
+    """Type each sequence one keystroke at a time, stopping once its target is suggested.
+
+    sequences are (target suggestion or None, text); returns (per-keystroke
+    seconds, keystrokes to reach each found target, targets found).
+    """
+    latencies, keystrokes, found = [], [], 0
+    clock = time.perf_counter
+    for target, text in sequences:
+        for typed in range(1, len(text) + 1):
+            start = clock()
+            top = index.top(text[:typed], k)
+            latencies.append(clock() - start)
+            if target is not None and target in top:
+                keystrokes.append(typed)
+                found += 1
+                break
+    return np.array(latencies), np.array(keystrokes), found
+
+
+def naive_top(names, rank_of, text, k=DEFAULT_K):
+    """Lowercase substring filter of the whole catalog then a sort; what the component does on each keystroke."""
+    query = text.strip().lower()
+    matches = [i for i, name in enumerate(names) if query in name]
+    return sorted(matches, key=rank_of.__getitem__)[:k]
+
+
+def benchmark(n_rows, k=DEFAULT_K, replay_path=None, n_sequences=5_000):
+    ids, names, prices = synthetic_catalog(n_rows)
+    start = time.perf_counter()
+    index = AutocompleteIndex.build(ids, names, prices, k=k)
+    print(f"Indexed {n_rows:,} catalog rows: {len(index):,} suggestions, {index.meta['keys']:,} keys, "
+          f"{index.meta['cached_prefixes']:,} cached prefixes in {time.perf_counter() - start:.1f}s")
+
+    path = os.path.join('/tmp', f'autocomplete_benchmark_{os.getpid()}')
+    index.save(path)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    start = time.perf_counter()
+    index = AutocompleteIndex.load(path)
+    print(f"Snapshot of {size / 1e6:.0f} MB memory-mapped in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if replay_path:
+        with open(replay_path, encoding='utf-8') as f:
+            sequences = [(None, line.rstrip('\n')) for line in f if line.strip()]
+    else:
+        sequences = keystroke_sequences(index, n_sequences)
+    latencies, keystrokes, found = replay(index, sequences, k)
+    us = np.percentile(latencies * 1e6, [50, 95, 99])
+    print(f"Replayed {len(sequences):,} sequences, {len(latencies):,} keystrokes: "
+          f"p50 {us[0]:.1f} us, p95 {us[1]:.1f} us, p99 {us[2]:.1f} us, max {latencies.max() * 1e6:.0f} us")
+    if not replay_path:
+        print(f"Target in the top {k} for {found / len(sequences):.1%} of sequences, "
+              f"after {keystrokes.mean():.1f} keystrokes on average")
+
+    lowered = [name.lower() for name in index_names(index)]
+    rank_of = list(range(len(lowered)))
+    sample = [text[:typed] for _, text in sequences[:10] for typed in range(1, len(text) + 1)][:30]
+    start = time.perf_counter()
+    for text in sample:
+        naive_top(lowered, rank_of, text, k)
+    naive_sec = (time.perf_counter() - start) / len(sample)
+    print(f"Substring filter over the {len(lowered):,} names: {naive_sec * 1000:.1f} ms/keystroke "
+          f"({naive_sec / np.median(latencies):,.0f}x the median)")
+    same = all(index.top(text + ' ', k) == naive_top(lowered, rank_of, text + ' ', k)
+               for text in (normalize_name(index.name(t)) for t, _ in sequences[:5]) if ' ' not in text)
+    print(f"Whole-name queries agree with the substring filter: {same}")
+
+
+def index_names(index):
+    return [index.name(entry) for entry in range(len(index))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--index', default=INDEX_PATH, help='index directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='index the cleaned catalog')
+    build_parser.add_argument('--catalog', default=CATALOG_PATH)
+    build_parser.add_argument('--rank', choices=RANKINGS, default='popularity')
+    build_parser.add_argument('-k', type=int, default=DEFAULT_K, help='suggestions cached per prefix')
+    query_parser = commands.add_parser('query', help='suggestions for typed texts')
+    query_parser.add_argument('texts', nargs='+')
+    query_parser.add_argument('-k', type=int)
+    benchmark_parser = commands.add_parser('benchmark', help='replay keystrokes against a synthetic catalog')
+    benchmark_parser.add_argument('--rows', type=int, default=1_000_000)
+    benchmark_parser.add_argument('--replay', help='file of typed texts, one per line, replayed keystroke by keystroke')
+    benchmark_parser.add_argument('-k', type=int, default=DEFAULT_K)
+    args = parser.parse_args(argv)
+
+    if args.command == 'benchmark':
+        benchmark(args.rows, args.k, args.replay)
+        return
+    if args.command == 'build':
+        start = time.perf_counter()
+        index = AutocompleteIndex.from_catalog(args.catalog, args.rank, args.k)
+        index.save(args.index)
+        print(f"Indexed {len(index)} suggestions ({index.meta['keys']} keys, {index.meta['cached_prefixes']} "
+              f"cached prefixes) into {args.index} in {time.perf_counter() - start:.1f}s")
+        return
+    index = AutocompleteIndex.load(args.index)
+    for text in args.texts:
+        start = time.perf_counter()
+        result = index.complete(text, args.k)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(json.dumps({'query': text, 'suggestions': result, 'us': round(elapsed, 1)}, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Cheapest way to buy a household's shopping list across its stores.
+
+storeInventory is pivoted into one dense item x store price matrix (the sale
+price when an item is on sale, +inf when a store doesn't stock it or has it
+out of stock). Every household's unpurchased shoppingList entries are
+flattened into (household, item row, quantity) arrays.
+
+Each household only considers its candidate stores: its preferredStores when
+it has any, otherwise its MAX_CANDIDATE_STORES nearest stores (from
+geo_index.py, when households and stores have locations) or, failing that,
+the MAX_CANDIDATE_STORES stores that carry the most of its list. Households
+are grouped by their number of candidates m; within a group every household
+has the same local store sets (combinations of 1..k of its m candidates), so
+the cost of every set for every household is a gather, a min over the set's
+columns and one np.add.reduceat:
+
+- the cheapest single store that carries the whole list;
+- the cheapest split over at most k stores, each item bought where it is
+  cheapest within the set.
+
+Among store sets that cost the same to the cent, the one with the better
+(lower) priority numbers wins; nearest stores are ranked by distance. Items
+no candidate store carries are left out of the totals and counted in
+`unavailable`. Quantities are package counts.
+
+Usage:
+    MONGODB_URI=... MONGODB_DB_NAME=kitchenassist python basket_optimizer.py [--k 2]
+    python basket_optimizer.py --benchmark [--households 10000] [--stores 12]
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_K = 2
+# Flattened list entries x store sets evaluated per step (~64 MB of float64)
+CELLS_PER_CHUNK = 8_000_000
+# Priority of a store that has no preferredStores entry
+UNRANKED_PRIORITY = 1_000
+# Stores considered for a household without preferredStores
+MAX_CANDIDATE_STORES = 8
+
+
+class PriceMatrix:
+    """Dense item x store effective prices built from storeInventory documents."""
+
+    def __init__(self, item_ids, store_ids, prices):
+        self.item_ids = list(item_ids)
+        self.store_ids = list(store_ids)
+        self.prices = prices
+        self.item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.store_index = {store_id: j for j, store_id in enumerate(self.store_ids)}
+
+    @classmethod
+    def from_inventory(cls, docs, store_ids=None):
+        """Pivot storeInventory docs; the lowest price wins if a (store, item) repeats."""
+        inventory = pd.DataFrame(list(docs), columns=['storeId', 'itemId', 'price', 'onSale', 'salePrice', 'inStock'])
+        price = pd.to_numeric(inventory['price'], errors='coerce')
+        sale_price = pd.to_numeric(inventory['salePrice'], errors='coerce')
+        on_sale = inventory['onSale'].eq(True) & sale_price.notna()
+        effective = sale_price.where(on_sale, price)
+        # Missing inStock counts as in stock, as seed-db.js never writes False
+        usable = (effective.notna() & inventory['inStock'].ne(False)).to_numpy(copy=True)
+
+        item_codes, item_ids = pd.factorize(inventory['itemId'])
+        if store_ids is None:
+            store_codes, store_ids = pd.factorize(inventory['storeId'])
+        else:
+            store_codes = pd.Index(store_ids).get_indexer(inventory['storeId'])
+            usable &= store_codes >= 0
+        prices = np.full((len(item_ids), len(store_ids)), np.inf)
+        np.minimum.at(prices, (item_codes[usable], store_codes[usable]), effective.to_numpy(dtype=float)[usable])
+        return cls(item_ids, store_ids, prices)
+
+    @classmethod
+    def from_db(cls, db, item_ids=None):
+        """Matrix over every groceryStores store, limited to item_ids when given."""
+        query = {} if item_ids is None else {'itemId': {'$in': list(item_ids)}}
+        projection = {'_id': 0, 'storeId': 1, 'itemId': 1, 'price': 1, 'onSale': 1, 'salePrice': 1, 'inStock': 1}
+        store_ids = [store['_id'] for store in db.groceryStores.find({}, {'_id': 1}).sort('_id', 1)]
+        return cls.from_inventory(db.storeInventory.find(query, projection), store_ids)
+
+
+class ShoppingLists:
+    """Unpurchased shoppingList entries of many households, flattened against a PriceMatrix.
+
+    nearest maps str(household _id) to store ids, nearest first (see
+    nearest_candidates()); it is used for households without preferredStores.
+    """
+
+    def __init__(self, households, matrix, nearest=None, max_candidates=MAX_CANDIDATE_STORES):
+        self.household_ids = []
+        offsets, rows, quantities = [0], [], []
+        store_index = {str(store_id): j for j, store_id in enumerate(matrix.store_ids)}
+        candidates, priorities, unranked = [], [], []
+        for h, household in enumerate(households):
+            self.household_ids.append(household.get('_id'))
+            preferred = [s for s in household.get('preferredStores') or [] if s.get('storeId') in matrix.store_index]
+            if preferred:
+                stores = {matrix.store_index[s['storeId']]: s.get('priority', UNRANKED_PRIORITY) for s in preferred}
+            else:
+                near = (nearest or {}).get(str(household.get('_id'))) or []
+                columns = [store_index[str(s)] for s in near if str(s) in store_index][:max_candidates]
+                stores = {j: rank for rank, j in enumerate(columns, 1)}
+                if not stores:
+                    unranked.append(h)
+            candidates.append(sorted(stores))
+            priorities.append([stores[j] for j in sorted(stores)])
+            for entry in household.get('shoppingList') or []:
+                i = matrix.item_index.get(entry.get('itemId'))
+                if entry.get('purchased') or i is None:
+                    continue
+                rows.append(i)
+                quantities.append(entry.get('quantity') or 1)
+            offsets.append(len(rows))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.quantities = np.asarray(quantities, dtype=float)
+        for h, columns in zip(unranked, best_covering(matrix, self, unranked, max_candidates)):
+            candidates[h] = columns
+            priorities[h] = [UNRANKED_PRIORITY] * len(columns)
+        # Candidate store columns per household, ascending, padded with -1
+        self.n_candidates = np.array([len(c) for c in candidates], dtype=np.int64)
+        width = max(1, self.n_candidates.max(initial=0))
+        self.candidates = np.full((len(self), width), -1, dtype=np.int64)
+        self.priority = np.full((len(self), width), np.inf)
+        for h, (columns, priority) in enumerate(zip(candidates, priorities)):
+            self.candidates[h, :len(columns)] = columns
+            self.priority[h, :len(priority)] = priority
+
+    def __len__(self):
+        return len(self.household_ids)
+
+    @property
+    def households(self):
+        """Household index of each flattened entry."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+
+def _entries(offsets, households):
+    """Flattened entry positions of the given households, household by household."""
+    sizes = offsets[households + 1] - offsets[households]
+    return np.repeat(offsets[households] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+
+
+def best_covering(matrix, lists, households, n):
+    """Per household (list index), the columns of the n stores stocking most of its list, ascending."""
+    n_stores = len(matrix.store_ids)
+    households = np.asarray(households, dtype=np.int64)
+    if not len(households) or not n_stores:
+        return [[] for _ in households]
+    if n_stores <= n:
+        return [list(range(n_stores))] * len(households)
+    sizes = np.diff(lists.offsets)[households]
+    chunk = max(1, CELLS_PER_CHUNK // (n_stores * max(1, int(sizes.mean()))))
+    result = []
+    for lo in range(0, len(households), chunk):
+        group = households[lo:lo + chunk]
+        counts = np.zeros((len(group), n_stores), dtype=np.int64)
+        nonempty = sizes[lo:lo + chunk] > 0
+        if nonempty.any():
+            stocked = np.isfinite(matrix.prices[lists.rows[_entries(lists.offsets, group[nonempty])]])
+            starts = np.r_[0, np.cumsum(sizes[lo:lo + chunk][nonempty])[:-1]]
+            counts[nonempty] = np.add.reduceat(stocked.astype(np.int64), starts, axis=0)
+        # Most stocked first, lower column on ties
+        top = np.argsort(-counts, axis=1, kind='stable')[:, :n]
+        result.extend(np.sort(top, axis=1).tolist())
+    return result
+
+
+def store_sets(n_stores, k):
+    """(n_sets, k) store indices of every set of 1..k stores; smaller sets repeat their first store."""
+    sets = []
+    for size in range(1, min(k, n_stores) + 1):
+        for combo in itertools.combinations(range(n_stores), size):
+            sets.append(combo + (combo[0],) * (k - size))
+    return np.asarray(sets, dtype=np.int64).reshape(-1, k)
+
+
+def _best_sets(local_prices, quantity, offsets, priority, sets):
+    """Best single-store and split set (rows of sets) per household of one candidate-count group.
+
+    local_prices are the entries' prices at their household's candidates
+    (entries x m), offsets the households' entry offsets within them and
+    priority their candidates' priorities (households x m). Returns
+    {name: (cents, set row)} with cents +inf where no set carries the list.
+    """
+    n, k = len(offsets) - 1, sets.shape[1]
+    # Padding repeats a set's first store: count each store's priority once
+    distinct = np.ones(sets.shape, dtype=bool)
+    distinct[:, 1:] = sets[:, 1:] != sets[:, :1]
+    sizes = distinct.sum(axis=1)
+    nonempty = np.diff(offsets) > 0
+    starts = offsets[:-1][nonempty]
+    best = {name: (np.full(n, np.inf), np.full(n, np.inf), np.full(n, -1)) for name in ('single', 'split')}
+    chunk = max(1, CELLS_PER_CHUNK // (k * max(1, len(local_prices), n)))
+    for lo in range(0, len(sets), chunk):
+        chunk_sets = sets[lo:lo + chunk]
+        cheapest = local_prices[:, chunk_sets].min(axis=2)
+        with np.errstate(invalid='ignore'):
+            cost_per_entry = np.where(quantity[:, None] > 0, cheapest * quantity[:, None], 0.0)
+        totals = np.zeros((n, len(chunk_sets)))
+        if len(starts):
+            totals[nonempty] = np.add.reduceat(cost_per_entry, starts, axis=0)
+        # Compare to the cent, then by summed store priority
+        cents = np.round(totals * 100)
+        set_priority = np.where(distinct[lo:lo + chunk], priority[:, chunk_sets], 0.0).sum(axis=2)
+        for name, mask in (('single', sizes[lo:lo + chunk] == 1), ('split', None)):
+            if mask is not None and not mask.any():
+                continue
+            columns = np.flatnonzero(mask) if mask is not None else np.arange(len(chunk_sets))
+            c, p = cents[:, columns], set_priority[:, columns]
+            p = np.where(c == c.min(axis=1, keepdims=True), p, np.inf)
+            pick = np.argmin(p, axis=1)
+            rows = np.arange(n)
+            chunk_cents, chunk_priority = c[rows, pick], p[rows, pick]
+            best_cents, best_priority, best_set = best[name]
+            better = (chunk_cents < best_cents) | ((chunk_cents == best_cents) & (chunk_priority < best_priority))
+            best_cents[better] = chunk_cents[better]
+            best_priority[better] = chunk_priority[better]
+            best_set[better] = lo + columns[pick[better]]
+    return {name: (cents, chosen) for name, (cents, _, chosen) in best.items()}
+
+
+def optimize(matrix, lists, k=DEFAULT_K):
+    """Cheapest single store and cheapest <= k store split for every household.
+
+    Returns a DataFrame indexed like the households with best_store,
+    best_store_total, split_stores, split_total, savings and unavailable.
+    best_store is None when no candidate store carries the whole list, and
+    split_stores is empty when no set of k candidate stores does.
+    """
+    k = max(1, k)
+    household = lists.households
+    columns = lists.candidates[household]
+    entry_prices = np.where(columns >= 0, matrix.prices[lists.rows[:, None], np.maximum(columns, 0)], np.inf)
+    # Items no candidate store carries are dropped from the household's totals
+    carried = np.isfinite(entry_prices).any(axis=1)
+    quantity = np.where(carried, lists.quantities, 0.0)
+    unavailable = np.bincount(household[~carried], minlength=len(lists))
+    sizes = np.diff(lists.offsets)
+
+    single_cents, split_cents = np.full(len(lists), np.inf), np.full(len(lists), np.inf)
+    single_store = np.full(len(lists), -1)
+    split_stores = [()] * len(lists)
+    for m in np.unique(lists.n_candidates[lists.n_candidates > 0]):
+        group = np.flatnonzero(lists.n_candidates == m)
+        sets = store_sets(m, min(k, m))
+        entries = _entries(lists.offsets, group)
+        best = _best_sets(entry_prices[entries, :m], quantity[entries], np.r_[0, np.cumsum(sizes[group])],
+                          lists.priority[group, :m], sets)
+        cents, chosen = best['single']
+        single_cents[group] = cents
+        single_store[group] = np.where(np.isfinite(cents), lists.candidates[group, sets[np.maximum(chosen, 0), 0]], -1)
+        cents, chosen = best['split']
+        split_cents[group] = cents
+        for h, found, local in zip(group, np.isfinite(cents), sets[np.maximum(chosen, 0)]):
+            if found:
+                split_stores[h] = tuple(dict.fromkeys(lists.candidates[h, local].tolist()))
+
+    store_ids = np.asarray(matrix.store_ids, dtype=object)
+    single_found = np.isfinite(single_cents)
+    split_found = np.isfinite(split_cents)
+    result = pd.DataFrame({
+        'householdId': lists.household_ids,
+        'best_store': np.where(single_found, store_ids[np.maximum(single_store, 0)], None),
+        'best_store_total': np.where(single_found, single_cents / 100, np.nan),
+        'split_stores': [tuple(store_ids[list(stores)]) for stores in split_stores],
+        'split_total': np.where(split_found, split_cents / 100, np.nan),
+        'unavailable': unavailable,
+    })
+    result['savings'] = result['best_store_total'] - result['split_total']
+    return result
+
+
+def assign_items(matrix, household, stores):
+    """(itemId, storeId, price) for each unpurchased entry, bought at its cheapest store in `stores`."""
+    columns = [matrix.store_index[store] for store in stores]
+    assignment = []
+    for entry in household.get('shoppingList') or []:
+        i = matrix.item_index.get(entry.get('itemId'))
+        if entry.get('purchased') or i is None:
+            continue
+        prices = matrix.prices[i, columns]
+        j = int(np.argmin(prices))
+        if np.isfinite(prices[j]):
+            assignment.append((entry['itemId'], stores[j], float(prices[j])))
+    return assignment
+
+
+def nearest_candidates(db, households, n=MAX_CANDIDATE_STORES):
+    """str(household _id) -> its n nearest store ids, for located households without preferredStores."""
+    from geo_index import SphereIndex, coordinates, nearest_stores
+
+    household_ids, lonlat = coordinates(h for h in households if not h.get('preferredStores'))
+    located = ~np.isnan(lonlat).any(axis=1)
+    if not located.any():
+        return {}
+    index = SphereIndex.from_db(db)
+    nearest = nearest_stores(index, np.asarray(household_ids, dtype=object)[located], lonlat[located], n)
+    return nearest.groupby('householdId', sort=False)['storeId'].agg(list).to_dict()
+
+
+def optimize_households(db, k=DEFAULT_K, query=None, max_candidates=MAX_CANDIDATE_STORES):
+    """Run optimize() for every household matching `query` in one pass."""
+    households = list(db.households.find(
+        query or {}, {'shoppingList': 1, 'preferredStores': 1, 'location.coordinates': 1}))
+    item_ids = {entry.get('itemId') for household in households for entry in household.get('shoppingList') or []}
+    matrix = PriceMatrix.from_db(db, item_ids)
+    nearest = nearest_candidates(db, households, max_candidates)
+    return optimize(matrix, ShoppingLists(households, matrix, nearest, max_candidates), k)
+
+
+def naive_optimize(matrix, household, k=DEFAULT_K, nearest=None, max_candidates=MAX_CANDIDATE_STORES):
+    """Per-household Python loop over store sets; the baseline the benchmark compares against."""
+    allowed = [s['storeId'] for s in household.get('preferredStores') or [] if s['storeId'] in matrix.store_index]
+    needed = [(matrix.item_index[e['itemId']], e.get('quantity') or 1) for e in household.get('shoppingList') or []
+              if not e.get('purchased') and e.get('itemId') in matrix.item_index]
+    if not allowed and nearest:
+        allowed = [s for s in nearest if s in matrix.store_index][:max_candidates]
+    if not allowed:
+        stocked = {s: sum(np.isfinite(matrix.prices[i, j]) for i, _ in needed) for j, s in enumerate(matrix.store_ids)}
+        allowed = sorted(stocked, key=lambda s: -stocked[s])[:max_candidates]
+    best_single, best_split = np.inf, np.inf
+    for size in range(1, k + 1):
+        for stores in itertools.combinations(allowed, size):
+            columns = [matrix.store_index[s] for s in stores]
+            total = 0.0
+            for i, quantity in needed:
+                if not np.isfinite(matrix.prices[i, [matrix.store_index[s] for s in allowed]]).any():
+                    continue
+                total += min(matrix.prices[i, j] for j in columns) * quantity
+            if size == 1:
+                best_single = min(best_single, total)
+            best_split = min(best_split, total)
+    return best_single, best_split
+
+
+def synthetic_data(n_items, n_stores, n_households, list_size=30, seed=0):
+    """Random inventory (some items missing or on sale) and households with shopping lists."""
+    rng = np.random.default_rng(seed)
+    base = rng.lognormal(1.2, 0.6, n_items)
+    stores = [f'store{j}' for j in range(n_stores)]
+    items = [f'item{i}' for i in range(n_items)]
+    docs = []
+    for j, store in enumerate(stores):
+        stocked = np.flatnonzero(rng.random(n_items) < 0.9)
+        prices = np.round(base[stocked] * rng.uniform(0.8, 1.25, len(stocked)), 2)
+        on_sale = rng.random(len(stocked)) < 0.1
+        in_stock = rng.random(len(stocked)) < 0.98
+        for i, price, sale, stock in zip(stocked, prices, on_sale, in_stock):
+            doc = {'storeId': store, 'itemId': items[i], 'price': float(price), 'onSale': bool(sale),
+                   'inStock': bool(stock)}
+            if sale:
+                doc['salePrice'] = round(float(price) * 0.8, 2)
+            docs.append(doc)
+    picker = random.Random(seed)
+    households = []
+    for h in range(n_households):
+        preferred = picker.sample(stores, picker.randint(0, min(5, n_stores)))
+        households.append({
+            '_id': f'household{h}',
+            'preferredStores': [{'storeId': s, 'priority': p + 1} for p, s in enumerate(preferred)],
+            'shoppingList': [{'itemId': items[i], 'quantity': picker.randint(1, 3), 'purchased': picker.random() < 0.1}
+                             for i in picker.sample(range(n_items), list_size)],
+        })
+    return docs, households
+
+
+def benchmark(n_households, k=DEFAULT_K, n_items=20_000, n_stores=12):
+    docs, households = synthetic_data(n_items, n_stores, n_households)
+    start = time.perf_counter()
+    matrix = PriceMatrix.from_inventory(docs)
+    print(f"Price matrix {matrix.prices.shape} from {len(docs)} inventory docs in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    result = optimize(matrix, ShoppingLists(households, matrix), k)
+    elapsed = time.perf_counter() - start
+    print(f"{n_households} households, k={k}: {elapsed:.2f}s ({n_households / elapsed:,.0f} households/s); "
+          f"{result['best_store'].notna().mean():.0%} have a store carrying their whole list; "
+          f"splitting saves {result['savings'].mean():.2f} on average there")
+
+    sample = households[:200]
+    start = time.perf_counter()
+    naive = [naive_optimize(matrix, household, k) for household in sample]
+    naive_sec = time.perf_counter() - start
+    naive_single, naive_split = np.array(naive).T
+    # optimize() reports totals rounded to the cent
+    same = (np.allclose(np.nan_to_num(result['best_store_total'][:len(sample)], nan=np.inf), naive_single, atol=0.01)
+            and np.allclose(np.nan_to_num(result['split_total'][:len(sample)], nan=np.inf), naive_split, atol=0.01))
+    print(f"Python loop: {naive_sec / len(sample) * 1000:.1f} ms/household "
+          f"(~{naive_sec / len(sample) * n_households:,.0f}s for all); totals match: {same}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help='most stores to split a list across')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGODB_DB_NAME', 'kitchenassist'))
+    parser.add_argument('--benchmark', action='store_true', help='time against a Python loop on synthetic data')
+    parser.add_argument('--households', type=int, default=10_000)
+    parser.add_argument('--stores', type=int, default=12, help='stores in the benchmark inventory')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.households, args.k, n_stores=args.stores)
+        return
+    from pymongo import MongoClient
+    client = MongoClient(args.uri)
+    try:
+        db = client[args.db]
+        result = optimize_households(db, args.k)
+        names = {store['_id']: store['name'] for store in db.groceryStores.find({}, {'name': 1})}
+    finally:
+        client.close()
+    result['best_store'] = result['best_store'].map(names)
+    result['split_stores'] = result['split_stores'].map(lambda stores: ', '.join(names.get(s, str(s)) for s in stores))
+    print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
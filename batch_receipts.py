@@ -0,0 +1,321 @@
+"""Run the receipt vision pipeline over many receipt images.
+
+Input is a directory of images, a glob, or a JSONL manifest (one image path or
+URL per line, either as a JSON string or an object with "image" and optional
+"id"). Receipts are submitted concurrently with an in-flight limit, and each
+run writes run_response.json and combined.json under <out>/<receipt id>/.
+
+Every attempt is appended to <out>/status.jsonl. A failed receipt is recorded
+and the batch continues; re-running the same command skips receipts that
+already have a combined.json, so failures are retried and finished receipts
+are not billed again.
+
+Unless --no-preprocess is given (or Pillow is missing), images are fetched and
+downscaled in a thread pool while earlier receipts are in flight, sent inline
+as JPEG, and receipts whose bytes match one already submitted (in this batch
+or a previous done run) are skipped, as are re-photographs of one (recorded
+with "similar_to" instead of "duplicate_of"); see receipt_images.py. The
+summary reports the bytes saved and the duplicate hit rate.
+
+Usage:
+    python batch_receipts.py receipts/ --out receipt_runs --concurrency 16
+"""
+import argparse
+import asyncio
+import base64
+import glob
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import instrumentation
+import receipt_images
+from instrumentation import span
+from log_extraction import build_combined, extract_created_jsons
+from pipeline_client import PipelineClient, PipelineError
+from receipt_images import FingerprintIndex, PrepStats, decode_fingerprint, encode_fingerprint, prepare_image
+from result_cache import DEFAULT_CACHE_PATH, ResultCache
+
+BASE_URL = os.getenv("BASE_URL")
+USER_ID = os.getenv("USER_ID")
+SAVED_ITEM_ID = os.getenv("SAVED_ITEM_ID")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".heic", ".gif", ".bmp", ".tif", ".tiff"}
+DEFAULT_OUT_DIR = "receipt_runs"
+DEFAULT_CONCURRENCY = 16
+
+
+def _receipt_id(source):
+    """Stable directory name: the file stem plus a short hash of the full source."""
+    stem = Path(source.split("?")[0]).stem or "receipt"
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:8]
+    safe_stem = re.sub(r'[^\w\-.]', '_', stem)
+    return f"{safe_stem}_{digest}"
+
+
+def load_receipts(spec):
+    """List of (receipt_id, source) from a directory, glob or JSONL manifest."""
+    path = Path(spec)
+    if path.is_dir():
+        sources = sorted(str(p) for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return [(_receipt_id(s), s) for s in sources]
+    if path.is_file() and path.suffix.lower() in (".jsonl", ".ndjson"):
+        receipts = []
+        with open(path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if isinstance(entry, str):
+                    entry = {"image": entry}
+                source = isinstance(entry, dict) and (entry.get("image") or entry.get("receipt_image")
+                                                      or entry.get("url") or entry.get("path"))
+                if not isinstance(source, str):
+                    print(f"{path}:{lineno}: no image, url or path; skipped")
+                    continue
+                receipts.append((entry.get("id") or _receipt_id(source), source))
+        return receipts
+    return [(_receipt_id(s), s) for s in sorted(glob.glob(spec))]
+
+
+def receipt_payload(source):
+    """start_pipeline payload: remote images by URL, local files inline as a base64 data URI."""
+    if source.startswith(("http://", "https://", "data:")):
+        return {"receipt_image": source}
+    mime = mimetypes.guess_type(source)[0] or "image/jpeg"
+    with open(source, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("ascii")
+    return {"receipt_image": f"data:{mime};base64,{encoded}"}
+
+
+def write_receipt_outputs(receipt_dir, run_response):
+    receipt_dir.mkdir(parents=True, exist_ok=True)
+    with span("write_run_response"):
+        with open(receipt_dir / "run_response.json", "w", encoding="utf-8") as f:
+            json.dump(run_response, f, indent=2, ensure_ascii=False)
+    with span("extract_created_jsons"):
+        combined = build_combined(extract_created_jsons(run_response))
+    # Write combined.json last: its presence marks the receipt as done
+    with span("write_combined", rows=len(combined["items"])):
+        tmp_path = receipt_dir / "combined.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(combined, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, receipt_dir / "combined.json")
+    return combined
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class ReceiptPreparer:
+    """Prepares images in a thread pool and checks each against the receipts already kept."""
+
+    def __init__(self, index, workers=receipt_images.DEFAULT_WORKERS, max_side=receipt_images.MAX_SIDE):
+        self.index = index
+        self.max_side = max_side
+        self.stats = PrepStats()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    async def prepare(self, receipt_id, source):
+        """(prepared image, id of the receipt with the same bytes or None, id of the receipt this is a
+        re-photo of or None).
+
+        Images are checked as they finish, so of two copies in one batch the
+        first one prepared is submitted.
+        """
+        loop = asyncio.get_running_loop()
+        with span("prepare_image"):
+            prepared = await loop.run_in_executor(self._pool, prepare_image, source, self.max_side)
+        duplicate_of = self.index.find(prepared.digest)
+        similar_to = None
+        if duplicate_of is None:
+            similar_to = self.index.similar(prepared.fingerprint)
+            if similar_to is None:
+                self.index.add(prepared.digest, prepared.fingerprint, receipt_id)
+        self.stats.record(prepared, duplicate_of is not None, similar_to is not None)
+        return prepared, duplicate_of, similar_to
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def load_fingerprints(status_path, out_dir, index):
+    """Add the digests and fingerprints of receipts finished by earlier runs to index."""
+    if not status_path.exists():
+        return
+    with open(status_path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # e.g. the last line of a run that was killed mid-write
+                print(f"{status_path}:{lineno}: unreadable status record; skipped")
+                continue
+            if not isinstance(record, dict) or "id" not in record:
+                continue
+            if (record.get("status") == "done" and (record.get("digest") or record.get("fingerprint"))
+                    and (out_dir / record["id"] / "combined.json").exists()):
+                fingerprint = record.get("fingerprint")
+                index.add(record.get("digest"), fingerprint and decode_fingerprint(fingerprint), record["id"])
+
+
+async def process_receipt(client, receipt_id, source, out_dir, status_file, slots, running, preparer=None):
+    """Prepare and run one receipt; its record's "wait" is the time before its run started, "latency" the run."""
+    queued = time.monotonic()
+    record = {"id": receipt_id, "source": source}
+    # Bounds the prepared payloads held in memory to those in flight plus the next batch
+    async with slots:
+        await _process_receipt(client, receipt_id, source, out_dir, record, running, preparer, queued)
+    record.setdefault("wait", round(time.monotonic() - queued, 3))
+    record.setdefault("latency", 0.0)
+    status_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    status_file.flush()
+    return record
+
+
+async def _process_receipt(client, receipt_id, source, out_dir, record, running, preparer, queued):
+    try:
+        if preparer is None:
+            payload = receipt_payload(source)
+        else:
+            prepared, duplicate_of, similar_to = await preparer.prepare(receipt_id, source)
+            if duplicate_of is not None:
+                record.update(status="duplicate", duplicate_of=duplicate_of)
+                return
+            if similar_to is not None:
+                record.update(status="duplicate", similar_to=similar_to)
+                return
+            payload = prepared.payload()
+            record["digest"] = prepared.digest
+            if prepared.fingerprint is not None:
+                record["fingerprint"] = encode_fingerprint(prepared.fingerprint)
+        # As many runs as the client allows, so the clock starts when the run does
+        async with running:
+            started = time.monotonic()
+            record["wait"] = round(started - queued, 3)
+            try:
+                run_response = await client.run(SAVED_ITEM_ID, payload)
+                combined = write_receipt_outputs(out_dir / receipt_id, run_response)
+            finally:
+                record["latency"] = round(time.monotonic() - started, 3)
+        record.update(status="done", items=len(combined["items"]))
+    except Exception as e:
+        # Record and keep going; the receipt is retried on the next run
+        record.update(status="failed", error=f"{type(e).__name__}: {e}")
+        if isinstance(e, PipelineError) and e.response is not None:
+            record["response"] = e.response
+
+
+async def run_batch(receipts, out_dir, concurrency, headers, cache=None, preprocess=True,
+                    max_side=receipt_images.MAX_SIDE, max_distance=receipt_images.MAX_DISTANCE):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pending = [(rid, src) for rid, src in receipts if not (out_dir / rid / "combined.json").exists()]
+    print(f"{len(receipts)} receipts, {len(receipts) - len(pending)} already done, {len(pending)} to run")
+
+    preparer = None
+    if preprocess:
+        index = FingerprintIndex(max_distance)
+        load_fingerprints(out_dir / "status.jsonl", out_dir, index)
+        preparer = ReceiptPreparer(index, max_side=max_side)
+    slots = asyncio.Semaphore(2 * concurrency)
+    running = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    records = []
+    with open(out_dir / "status.jsonl", "a", encoding="utf-8") as status_file:
+        if status_file.tell() and not _ends_with_newline(out_dir / "status.jsonl"):
+            # Don't glue the first record of this run onto a truncated last line
+            status_file.write("\n")
+        async with PipelineClient(BASE_URL, USER_ID, headers=headers, max_concurrency=concurrency,
+                                  cache=cache) as client:
+            tasks = [asyncio.ensure_future(process_receipt(client, rid, src, out_dir, status_file, slots, running,
+                                                           preparer))
+                     for rid, src in pending]
+            for task in asyncio.as_completed(tasks):
+                record = await task
+                records.append(record)
+                print(f"[{len(records)}/{len(pending)}] {record['id']}: {record['status']} ({record['latency']}s)")
+    elapsed = time.monotonic() - started
+    if preparer is None:
+        return records, elapsed, None
+    preparer.close()
+    return records, elapsed, preparer.stats
+
+
+def print_summary(records, elapsed, prep_stats=None):
+    done = [r for r in records if r["status"] == "done"]
+    failed = [r for r in records if r["status"] == "failed"]
+    duplicates = [r for r in records if r["status"] == "duplicate"]
+    latencies = [r["latency"] for r in done]
+    waits = [r["wait"] for r in done]
+    per_minute = len(done) / elapsed * 60 if elapsed > 0 else 0.0
+    print("\n--- Batch summary ---")
+    print(f"Done: {len(done)}  Failed: {len(failed)}  Duplicates: {len(duplicates)}  Wall time: {elapsed:.1f}s")
+    print(f"Throughput: {per_minute:.1f} receipts/min")
+    print(f"Latency p50: {_percentile(latencies, 0.5):.1f}s  p95: {_percentile(latencies, 0.95):.1f}s  "
+          f"(queued before starting p50: {_percentile(waits, 0.5):.1f}s  p95: {_percentile(waits, 0.95):.1f}s)")
+    if prep_stats is not None and prep_stats.images:
+        print(prep_stats.report())
+    for record in duplicates:
+        if record.get("similar_to"):
+            print(f"  RE-PHOTO {record['id']} of {record['similar_to']}")
+        else:
+            print(f"  DUPLICATE {record['id']} of {record['duplicate_of']}")
+    for record in failed:
+        print(f"  FAILED {record['id']}: {record['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="directory, glob, or .jsonl manifest of receipt images")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="output root (one directory per receipt)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="max receipts in flight")
+    parser.add_argument("--no-cache", action="store_true", help=f"don't use {DEFAULT_CACHE_PATH}")
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="send images as they are, without downscaling or duplicate checks")
+    parser.add_argument("--max-side", type=int, default=receipt_images.MAX_SIDE,
+                        help="longest side in px after downscaling")
+    parser.add_argument("--max-distance", type=float, default=receipt_images.MAX_DISTANCE,
+                        help="fraction of text lines that may differ for a receipt to be skipped as a re-photo; "
+                             "-1 only skips exact copies")
+    parser.add_argument("--metrics", help="write stage metrics here at exit (.prom/.txt for Prometheus text, else JSON)")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        instrumentation.enable(args.metrics)
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": os.getenv("API_KEY")
+    }
+    receipts = load_receipts(args.input)
+    preprocess = not args.no_preprocess
+    if preprocess and not receipt_images.available():
+        print("Pillow is not installed; sending images without preprocessing")
+        preprocess = False
+    cache = None if args.no_cache else ResultCache(DEFAULT_CACHE_PATH)
+    try:
+        records, elapsed, prep_stats = asyncio.run(run_batch(
+            receipts, Path(args.out), args.concurrency, headers, cache, preprocess, args.max_side, args.max_distance))
+    finally:
+        if cache is not None:
+            cache.close()
+    print_summary(records, elapsed, prep_stats)
+
+
+if __name__ == "__main__":
+    main()
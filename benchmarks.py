@@ -0,0 +1,378 @@
+"""Reproducible benchmark suite for the hammer feed reduction and run-log extraction.
+
+Inputs are synthetic and seeded, so two runs at the same scale read the same
+bytes:
+
+- hammer-4-product.csv / hammer-4-raw.csv in the hammer column layout, with
+  nowtime increasing down the file (the feed is append-only) and product ids
+  drawn from a Zipf-like distribution, so a few products dominate the feed as
+  in the real data;
+- run_response.json with a log of the requested number of entries (see
+  log_extraction.synthetic_run_response).
+
+Inputs are generated once per scale under --data-dir and reused. Each stage
+runs in a fresh spawned process, so its peak RSS is measured from a clean
+interpreter; worker processes a stage starts are reported separately. Results go to a
+JSON file with machine and git details; --compare prints the change against
+an earlier results file.
+
+Usage:
+    python benchmarks.py --scale 1m [--workers 4] [--repeat 3] [--output bench_results.json]
+    python benchmarks.py --scale 10m --stages stream_latest_raw parallel_latest_raw --compare old.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import hammer_feed
+import load_grocery_data_in_chunks as grocery
+from log_extraction import build_combined, extract_created_jsons, extract_recipe_from_logs, synthetic_run_response
+
+DATA_DIR = 'bench_data'
+RESULTS_PATH = 'bench_results.json'
+# Raw feed rows per scale; products and log entries are derived from it
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+    '100m': 100_000_000,
+}
+ROWS_PER_PRODUCT = 20
+# Log entries per raw row, capped: run logs are far smaller than the feed
+LOG_ENTRIES_PER_ROW = 0.2
+MAX_LOG_ENTRIES = 2_000_000
+# Zipf exponent of product popularity in the raw feed
+PRODUCT_SKEW = 1.1
+FEED_DAYS = 90
+GENERATE_CHUNK_ROWS = 1_000_000
+LOG_CHUNK_ENTRIES = 100_000
+SEED = 20240218
+
+VENDORS = ['Voila', 'Walmart', 'Loblaws', 'Metro', 'NoFrills', 'SaveOnFoods', 'TandT', 'Galleria']
+WORDS = ['organic', 'whole', 'milk', 'chicken', 'breast', 'cheddar', 'cheese', 'bread', 'wheat', 'greek',
+         'yogurt', 'vanilla', 'butter', 'eggs', 'rice', 'pasta', 'tomato', 'sauce', 'beef', 'peas', 'juice',
+         'coffee', 'apple', 'banana', 'spinach', 'salmon', 'tofu', 'oats', 'honey', 'almond']
+UNITS = ['500g', '1kg', '250 g', '1.36kg', '6 x 355 ml', '2L', '1 lb', 'each', '4 per pack', '$32.90/1kg', '']
+
+
+def write_product_csv(path, n_products, seed=SEED):
+    """Synthetic hammer-4-product.csv with ids 0..n_products - 1."""
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS, dtype=object)
+    with open(path, 'w', newline='') as f:
+        for lo in range(0, n_products, GENERATE_CHUNK_ROWS):
+            ids = np.arange(lo, min(n_products, lo + GENERATE_CHUNK_ROWS))
+            n = len(ids)
+            brand = pd.Series(rng.integers(0, max(1, n_products // 50), n)).map('Brand{}'.format)
+            name = (brand + ' ' + words[rng.integers(0, len(words), n)] + ' '
+                    + words[rng.integers(0, len(words), n)] + ' ' + pd.Series(ids).astype(str))
+            vendor = np.array(VENDORS, dtype=object)[rng.integers(0, len(VENDORS), n)]
+            upc = pd.Series(rng.integers(10 ** 11, 10 ** 12, n), dtype='Int64').where(rng.random(n) < 0.6)
+            frame = pd.DataFrame({
+                'id': ids,
+                'concatted': vendor + ' ' + name,
+                'vendor': vendor,
+                'product_name': name,
+                'units': np.array(UNITS, dtype=object)[rng.integers(0, len(UNITS), n)],
+                'brand': brand.where(rng.random(n) < 0.8),
+                'detail_url': 'https://example.com/p/' + pd.Series(ids).astype(str),
+                'sku': pd.Series(ids).map('s{}'.format).where(rng.random(n) < 0.7),
+                'upc': upc,
+            })
+            frame.to_csv(f, index=False, header=lo == 0)
+
+
+def write_raw_csv(path, n_rows, n_products, skew=PRODUCT_SKEW, seed=SEED):
+    """Synthetic hammer-4-raw.csv: n_rows observations, nowtime ascending, skewed product ids."""
+    rng = np.random.default_rng(seed + 1)
+    # Zipf-like popularity over a random permutation, so popular ids are spread out
+    weights = 1.0 / np.arange(1, n_products + 1) ** skew
+    cdf = np.cumsum(weights) / weights.sum()
+    product_by_rank = rng.permutation(n_products)
+    base_price = np.round(rng.lognormal(1.3, 0.7, n_products), 2)
+    start = np.datetime64('2024-02-18T00:00:00', 's')
+    step = FEED_DAYS * 24 * 3600 / max(1, n_rows)
+    with open(path, 'w', newline='') as f:
+        for lo in range(0, n_rows, GENERATE_CHUNK_ROWS):
+            n = min(GENERATE_CHUNK_ROWS, n_rows - lo)
+            product = product_by_rank[np.minimum(np.searchsorted(cdf, rng.random(n)), n_products - 1)]
+            price = np.round(base_price[product] * rng.uniform(0.8, 1.2, n), 2)
+            on_sale = rng.random(n) < 0.1
+            seconds = (np.arange(lo, lo + n) * step).astype(np.int64)
+            frame = pd.DataFrame({
+                'nowtime': pd.to_datetime(start + seconds),
+                'current_price': price,
+                'old_price': np.where(on_sale, np.round(price * 1.25, 2), np.nan),
+                'price_per_unit': np.where(rng.random(n) < 0.2, '$2/1L', None),
+                'other': np.where(on_sale, 'SALE', None),
+                'product_id': product,
+            })
+            frame.to_csv(f, index=False, header=lo == 0, date_format='%Y-%m-%d %H:%M:%S')
+
+
+def write_run_response(path, n_entries, seed=SEED):
+    """Synthetic run_response.json, written LOG_CHUNK_ENTRIES log entries at a time."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"state": "DONE", "outputs": {}, "log": [')
+        for i, lo in enumerate(range(0, n_entries, LOG_CHUNK_ENTRIES)):
+            log = synthetic_run_response(min(LOG_CHUNK_ENTRIES, n_entries - lo), seed=seed + i)['log']
+            f.write((', ' if lo else '') + ', '.join(json.dumps(entry) for entry in log))
+        f.write(']}')
+
+
+def ensure_inputs(data_dir, n_rows):
+    """Paths of the inputs for n_rows, generating any that are missing."""
+    scale_dir = os.path.join(data_dir, str(n_rows))
+    os.makedirs(scale_dir, exist_ok=True)
+    n_products = max(1, n_rows // ROWS_PER_PRODUCT)
+    n_entries = min(MAX_LOG_ENTRIES, max(1000, int(n_rows * LOG_ENTRIES_PER_ROW)))
+    inputs = {
+        'product_path': os.path.join(scale_dir, 'hammer-4-product.csv'),
+        'raw_path': os.path.join(scale_dir, 'hammer-4-raw.csv'),
+        'run_response_path': os.path.join(scale_dir, 'run_response.json'),
+    }
+    generators = [
+        (inputs['product_path'], write_product_csv, (n_products,)),
+        (inputs['raw_path'], write_raw_csv, (n_rows, n_products)),
+        (inputs['run_response_path'], write_run_response, (n_entries,)),
+    ]
+    for path, write, args in generators:
+        if os.path.exists(path):
+            continue
+        started = time.perf_counter()
+        # Generate beside the target so an interrupted run never leaves a partial input
+        write(path + '.tmp', *args)
+        os.replace(path + '.tmp', path)
+        print(f"Generated {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    inputs['products'] = n_products
+    inputs['log_entries'] = n_entries
+    return inputs
+
+
+def read_feeds(inputs, typed, engine='c'):
+    """Read the product CSV whole and stream the raw feed in CHUNKSIZE chunks, keeping nothing.
+
+    Untyped is the reading the loader did before hammer_feed: inferred dtypes
+    and pd.to_datetime without a format.
+    """
+    if typed:
+        product_df = hammer_feed.read_product_csv(inputs['product_path'], engine=engine)
+        chunks = hammer_feed.iter_raw_csv(inputs['raw_path'], grocery.CHUNKSIZE, grocery.RAW_COLUMNS, engine)
+    else:
+        product_df = pd.read_csv(inputs['product_path'])
+        chunks = pd.read_csv(inputs['raw_path'], usecols=grocery.RAW_COLUMNS, chunksize=grocery.CHUNKSIZE)
+    n_rows = len(product_df)
+    for chunk in chunks:
+        if not typed:
+            chunk['nowtime'] = pd.to_datetime(chunk['nowtime'])
+        n_rows += len(chunk)
+    return n_rows
+
+
+def stage_read_feeds_untyped(inputs, workers, scratch):
+    return read_feeds(inputs, typed=False)
+
+
+def stage_read_feeds_typed(inputs, workers, scratch):
+    return read_feeds(inputs, typed=True)
+
+
+def stage_read_feeds_pyarrow(inputs, workers, scratch):
+    return read_feeds(inputs, typed=True, engine='pyarrow')
+
+
+def stage_stream_latest_raw(inputs, workers, scratch):
+    return len(grocery.stream_latest_raw(inputs['raw_path'], grocery.CHUNKSIZE))
+
+
+def stage_parallel_latest_raw(inputs, workers, scratch):
+    return len(grocery.parallel_latest_raw(inputs['raw_path'], workers))
+
+
+def stage_build_parquet(inputs, workers, scratch):
+    """The default pipeline end to end: product CSV + reduced feed -> join -> Parquet."""
+    product_df = hammer_feed.read_product_csv(inputs['product_path'])
+    latest_raw = grocery.parallel_latest_raw(inputs['raw_path'], workers)
+    final_df = grocery.build_final(product_df, latest_raw)
+    grocery.write_parquet(final_df, os.path.join(scratch, 'latest_grocery_data.parquet'))
+    return len(final_df)
+
+
+def stage_write_json(inputs, workers, scratch):
+    """Legacy JSON export of the joined catalog (the join itself is not timed separately)."""
+    product_df = hammer_feed.read_product_csv(inputs['product_path'])
+    final_df = grocery.build_final(product_df, grocery.parallel_latest_raw(inputs['raw_path'], workers))
+    grocery.write_json(final_df, os.path.join(scratch, 'latest_grocery_data.json'))
+    return len(final_df)
+
+
+def stage_extract_recipe(inputs, workers, scratch):
+    return len(extract_recipe_from_logs(inputs['run_response_path']))
+
+
+def stage_extract_item_jsons(inputs, workers, scratch):
+    """The extract_item_jsons.py parse: created JSONs from the log, then the combined object."""
+    return len(build_combined(extract_created_jsons(inputs['run_response_path']))['items'])
+
+
+# Stage name -> (function, input that sizes it)
+STAGES = {
+    'read_feeds_untyped': (stage_read_feeds_untyped, 'raw_rows'),
+    'read_feeds_typed': (stage_read_feeds_typed, 'raw_rows'),
+    'read_feeds_pyarrow': (stage_read_feeds_pyarrow, 'raw_rows'),
+    'stream_latest_raw': (stage_stream_latest_raw, 'raw_rows'),
+    'parallel_latest_raw': (stage_parallel_latest_raw, 'raw_rows'),
+    'build_parquet': (stage_build_parquet, 'raw_rows'),
+    'write_json': (stage_write_json, 'raw_rows'),
+    'extract_recipe': (stage_extract_recipe, 'log_entries'),
+    'extract_item_jsons': (stage_extract_item_jsons, 'log_entries'),
+}
+
+
+def _reset_peak_rss():
+    """Restart this process's peak RSS at its current RSS (Linux); ru_maxrss survives fork and exec."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process and of its reaped children, in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    try:
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own / 1e6, children / 1e6
+
+
+def _run_stage(name, inputs, workers, scratch, start_method):
+    """Child process body: run one stage with its progress prints silenced."""
+    # A spawned child inherits "spawn"; stages that start worker pools should get the usual default
+    multiprocessing.set_start_method(start_method, force=True)
+    _reset_peak_rss()
+    baseline_mb, _ = _peak_rss_mb()
+    function, _ = STAGES[name]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        output_rows = function(inputs, workers, scratch)
+        elapsed = time.perf_counter() - started
+    peak_mb, children_peak_mb = _peak_rss_mb()
+    return {
+        'seconds': elapsed,
+        'peak_rss_mb': peak_mb,
+        'baseline_rss_mb': baseline_mb,
+        'worker_peak_rss_mb': children_peak_mb,
+        'output_rows': output_rows,
+    }
+
+
+def run_stage(name, inputs, workers, scratch):
+    """Run a stage in a fresh spawned interpreter so memory and imports don't leak between stages."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_stage, name, inputs, workers, scratch, multiprocessing.get_start_method()).result()
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'git_commit': commit,
+    }
+
+
+def run_suite(scale, stages, workers, repeat, data_dir=DATA_DIR):
+    """Time every stage `repeat` times at a scale; the fastest run is reported."""
+    n_rows = SCALES[scale] if scale in SCALES else int(scale)
+    inputs = ensure_inputs(data_dir, n_rows)
+    sizes = {'raw_rows': n_rows, 'log_entries': inputs['log_entries']}
+    scratch = os.path.join(data_dir, str(n_rows), 'out')
+    os.makedirs(scratch, exist_ok=True)
+    results = {}
+    for name in stages:
+        runs = [run_stage(name, inputs, workers, scratch) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run['seconds'])
+        size = sizes[STAGES[name][1]]
+        results[name] = {
+            **best,
+            'runs_seconds': [run['seconds'] for run in runs],
+            'input_rows': size,
+            'rows_per_sec': size / best['seconds'] if best['seconds'] else None,
+        }
+        print(f"{name:22s} {best['seconds']:9.3f}s  {results[name]['rows_per_sec'] or 0:14,.0f} rows/s  "
+              f"peak {best['peak_rss_mb']:8.1f} MB (workers {best['worker_peak_rss_mb']:.1f} MB)")
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'machine': machine_info(),
+        'params': {'scale': scale, 'raw_rows': n_rows, 'products': inputs['products'],
+                   'log_entries': inputs['log_entries'], 'workers': workers, 'repeat': repeat, 'seed': SEED},
+        'stages': results,
+    }
+
+
+def compare(old, new):
+    """Print per-stage time and peak memory changes between two results dicts."""
+    if old['params'] != new['params']:
+        print(f"Note: parameters differ ({old['params']} vs {new['params']})")
+    if old['machine'].get('hostname') != new['machine'].get('hostname'):
+        print("Note: results come from different machines")
+    for name, stage in new['stages'].items():
+        before = old['stages'].get(name)
+        if before is None:
+            continue
+        time_change = (stage['seconds'] / before['seconds'] - 1) * 100 if before['seconds'] else 0.0
+        memory_change = stage['peak_rss_mb'] - before['peak_rss_mb']
+        print(f"{name:22s} {before['seconds']:9.3f}s -> {stage['seconds']:9.3f}s ({time_change:+6.1f}%)  "
+              f"peak {memory_change:+8.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1m', help=f"raw feed rows: one of {', '.join(SCALES)} or a number")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage; the fastest is reported')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='where generated inputs are cached')
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.scale, args.stages, args.workers, args.repeat, args.data_dir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""In-memory catalog index for resolving free-text item names to catalog ids.
+
+Receipt items (item_json/combined.json) and recipe ingredients
+(extract_recipe_from_logs) carry free-text names that still need resolving to
+real items. CatalogIndex keeps character-trigram and token postings over the
+catalog names with IDF weights, and scores candidates by cosine similarity of
+their IDF-weighted feature sets:
+
+- candidates come from the postings of the query's rarest features, up to a
+  posting budget, so common trigrams (" ch", "ese") rarely scan the catalog;
+- candidates are scored exactly from a row-major copy of the features, and
+  more postings are gathered only when a row outside them could still beat
+  the top k, jumping straight to the features such a row would need.
+
+Matches are exact by default. match(..., exact=False) caps the postings
+gathered at MAX_BUDGET instead, trading a best-effort top k for a bounded
+cost on queries made only of common features.
+
+New catalog rows can be add()ed at any time. They are scored from a small
+delta until it grows past REBUILD_FRACTION of the index, which triggers a
+rebuild of the postings.
+
+Usage:
+    python catalog_matcher.py --catalog latest_grocery_data.parquet "2% milk 4l" "chkn breast"
+    python catalog_matcher.py --benchmark [--rows 1000000]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import time
+import unicodedata
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Letters NFKD leaves whole
+LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae', 'ß': 'ss', 'ø': 'o', 'ł': 'l', 'đ': 'd'})
+TOKEN_PREFIX = 'w:'
+# Whole-token matches count more than the trigrams they are made of
+TOKEN_BOOST = 2.0
+# Postings first gathered from the rarest query features to form the candidate set
+CANDIDATE_BUDGET = 2048
+# Postings gathered at most with exact=False; past it the top k is best-effort
+MAX_BUDGET = 8192
+# Candidates scored exactly per step, in order of their upper bound
+RESCORE_CHUNK = 256
+# Unindexed rows (as a fraction of indexed ones) that trigger a rebuild
+REBUILD_FRACTION = 0.02
+MIN_REBUILD_ROWS = 1000
+DEFAULT_K = 5
+
+
+def normalize_name(name):
+    """Lowercased alphanumeric tokens joined by single spaces, accents stripped ("Crème" -> "creme")."""
+    text = str(name).lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text.translate(LIGATURES))
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(TOKEN_RE.findall(text))
+
+
+def name_features(name):
+    """Distinct token and padded character-trigram features of a name."""
+    normalized = normalize_name(name)
+    if not normalized:
+        return set()
+    padded = f' {normalized} '
+    features = {padded[i:i + 3] for i in range(len(padded) - 2)}
+    features.update(TOKEN_PREFIX + token for token in normalized.split())
+    return features
+
+
+class CatalogIndex:
+    """Trigram/token inverted index over catalog names with top-k cosine matching."""
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self._vocab = {}
+        self._feature_boost = []
+        self._doc_features = []
+        self._indexed = 0
+        # CSR postings over the first self._indexed rows: feature -> sorted row numbers
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int32)
+        # and the same rows row-major: row -> feature ids
+        self._row_indptr = np.zeros(1, dtype=np.int64)
+        self._row_features = np.zeros(0, dtype=np.int32)
+        self._boost = np.zeros(0)
+        # Dense query weights by feature id, zeroed again after every query
+        self._query_weights = np.zeros(0)
+        self._idf = np.zeros(0)
+        self._doc_norm = np.zeros(0)
+        self._min_norm = np.zeros(0)
+        self._delta = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _feature_ids(self, features, grow):
+        """Sorted feature ids of a feature set, registering unseen features if `grow`."""
+        vocab = self._vocab
+        features = list(features)
+        fids = [vocab.get(feature) for feature in features]
+        if None in fids:
+            if grow:
+                for i, feature in enumerate(features):
+                    if fids[i] is None:
+                        fids[i] = vocab[feature] = len(vocab)
+                        self._feature_boost.append(TOKEN_BOOST if feature.startswith(TOKEN_PREFIX) else 1.0)
+            else:
+                fids = [fid for fid in fids if fid is not None]
+        fids = np.array(fids, dtype=np.int32)
+        fids.sort()
+        return fids
+
+    def add(self, ids, names):
+        """Add catalog rows; they are matchable immediately."""
+        for item_id, name in zip(ids, names):
+            self.ids.append(item_id)
+            self.names.append(name)
+            self._doc_features.append(self._feature_ids(name_features(name), grow=True))
+        self._delta = None
+        pending = len(self.ids) - self._indexed
+        if pending > max(MIN_REBUILD_ROWS, REBUILD_FRACTION * self._indexed):
+            self.rebuild()
+
+    def rebuild(self):
+        """Rebuild postings, IDF weights and row norms over every row added so far."""
+        n_docs = len(self.ids)
+        n_features = len(self._vocab)
+        lengths = np.fromiter((len(f) for f in self._doc_features), dtype=np.int64, count=n_docs)
+        features = np.concatenate(self._doc_features) if n_docs else np.zeros(0, dtype=np.int32)
+        docs = np.repeat(np.arange(n_docs, dtype=np.int32), lengths)
+        # Stable sort keeps each posting list in row order for binary search
+        order = np.argsort(features, kind='stable')
+        df = np.bincount(features, minlength=n_features)
+        self._indptr = np.concatenate(([0], np.cumsum(df)))
+        self._postings = docs[order]
+        self._row_indptr = np.concatenate(([0], np.cumsum(lengths)))
+        self._row_features = features
+        self._idf = np.log((n_docs + 1) / (df + 1)) + 1.0
+        weights = (self._idf * self._boosts()) ** 2
+        self._doc_norm = np.sqrt(np.bincount(docs, weights=weights[features], minlength=n_docs))
+        # Smallest row norm in each posting list bounds what that feature can add to a row's score
+        min_norm = np.full(n_features, np.inf)
+        nonempty = df > 0
+        if nonempty.any():
+            min_norm[nonempty] = np.minimum.reduceat(self._doc_norm[self._postings], self._indptr[:-1][nonempty])
+        self._min_norm = min_norm
+        self._indexed = n_docs
+        self._delta = None
+
+    def _boosts(self):
+        if len(self._boost) != len(self._feature_boost):
+            self._boost = np.asarray(self._feature_boost)
+            self._query_weights = np.zeros(len(self._feature_boost))
+        return self._boost
+
+    def _weights(self, fids):
+        """Squared IDF weights for feature ids; features unseen at the last rebuild get the maximum IDF."""
+        boost = self._boosts()[fids]
+        idf = np.full(len(fids), math.log(self._indexed + 1) + 1.0)
+        known = fids < len(self._idf)
+        idf[known] = self._idf[fids[known]]
+        return (idf * boost) ** 2
+
+    def _delta_arrays(self):
+        if self._delta is None:
+            pending = self._doc_features[self._indexed:]
+            lengths = np.fromiter((len(f) for f in pending), dtype=np.int64, count=len(pending))
+            features = np.concatenate(pending) if pending else np.zeros(0, dtype=np.int32)
+            rows = np.repeat(np.arange(len(pending), dtype=np.int32), lengths)
+            norms = np.sqrt(np.bincount(rows, weights=self._weights(features), minlength=len(pending)))
+            self._delta = (features, rows, norms)
+        return self._delta
+
+    def _score_indexed(self, fids, k, exact):
+        """Rows that can make the top k, with their query . row / |row| scores.
+
+        Postings are gathered from the rarest features first, giving each
+        gathered row a partial score. Rows are then scored exactly in order of
+        their upper bound (partial plus every remaining feature) until no
+        unscored row can beat the k-th best.
+
+        A row outside the gathered postings only shares the remaining features,
+        each adding at most weight / (smallest row norm in its postings); once
+        the k-th best score reaches that bound the result is exact. Otherwise
+        the budget grows to cover every feature up to the first whose bound the
+        current k-th best already meets (with exact=False, it grows 4x at a time
+        up to MAX_BUDGET).
+        """
+        if not len(fids):
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        order = np.argsort(self._indptr[fids + 1] - self._indptr[fids], kind='stable')
+        fids = fids[order]
+        weights = self._query_weights[fids]
+        starts = self._indptr[fids]
+        ends = self._indptr[fids + 1]
+        gathered = np.cumsum(ends - starts)
+        bounds = weights / self._min_norm[fids]
+        # remaining[i]: best score a row can get from features i+1 onwards
+        remaining = np.concatenate((np.cumsum(bounds[::-1])[::-1][1:], [0.0]))
+        budget = CANDIDATE_BUDGET
+        while True:
+            # Always take the first feature, then every feature that fits the budget
+            used = max(1, int(np.searchsorted(gathered, budget, side='right')))
+            lists = [self._postings[start:end] for start, end in zip(starts[:used], ends[:used])]
+            candidates, inverse = np.unique(np.concatenate(lists), return_inverse=True)
+            partial = np.bincount(inverse, weights=np.repeat(weights[:used], ends[:used] - starts[:used]))
+            rows, scores = self._rescore(candidates, partial, weights[used:].sum(), k)
+            if used == len(fids):
+                return rows, scores
+            if len(scores) >= k:
+                kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+                if kth >= remaining[used - 1] or (budget >= MAX_BUDGET and not exact):
+                    return rows, scores
+                if exact:
+                    # The k-th best only rises, so these features are enough
+                    budget = gathered[int(np.argmax(remaining <= kth))]
+                    continue
+            budget *= 4
+
+    def _rescore(self, candidates, partial, rest_weight, k):
+        """Exact scores for the candidates that can still make the top k."""
+        norms = self._doc_norm[candidates]
+        if rest_weight == 0:
+            return candidates, partial / norms
+        upper = (partial + rest_weight) / norms
+        if len(candidates) > k:
+            # Partial scores are lower bounds, so their k-th best bounds the final k-th best
+            lower = partial / norms
+            floor = np.partition(lower, len(lower) - k)[len(lower) - k]
+            keep = np.flatnonzero(upper > floor)
+            candidates, partial, upper = candidates[keep], partial[keep], upper[keep]
+        by_upper = np.argsort(-upper, kind='stable')
+        scored_rows = []
+        scored = []
+        kth = -1.0
+        for chunk_start in range(0, len(by_upper), RESCORE_CHUNK):
+            if upper[by_upper[chunk_start]] <= kth:
+                break
+            rows = candidates[by_upper[chunk_start:chunk_start + RESCORE_CHUNK]]
+            scored_rows.append(rows)
+            scored.append(self._dot(rows, self._row_indptr, self._row_features) / self._doc_norm[rows])
+            best = np.concatenate(scored)
+            if len(best) >= k:
+                kth = np.partition(best, len(best) - k)[len(best) - k]
+        return np.concatenate(scored_rows), np.concatenate(scored)
+
+    def _dot(self, rows, indptr, features):
+        """Query . row for each of `rows`, gathering their features from a row-major CSR."""
+        starts = indptr[rows]
+        lengths = indptr[rows + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        gather = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        return np.bincount(owner, weights=self._query_weights[features[gather]], minlength=len(rows))
+
+    def _score_delta(self):
+        features, rows, norms = self._delta_arrays()
+        if not len(features):
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        dot = np.bincount(rows, weights=self._query_weights[features], minlength=len(norms))
+        matched = np.flatnonzero(dot)
+        return matched + self._indexed, dot[matched] / norms[matched]
+
+    def match(self, name, k=DEFAULT_K, exact=True):
+        """Top-k (id, name, score) candidates for one free-text name, best first.
+
+        The result is the true top k by cosine similarity. With exact=False at
+        most MAX_BUDGET postings are gathered and the top k is best-effort.
+        """
+        fids = self._feature_ids(name_features(name), grow=False)
+        if not len(fids):
+            return []
+        weights = self._weights(fids)
+        query_norm = math.sqrt(weights.sum())
+        self._query_weights[fids] = weights
+        try:
+            rows, scores = self._score_indexed(fids[fids < len(self._idf)], k, exact)
+            if self._indexed < len(self.ids):
+                delta_rows, delta_scores = self._score_delta()
+                rows = np.concatenate((rows, delta_rows))
+                scores = np.concatenate((scores, delta_scores))
+        finally:
+            self._query_weights[fids] = 0.0
+        if not len(rows):
+            return []
+        if len(rows) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.lexsort((rows, -scores))
+        return [(self.ids[r], self.names[r], float(s / query_norm)) for r, s in zip(rows[order], scores[order])]
+
+    def match_many(self, names, k=DEFAULT_K, exact=True):
+        """Candidates for a whole receipt or recipe at once; repeated names are matched once."""
+        distinct = {}
+        for name in names:
+            key = normalize_name(name)
+            if key not in distinct:
+                distinct[key] = self.match(name, k, exact)
+        return [distinct[normalize_name(name)] for name in names]
+
+    @classmethod
+    def from_items(cls, docs, name_field='name'):
+        """Index from item documents (e.g. db.items.find({}, {'name': 1}))."""
+        index = cls()
+        ids, names = [], []
+        for doc in docs:
+            if doc.get(name_field):
+                ids.append(doc['_id'])
+                names.append(doc[name_field])
+        index.add(ids, names)
+        index.rebuild()
+        return index
+
+    @classmethod
+    def from_catalog(cls, path, id_column='product_id', name_column='product_name'):
+        """Index from latest_grocery_data (Parquet or the JSON export)."""
+        import pandas as pd
+        if str(path).endswith('.parquet'):
+            df = pd.read_parquet(path, columns=[id_column, name_column])
+        else:
+            df = pd.read_json(path)[[id_column, name_column]]
+        df = df.dropna(subset=[name_column])
+        index = cls()
+        index.add(df[id_column].tolist(), df[name_column].tolist())
+        index.rebuild()
+        return index
+
+
+def match_receipt(index, combined, k=DEFAULT_K):
+    """Candidates for each item of a combined.json receipt, in item order."""
+    items = combined.get('items', [])
+    return index.match_many([item.get('name') or '' for item in items], k)
+
+
+def match_recipe(index, recipe, k=DEFAULT_K):
+    """Candidates for each ingredient's free-text itemId, in ingredient order."""
+    ingredients = recipe.get('ingredients', [])
+    return index.match_many([ingredient.get('itemId') or '' for ingredient in ingredients], k)
+
+
+WORDS = ['organic', 'whole', 'milk', 'chicken', 'breast', 'boneless', 'skinless', 'cheddar', 'cheese', 'bread',
+         'white', 'wheat', 'apple', 'banana', 'greek', 'yogurt', 'vanilla', 'plain', 'butter', 'salted', 'eggs',
+         'large', 'brown', 'rice', 'pasta', 'tomato', 'sauce', 'ground', 'beef', 'lean', 'frozen', 'peas', 'orange',
+         'juice', 'coffee', 'dark', 'roast', 'olive', 'oil', 'extra', 'virgin', 'spinach', 'baby', 'carrots']
+
+
+def synthetic_names(n_rows, seed=0):
+    """Catalog-like names: a brand, 1-2 descriptors from a long-tailed vocabulary, 1-3 grocery words and a size."""
+    rng = random.Random(seed)
+    syllables = ['ba', 'ko', 'ri', 'ten', 'mo', 'sa', 'lu', 'dor', 'vi', 'ne', 'pra', 'gel', 'fi', 'to', 'chu']
+    vocab = sorted({''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(30000)})
+    brands = vocab[:3000]
+
+    def descriptor():
+        # Long-tailed: a few descriptors are common, most are rare
+        return vocab[min(len(vocab) - 1, int((rng.paretovariate(1.2) - 1) * 50))]
+
+    return [f"{rng.choice(brands)} {' '.join(descriptor() for _ in range(rng.randint(1, 2)))} "
+            f"{' '.join(rng.sample(WORDS, rng.randint(1, 3)))} {rng.randint(1, 20) * 50}g"
+            for _ in range(n_rows)]
+
+
+def benchmark(n_rows, n_queries=2000, k=DEFAULT_K):
+    names = synthetic_names(n_rows)
+    start = time.perf_counter()
+    index = CatalogIndex()
+    index.add(range(n_rows), names)
+    index.rebuild()
+    build_sec = time.perf_counter() - start
+
+    rng = random.Random(1)
+    queries = []
+    for name in rng.sample(names, n_queries):
+        words = name.split()[1:-1]
+        # Receipt-style: drop the brand and size, abbreviate one word
+        word = rng.randrange(len(words))
+        words[word] = words[word][:max(3, len(words[word]) - 2)]
+        queries.append(' '.join(words))
+    start = time.perf_counter()
+    results = [index.match(q, k) for q in queries]
+    query_sec = time.perf_counter() - start
+    print(f"{n_rows} catalog rows, {len(index._vocab)} features, built in {build_sec:.1f}s")
+    print(f"{n_queries} queries: {query_sec / n_queries * 1000:.3f} ms/query")
+    print(f"e.g. {queries[0]!r} -> {results[0][:3]}")
+
+    sample = min(200, n_queries)
+    start = time.perf_counter()
+    bounded = [index.match(q, k, exact=False) for q in queries[:sample]]
+    bounded_sec = time.perf_counter() - start
+    # Ties may pick a different row, so compare the best score rather than the id
+    agree = sum(bool(got) and bool(best) and math.isclose(got[0][2], best[0][2])
+                for got, best in zip(bounded, results)) / sample
+    print(f"exact=False: {bounded_sec / sample * 1000:.3f} ms/query; its top-1 score is the true one for {agree:.1%}")
+
+    new_names = synthetic_names(500, seed=2)
+    start = time.perf_counter()
+    index.add(range(n_rows, n_rows + 500), new_names)
+    print(f"500 incremental adds in {(time.perf_counter() - start) * 1000:.1f} ms; "
+          f"{len(index) - index._indexed} rows in the delta")
+    start = time.perf_counter()
+    for q in queries[:500]:
+        index.match(q, k)
+    print(f"with delta: {(time.perf_counter() - start) / 500 * 1000:.3f} ms/query")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', help='free-text names to match')
+    parser.add_argument('--catalog', default='latest_grocery_data.parquet')
+    parser.add_argument('-k', type=int, default=DEFAULT_K)
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark(args.rows, k=args.k)
+        return
+    index = CatalogIndex.from_catalog(args.catalog)
+    for name, candidates in zip(args.names, index.match_many(args.names, args.k)):
+        print(json.dumps({'query': name, 'candidates': candidates}, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""Forecast when fridge items run out and spoil, from consumptionHistory.
+
+consumptionHistory is loaded as columns (one array per field) and reduced with
+grouped pandas operations to additive statistics per (household, item, base
+unit): events, quantity consumed in base units (g, ml or each, via
+unit_normalization), first and last consumption time, waste events and the
+age at which items were consumed or wasted (daysUntilConsumed, else
+consumptionDate - originalPurchaseDate). Every statistic is a sum, min or max,
+so new events are folded in by aggregating them the same way and combining
+the two tables; update() does that for events created at or after the saved
+watermark instead of re-reading the whole collection, skipping the _ids
+already folded in at the watermark time itself.
+
+From the statistics:
+
+- rate: quantity consumed per day since the household first consumed the item
+  (over at least MIN_WINDOW_DAYS); households without history for an item use
+  the item's rate across all households;
+- waste probability: the share of the household's events for the item that
+  were waste, shrunk towards the item's share (and that towards the overall
+  share) by PRIOR_EVENTS pseudo-events, so one wasted carton isn't 100%;
+- shelf life: the item's averageShelfLife, else the mean age at which it was
+  wasted.
+
+forecast() then dates every fridgeItems entry of every household in one pass.
+It is spoiled at expirationDate (else purchaseDate + shelf life). It runs out
+when the household's rate has used up it and every entry of the same item due
+to spoil before it (oldest first). Entries with a known rate that spoil
+before they run out are flagged as likely waste. alerts() turns the forecast
+into the expiration and low-stock alerts of users.notificationPreferences.
+
+Usage:
+    MONGODB_URI=... MONGODB_DB_NAME=kitchenassist python consumption_forecast.py [--full] [--alerts]
+    python consumption_forecast.py --benchmark [--events 2000000] [--households 50000]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from unit_normalization import UNIT_ALIASES, UNIT_FACTORS, canonical_units
+
+STATE_PATH = 'consumption_state'
+WASTE_TYPE = 'waste'
+# Rates are measured over at least this many days, so a first purchase doesn't read as a binge
+MIN_WINDOW_DAYS = 7
+# Pseudo-events pulling a household's waste share towards its item's (and the item's towards everyone's)
+PRIOR_EVENTS = 5.0
+EXPIRING_DAYS = 3
+LOW_STOCK_DAYS = 3
+# Run-out dates further out than this are left empty (a rate that slow says little)
+HORIZON_DAYS = 365
+DAY = 86_400.0
+
+# Base units as small ints; -1 is a unit we can't convert (consumption of it has no rate)
+BASE_UNITS = ['g', 'ml', 'each']
+_BASE_CODE = {unit: BASE_UNITS.index(base) for unit, (base, _) in UNIT_FACTORS.items()}
+_FACTOR = {unit: factor for unit, (_, factor) in UNIT_FACTORS.items()}
+
+HISTORY_FIELDS = ['householdId', 'itemId', 'quantityConsumed', 'unit', 'consumptionDate', 'consumptionType',
+                  'originalPurchaseDate', 'daysUntilConsumed', 'createdAt']
+KEYS = ['householdId', 'itemId', 'base']
+# Statistic -> how two partial tables combine
+STAT_AGGREGATES = {
+    'events': 'sum',
+    'quantity': 'sum',
+    'first': 'min',
+    'last': 'max',
+    'waste_events': 'sum',
+    'waste_quantity': 'sum',
+    'age_sum': 'sum',
+    'age_count': 'sum',
+    'waste_age_sum': 'sum',
+    'waste_age_count': 'sum',
+}
+
+
+def _seconds(values):
+    """Epoch seconds of naive-UTC or aware datetimes (NaN where missing)."""
+    stamps = pd.Series(pd.to_datetime(values, utc=True, errors='coerce'))
+    return ((stamps - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+
+
+def _timestamps(seconds):
+    """Naive UTC datetime64 column from epoch seconds (NaT where NaN), as pymongo returns dates."""
+    millis = np.asarray(seconds, dtype=float) * 1000
+    stamps = np.full(len(millis), np.datetime64('NaT'), dtype='datetime64[ms]')
+    known = ~np.isnan(millis)
+    stamps[known] = np.round(millis[known]).astype(np.int64).astype('datetime64[ms]')
+    return stamps
+
+
+def _numbers(values):
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+
+def _to_base(quantity, units):
+    """(base unit code, quantity in base units); a missing unit counts items."""
+    codes, uniques = pd.factorize(pd.Series(units, dtype=object).fillna('each'))
+    canonical = canonical_units(pd.Series(uniques, dtype=object).astype(str).str.strip())
+    base = canonical.map(_BASE_CODE).fillna(-1).to_numpy(dtype=np.int8)
+    factor = canonical.map(_FACTOR).to_numpy(dtype=float)
+    return base[codes], _numbers(quantity) * factor[codes]
+
+
+def history_frame(docs):
+    """consumptionHistory documents as one column per field (ids as strings)."""
+    frame = pd.DataFrame.from_records(list(docs), columns=['_id'] + HISTORY_FIELDS)
+    for column in ('_id', 'householdId', 'itemId'):
+        frame[column] = frame[column].astype(str)
+    return frame
+
+
+def event_stats(history):
+    """Per (household, item, base unit) statistics of a history_frame()."""
+    if history.empty:
+        return pd.DataFrame({**{key: pd.Series(dtype=str) for key in KEYS[:2]}, 'base': pd.Series(dtype=np.int8),
+                             **{stat: pd.Series(dtype=float) for stat in STAT_AGGREGATES}})
+    base, amount = _to_base(history['quantityConsumed'], history['unit'])
+    when = _seconds(history['consumptionDate'])
+    waste = (history['consumptionType'] == WASTE_TYPE).to_numpy()
+    age = _numbers(history['daysUntilConsumed'])
+    age = np.where(np.isnan(age), (when - _seconds(history['originalPurchaseDate'])) / DAY, age)
+    has_age = ~np.isnan(age)
+    frame = pd.DataFrame({
+        'householdId': history['householdId'].to_numpy(),
+        'itemId': history['itemId'].to_numpy(),
+        'base': base,
+        'events': (~waste).astype(float),
+        'quantity': np.where(waste, 0.0, np.nan_to_num(amount)),
+        # Waste doesn't date consumption; NaN is skipped by min/max
+        'first': np.where(waste, np.nan, when),
+        'last': np.where(waste, np.nan, when),
+        'waste_events': waste.astype(float),
+        'waste_quantity': np.where(waste, np.nan_to_num(amount), 0.0),
+        'age_sum': np.where(~waste & has_age, age, 0.0),
+        'age_count': (~waste & has_age).astype(float),
+        'waste_age_sum': np.where(waste & has_age, age, 0.0),
+        'waste_age_count': (waste & has_age).astype(float),
+    })
+    return frame.groupby(KEYS, sort=False, as_index=False).agg(STAT_AGGREGATES)
+
+
+class ConsumptionModel:
+    """Additive consumption and waste statistics, plus the createdAt watermark of the last event folded in
+    and the _ids of the events folded in with exactly that createdAt."""
+
+    def __init__(self, stats=None, watermark=None, events=0, watermark_ids=()):
+        self.stats = event_stats(pd.DataFrame(columns=HISTORY_FIELDS)) if stats is None else stats
+        self.watermark = watermark
+        self.watermark_ids = set(watermark_ids)
+        self.events = events
+
+    @classmethod
+    def from_history(cls, history):
+        return cls().fold(history)
+
+    def fold(self, history):
+        """Add the events of a history_frame(); returns self.
+
+        Events at the watermark whose _id was already folded in are skipped, so
+        history can be read from the watermark inclusive.
+        """
+        created = _seconds(history['createdAt'])
+        ids = history['_id'].astype(str).to_numpy() if '_id' in history else None
+        if ids is not None and self.watermark_ids:
+            seen = (created == self.watermark) & np.isin(ids, list(self.watermark_ids))
+            history, created, ids = history[~seen], created[~seen], ids[~seen]
+        if history.empty:
+            return self
+        new = event_stats(history)
+        if self.stats.empty:
+            self.stats = new
+        else:
+            self.stats = pd.concat([self.stats, new], ignore_index=True).groupby(
+                KEYS, sort=False, as_index=False).agg(STAT_AGGREGATES)
+        if not np.isnan(created).all():
+            newest = float(np.nanmax(created))
+            if self.watermark is None or newest > self.watermark:
+                self.watermark = newest
+                self.watermark_ids = set()
+            if newest == self.watermark and ids is not None:
+                self.watermark_ids.update(ids[created == newest])
+        self.events += len(history)
+        return self
+
+    def save(self, path=STATE_PATH):
+        os.makedirs(path, exist_ok=True)
+        self.stats.to_parquet(os.path.join(path, 'stats.parquet'), index=False)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'watermark': self.watermark, 'watermark_ids': sorted(self.watermark_ids),
+                       'events': self.events}, f)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        stats = pd.read_parquet(os.path.join(path, 'stats.parquet'))
+        return cls(stats, meta['watermark'], meta['events'], meta.get('watermark_ids', ()))
+
+    def rates(self, now):
+        """(household rates, item rates): base units consumed per day, per (household, item, base)
+        and per (item, base) across households."""
+        stats = self.stats[(self.stats['base'] >= 0) & (self.stats['events'] > 0)]
+        window = np.maximum((_seconds([now])[0] - stats['first'].to_numpy()) / DAY, MIN_WINDOW_DAYS)
+        household = stats[KEYS].assign(rate=stats['quantity'].to_numpy() / window)
+        by_item = stats[['itemId', 'base', 'quantity']].assign(window=window).groupby(
+            ['itemId', 'base'], sort=False, as_index=False).sum()
+        item = by_item[['itemId', 'base']].assign(item_rate=by_item['quantity'] / by_item['window'])
+        return household, item
+
+    def waste_probabilities(self):
+        """(household, item, overall): shrunk share of events that were waste, per (household, item) and item."""
+        counts = self.stats.groupby(['householdId', 'itemId'], sort=False, as_index=False)[
+            ['events', 'waste_events']].sum()
+        total_events = counts['events'].sum() + counts['waste_events'].sum()
+        overall = counts['waste_events'].sum() / total_events if total_events else 0.0
+        by_item = counts.groupby('itemId', sort=False, as_index=False)[['events', 'waste_events']].sum()
+        by_item['item_waste_probability'] = (by_item['waste_events'] + PRIOR_EVENTS * overall) / (
+            by_item['events'] + by_item['waste_events'] + PRIOR_EVENTS)
+        counts = counts.merge(by_item[['itemId', 'item_waste_probability']], on='itemId', how='left')
+        counts['waste_probability'] = (counts['waste_events'] + PRIOR_EVENTS * counts['item_waste_probability']) / (
+            counts['events'] + counts['waste_events'] + PRIOR_EVENTS)
+        return (counts[['householdId', 'itemId', 'waste_probability']],
+                by_item[['itemId', 'item_waste_probability']], overall)
+
+    def learned_shelf_life(self):
+        """itemId -> mean age in days at which the item was wasted, where any waste had an age."""
+        by_item = self.stats.groupby('itemId', sort=False)[['waste_age_sum', 'waste_age_count']].sum()
+        by_item = by_item[by_item['waste_age_count'] > 0]
+        return by_item['waste_age_sum'] / by_item['waste_age_count']
+
+    def forecast(self, fridge, shelf_life=None, now=None):
+        """Spoil and run-out dates for every entry of a fridge_frame().
+
+        shelf_life maps itemId -> averageShelfLife in days.
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        now_seconds = _seconds([now])[0]
+        frame = fridge.copy()
+        base, amount = _to_base(frame['quantity'], frame['unit'])
+        frame['base'] = base
+        frame['amount'] = amount
+
+        # Spoil: expirationDate, else purchaseDate plus the catalog's, else the learned, shelf life
+        learned = self.learned_shelf_life()
+        catalog = pd.Series(shelf_life or {}, dtype=float)
+        catalog = catalog[catalog > 0]
+        catalog.index = catalog.index.astype(str)
+        days = frame['itemId'].map(catalog)
+        source = np.where(days.notna(), 'averageShelfLife', None)
+        learned_days = frame['itemId'].map(learned)
+        source = np.where(days.isna() & learned_days.notna(), 'waste history', source)
+        days = days.fillna(learned_days).to_numpy(dtype=float)
+        purchased = _seconds(frame['purchaseDate'])
+        expires = _seconds(frame['expirationDate'])
+        spoil = np.where(np.isnan(expires), purchased + days * DAY, expires)
+        source = np.where(~np.isnan(expires), 'expirationDate', np.where(np.isnan(spoil), None, source))
+        frame['spoil'] = spoil
+        frame['spoil_source'] = source
+
+        # Run-out: the household's own rate, else the item's across households
+        household_rates, item_rates = self.rates(now)
+        frame = frame.merge(household_rates, on=KEYS, how='left').merge(item_rates, on=['itemId', 'base'], how='left')
+        rate = frame['rate'].to_numpy()
+        frame['rate_source'] = np.where(~np.isnan(rate), 'household',
+                                        np.where(frame['item_rate'].notna(), 'item', None))
+        rate = np.where(np.isnan(rate), frame['item_rate'].to_numpy(), rate)
+        frame['rate'] = rate
+        # Entries of one item are used oldest first: each runs out once it and those spoiling before it are used up
+        frame['order'] = np.where(np.isnan(spoil), np.inf, spoil)
+        frame = frame.sort_values(KEYS + ['order'], kind='stable')
+        used_up = frame.groupby(KEYS, sort=False)['amount'].cumsum().to_numpy()
+        rate = frame['rate'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_left = used_up / rate
+        runout = np.where((rate > 0) & (days_left <= HORIZON_DAYS), now_seconds + days_left * DAY, np.nan)
+        frame['runout'] = runout
+
+        household_waste, item_waste, overall = self.waste_probabilities()
+        frame = frame.merge(household_waste, on=['householdId', 'itemId'], how='left').merge(
+            item_waste, on='itemId', how='left')
+        frame['waste_probability'] = frame['waste_probability'].fillna(frame['item_waste_probability']).fillna(overall)
+        spoil = frame['spoil'].to_numpy()
+        # Without a rate the run-out is unknown, not never; past the horizon it counts as never
+        has_rate = ~np.isnan(frame['rate'].to_numpy())
+        frame['likely_waste'] = has_rate & (spoil < np.where(np.isnan(frame['runout']), np.inf, frame['runout']))
+        frame['spoilDate'] = _timestamps(frame['spoil'])
+        frame['runOutDate'] = _timestamps(frame['runout'])
+        frame['daysToSpoil'] = ((spoil - now_seconds) / DAY).round(2)
+        frame['daysToRunOut'] = ((frame['runout'].to_numpy() - now_seconds) / DAY).round(2)
+        frame['rate'] = frame['rate'].round(4)
+        frame['waste_probability'] = frame['waste_probability'].round(4)
+        return frame.sort_values(['householdId', 'entry'], kind='stable')[[
+            'householdId', 'entryId', 'itemId', 'quantity', 'unit', 'spoilDate', 'spoil_source', 'daysToSpoil',
+            'runOutDate', 'rate', 'rate_source', 'daysToRunOut', 'waste_probability', 'likely_waste',
+        ]].reset_index(drop=True)
+
+
+def fridge_frame(households):
+    """Every fridgeItems entry of the households, one row each."""
+    columns = {'householdId': [], 'entryId': [], 'itemId': [], 'quantity': [], 'unit': [],
+               'purchaseDate': [], 'expirationDate': []}
+    for household in households:
+        household_id = str(household.get('_id'))
+        for entry in household.get('fridgeItems') or []:
+            if entry.get('itemId') is None:
+                continue
+            columns['householdId'].append(household_id)
+            columns['entryId'].append(str(entry.get('_id')))
+            columns['itemId'].append(str(entry['itemId']))
+            for field in ('quantity', 'unit', 'purchaseDate', 'expirationDate'):
+                columns[field].append(entry.get(field))
+    # Explicit dtypes so an empty frame still merges with the str keys of the rates
+    frame = pd.DataFrame(columns).astype({'householdId': str, 'entryId': str, 'itemId': str})
+    # Row number across all households; output is sorted by household, then this, so it keeps fridge order
+    frame['entry'] = np.arange(len(frame))
+    return frame
+
+
+def alerts(forecast, expiring_days=EXPIRING_DAYS, low_stock_days=LOW_STOCK_DAYS):
+    """Expiration and low-stock alert rows of a forecast()."""
+    expiring = forecast[forecast['daysToSpoil'] <= expiring_days].assign(
+        alert='expiration', days=lambda f: f['daysToSpoil'])
+    # Low stock is per item, not per entry: the household runs out when its last entry does
+    last = forecast.dropna(subset=['daysToRunOut']).sort_values('daysToRunOut').groupby(
+        ['householdId', 'itemId'], sort=False).tail(1)
+    low = last[last['daysToRunOut'] <= low_stock_days].assign(alert='lowStock', days=lambda f: f['daysToRunOut'])
+    return pd.concat([expiring, low], ignore_index=True)[
+        ['householdId', 'alert', 'itemId', 'entryId', 'days']].sort_values(['householdId', 'alert', 'days'])
+
+
+def opted_in_households(db):
+    """alert -> householdIds (as strings) with a user who turned that alert on in notificationPreferences."""
+    preferences = {'expiration': 'expirationAlerts', 'lowStock': 'lowStockAlerts'}
+    return {alert: {str(user['householdId']) for user in db.users.find(
+        {f'notificationPreferences.{field}': True, 'householdId': {'$ne': None}}, {'householdId': 1})}
+        for alert, field in preferences.items()}
+
+
+def update(db, state_path=STATE_PATH, full=False):
+    """Fold consumptionHistory created since the saved watermark into the saved model (all of it if full).
+
+    The query includes the watermark itself: events inserted later with the
+    same createdAt are folded in, those already folded in are skipped by _id.
+    """
+    model = ConsumptionModel() if full or not os.path.exists(os.path.join(state_path, 'meta.json')) \
+        else ConsumptionModel.load(state_path)
+    query = {}
+    if model.watermark is not None:
+        query = {'createdAt': {'$gte': datetime.datetime.fromtimestamp(model.watermark, datetime.timezone.utc)}}
+    history = history_frame(db.consumptionHistory.find(query, {field: 1 for field in HISTORY_FIELDS}))
+    model.fold(history)
+    model.save(state_path)
+    return model, len(history)
+
+
+def forecast_households(db, model, query=None, now=None):
+    households = db.households.find(query or {}, {'fridgeItems': 1})
+    fridge = fridge_frame(households)
+    shelf_life = {doc['_id']: doc.get('averageShelfLife') for doc in db.items.find(
+        {'averageShelfLife': {'$gt': 0}}, {'averageShelfLife': 1})}
+    return model.forecast(fridge, shelf_life, now)
+
+
+def synthetic_data(n_events, n_households, n_items=2_000, fridge_size=20, seed=0):
+    """History events and fridges over Zipf-popular items, each with its own waste share and pace."""
+    rng = np.random.default_rng(seed)
+    now = datetime.datetime(2024, 6, 1)
+    weights = 1.0 / np.arange(1, n_items + 1) ** 0.9
+    weights /= weights.sum()
+    item_waste = rng.beta(1, 6, n_items)
+    units = np.array(['g', 'ml', 'each', 'kg', 'l'])
+    item_unit = units[rng.integers(0, len(units), n_items)]
+    households = rng.integers(0, n_households, n_events)
+    items = rng.choice(n_items, n_events, p=weights)
+    age = rng.gamma(2.0, 3.0, n_events)
+    when = np.datetime64(now, 'ms') - (rng.random(n_events) * 180 * DAY * 1000).astype('timedelta64[ms]')
+    history = pd.DataFrame({
+        '_id': np.char.add('event', np.arange(n_events).astype(str)),
+        'householdId': np.char.add('household', households.astype(str)),
+        'itemId': np.char.add('item', items.astype(str)),
+        'quantityConsumed': rng.integers(1, 500, n_events).astype(float),
+        'unit': item_unit[items],
+        'consumptionDate': when,
+        'consumptionType': np.where(rng.random(n_events) < item_waste[items], 'waste', 'consumed'),
+        'originalPurchaseDate': when - (age * DAY * 1000).astype('timedelta64[ms]'),
+        'daysUntilConsumed': np.where(rng.random(n_events) < 0.5, np.nan, age.round(1)),
+        'createdAt': when,
+    }).sort_values('createdAt', ignore_index=True)
+    picker = random.Random(seed)
+    fridges = []
+    for h in range(n_households):
+        fridge = rng.choice(n_items, fridge_size, p=weights)
+        fridges.append({'_id': f'household{h}', 'fridgeItems': [{
+            '_id': f'entry{h}-{n}', 'itemId': f'item{i}', 'quantity': picker.choice([1, 2, 250, 500]),
+            'unit': str(item_unit[i]), 'purchaseDate': now - datetime.timedelta(days=picker.uniform(0, 10)),
+            'expirationDate': now + datetime.timedelta(days=picker.uniform(-1, 14)) if picker.random() < 0.6 else None,
+        } for n, i in enumerate(fridge)]})
+    shelf_life = {f'item{i}': float(d) for i, d in enumerate(rng.integers(3, 30, n_items)) if i % 3}
+    return history, fridges, shelf_life, now
+
+
+def python_stats(records):
+    """Per-document dict accumulation of the same statistics; the baseline the benchmark compares against."""
+    stats = {}
+    for doc in records:
+        canonical = UNIT_ALIASES.get(str(doc['unit'] or 'each').strip().lower())
+        base = _BASE_CODE.get(canonical, -1)
+        amount = (doc['quantityConsumed'] or 0) * _FACTOR.get(canonical, np.nan)
+        key = (doc['householdId'], doc['itemId'], base)
+        entry = stats.setdefault(key, {'events': 0, 'quantity': 0.0, 'first': np.inf, 'waste_events': 0})
+        when = pd.Timestamp(doc['consumptionDate']).timestamp()
+        if doc['consumptionType'] == WASTE_TYPE:
+            entry['waste_events'] += 1
+        else:
+            entry['events'] += 1
+            entry['quantity'] += 0.0 if np.isnan(amount) else amount
+            entry['first'] = min(entry['first'], when)
+    return stats
+
+
+def benchmark(n_events, n_households):
+    history, fridges, shelf_life, now = synthetic_data(n_events, n_households)
+    split = int(len(history) * 0.99)
+
+    start = time.perf_counter()
+    model = ConsumptionModel.from_history(history.iloc[:split])
+    full_sec = time.perf_counter() - start
+    print(f"Folded {split:,} events into {len(model.stats):,} (household, item) statistics in {full_sec:.2f}s")
+
+    start = time.perf_counter()
+    model.fold(history.iloc[split:])
+    print(f"Incremental fold of {len(history) - split:,} new events: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    fridge = fridge_frame(fridges)
+    result = model.forecast(fridge, shelf_life, now)
+    elapsed = time.perf_counter() - start
+    print(f"Forecast {len(result):,} fridge entries of {n_households:,} households in {elapsed:.2f}s "
+          f"({elapsed / len(result) * 1e6:.1f} us/entry); {int(result['likely_waste'].sum()):,} likely waste, "
+          f"{len(alerts(result)):,} alerts")
+
+    sample = history.iloc[:min(len(history), 100_000)]
+    start = time.perf_counter()
+    expected = python_stats(sample.to_dict('records'))
+    loop_sec = (time.perf_counter() - start) / len(sample) * len(history)
+    check = ConsumptionModel.from_history(sample).stats.set_index(KEYS)
+    expected = pd.DataFrame.from_dict(expected, orient='index')
+    expected.index = check.index[check.index.get_indexer(expected.index)] if len(expected) == len(check) else None
+    same = len(expected) == len(check) and np.allclose(
+        check.loc[expected.index, ['events', 'quantity', 'waste_events']].to_numpy(),
+        expected[['events', 'quantity', 'waste_events']].to_numpy())
+    print(f"Per-document loop: ~{loop_sec:.0f}s for all events ({loop_sec / full_sec:.0f}x); "
+          f"statistics match: {same}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--state', default=STATE_PATH, help='directory of the saved statistics')
+    parser.add_argument('--full', action='store_true', help='rebuild the statistics from all of consumptionHistory')
+    parser.add_argument('--household', help='forecast this household _id only')
+    parser.add_argument('--alerts', action='store_true',
+                        help='print the alerts of households whose users turned them on')
+    parser.add_argument('--output', help='write the forecast to this .csv or .parquet file')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGODB_DB_NAME', 'kitchenassist'))
+    parser.add_argument('--benchmark', action='store_true', help='time against a per-document loop on synthetic data')
+    parser.add_argument('--events', type=int, default=2_000_000)
+    parser.add_argument('--households', type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.events, args.households)
+        return
+    from bson import ObjectId
+    from pymongo import MongoClient
+    client = MongoClient(args.uri)
+    try:
+        db = client[args.db]
+        start = time.perf_counter()
+        model, new_events = update(db, args.state, args.full)
+        print(f"Folded {new_events} new events ({model.events} total) in {time.perf_counter() - start:.1f}s")
+        query = {'_id': ObjectId(args.household)} if args.household else None
+        result = forecast_households(db, model, query)
+        opted_in = opted_in_households(db) if args.alerts else None
+    finally:
+        client.close()
+    if args.output:
+        if args.output.endswith('.parquet'):
+            result.to_parquet(args.output, index=False)
+        else:
+            result.to_csv(args.output, index=False)
+        print(f"Wrote {len(result)} fridge entries to {args.output}")
+    else:
+        print(result.to_string(index=False, max_rows=50))
+    if opted_in is not None:
+        due = alerts(result)
+        due = due[[household in opted_in[alert] for household, alert in zip(due['householdId'], due['alert'])]]
+        print(due.to_string(index=False, max_rows=100))
+
+
+if __name__ == "__main__":
+    main()
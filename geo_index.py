@@ -0,0 +1,426 @@
+"""Nearest-store lookups on the sphere: a ball tree over groceryStores locations.
+
+GeoPoint coordinates ([lon, lat]) become 3-D unit vectors. The straight
+(chord) distance between two of them grows with their great-circle distance,
+so the nearest by chord is the nearest by haversine, and a chord converts
+exactly to km (2 * asin(chord / 2) * EARTH_RADIUS_KM).
+
+The index splits the stores recursively at the median of their widest axis
+until at most LEAF_SIZE remain in each part, stores each leaf's points
+contiguously and bounds the leaf with a ball (center, radius). A batch of
+queries is first tested against the balls, as one queries x leaves matrix of
+center distances:
+
+- kNN: the k-th nearest store in the ball with the nearest center bounds
+  each query's k-th distance from above; only stores in balls whose near
+  edge (distance - radius) is within that bound are measured;
+- radius: only stores in balls whose near edge is within the radius.
+
+The candidate (query, store) pairs are expanded from the leaf offsets in one
+step and top-k is taken per query with one np.argpartition, so there is no
+per-household Python loop and no households x stores distance matrix.
+
+A built index is saved as .npy arrays plus meta.json and memory-mapped on load.
+
+nearest --write-preferred fills in preferredStores (nearest first, within
+--max-km) for households that have none, which basket_optimizer.py then uses.
+
+Usage:
+    MONGODB_URI=... MONGODB_DB_NAME=kitchenassist python geo_index.py build [--index store_index]
+    python geo_index.py nearest [--k 3] [--household ID] [--max-km 25] [--write-preferred]
+    python geo_index.py catchment [--radius-km 5]
+    python geo_index.py benchmark [--stores 20000] [--households 200000]
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+INDEX_PATH = 'store_index'
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 32
+DEFAULT_K = 3
+DEFAULT_RADIUS_KM = 5.0
+# Query x leaf cells tested per step (~4 float64 matrices of this size)
+CELLS_PER_CHUNK = 4_000_000
+DEFAULT_BATCH_SIZE = 1000
+# Queries with up to this many candidate stores get their top-k from one partition of a dense block
+DENSE_WIDTH = 2048
+
+
+def unit_vectors(lonlat):
+    """(n, 3) unit vectors of (n, 2) [lon, lat] degrees; NaN rows stay NaN."""
+    lonlat = np.asarray(lonlat, dtype=float).reshape(-1, 2)
+    lon, lat = np.radians(lonlat[:, 0]), np.radians(lonlat[:, 1])
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    chord = np.asarray(chord, dtype=float)
+    return np.where(np.isinf(chord), np.inf, 2 * np.arcsin(np.minimum(chord / 2, 1.0)) * EARTH_RADIUS_KM)
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def haversine_km(lonlat, other):
+    """Great-circle km between (n, 2) and (m, 2) [lon, lat] arrays, as an (n, m) matrix."""
+    lon1, lat1 = np.radians(np.asarray(lonlat, dtype=float)).T[:, :, None]
+    lon2, lat2 = np.radians(np.asarray(other, dtype=float)).T[:, None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0))) * EARTH_RADIUS_KM
+
+
+def coordinates(docs):
+    """(ids as strings, (n, 2) [lon, lat]) of documents; those without a valid GeoPoint get NaN."""
+    ids, lonlat = [], []
+    for doc in docs:
+        point = (doc.get('location') or {}).get('coordinates')
+        # location.coordinates is a GeoPoint; accept a bare [lon, lat] as well
+        if isinstance(point, dict):
+            point = point.get('coordinates')
+        try:
+            lon, lat = float(point[0]), float(point[1])
+        except (TypeError, ValueError, IndexError):
+            lon = lat = np.nan
+        if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+            lon = lat = np.nan
+        ids.append(str(doc.get('_id')))
+        lonlat.append((lon, lat))
+    return ids, np.asarray(lonlat, dtype=float).reshape(-1, 2)
+
+
+def _smallest_per_group(group, values, n_groups, k):
+    """(n_groups, k) positions of each group's k smallest values, ascending (-1 where it has fewer).
+
+    Positions of one group must be contiguous and in group order. Groups of up
+    to DENSE_WIDTH values are laid out one row each and partitioned together;
+    larger ones (far-off queries) are sorted one by one.
+    """
+    counts = np.bincount(group, minlength=n_groups)
+    first = np.cumsum(counts) - counts
+    column = np.arange(len(group)) - np.repeat(first, counts)
+    narrow = counts[group] <= DENSE_WIDTH
+    width = max(k, int(counts[counts <= DENSE_WIDTH].max(initial=0)))
+    dense = np.full((n_groups, width), np.inf)
+    dense[group[narrow], column[narrow]] = values[narrow]
+    best = np.argpartition(dense, k - 1, axis=1)[:, :k]
+    smallest = np.take_along_axis(dense, best, axis=1)
+    order = np.argsort(smallest, axis=1, kind='stable')
+    best = np.take_along_axis(best, order, axis=1)
+    best = np.where(np.isfinite(np.take_along_axis(smallest, order, axis=1)), first[:, None] + best, -1)
+    for g in np.flatnonzero(counts > DENSE_WIDTH):
+        top = np.argsort(values[first[g]:first[g] + counts[g]], kind='stable')[:k]
+        best[g, :len(top)] = first[g] + top
+    return best
+
+
+class SphereIndex:
+    """Ball tree leaves over unit vectors: points grouped by leaf, each leaf bounded by a ball."""
+
+    def __init__(self, ids, lonlat, points, offsets, centers, radii):
+        self.ids = ids
+        self.lonlat = lonlat
+        self.points = points
+        self.offsets = offsets
+        self.centers = centers
+        self.radii = radii
+        self._center_norms = (np.asarray(centers) ** 2).sum(axis=1)
+        # Fewest leaves guaranteed to hold j + 1 points, for kNN upper bounds
+        self._leaves_for = np.repeat(np.arange(1, len(offsets)), np.sort(np.diff(offsets)))
+
+    @classmethod
+    def build(cls, ids, lonlat, leaf_size=LEAF_SIZE):
+        """Index the rows of lonlat that have coordinates; ids[i] names row i."""
+        ids, lonlat = np.asarray(ids, dtype=str), np.asarray(lonlat, dtype=float).reshape(-1, 2)
+        located = ~np.isnan(lonlat).any(axis=1)
+        ids, lonlat = ids[located], lonlat[located]
+        points = unit_vectors(lonlat)
+        leaves = []
+        stack = [np.arange(len(points))] if len(points) else []
+        while stack:
+            members = stack.pop()
+            if len(members) <= leaf_size:
+                leaves.append(members)
+                continue
+            spread = np.ptp(points[members], axis=0)
+            half = len(members) // 2
+            split = np.argpartition(points[members, int(np.argmax(spread))], half)
+            # Right half pushed first so leaves come out in spatial order
+            stack.append(members[split[half:]])
+            stack.append(members[split[:half]])
+        order = np.concatenate(leaves) if leaves else np.zeros(0, dtype=np.int64)
+        sizes = np.array([len(leaf) for leaf in leaves], dtype=np.int64)
+        offsets = np.r_[0, np.cumsum(sizes)]
+        points = points[order]
+        if len(leaves):
+            centers = np.add.reduceat(points, offsets[:-1]) / sizes[:, None]
+            spans = np.sqrt(((points - np.repeat(centers, sizes, axis=0)) ** 2).sum(axis=1))
+            # Slack so float rounding can't put a point outside its own ball
+            radii = np.maximum.reduceat(spans, offsets[:-1]) + 1e-12
+        else:
+            centers, radii = np.zeros((0, 3)), np.zeros(0)
+        return cls(ids[order], lonlat[order], points, offsets, centers, radii)
+
+    @classmethod
+    def from_db(cls, db, query=None, leaf_size=LEAF_SIZE):
+        ids, lonlat = coordinates(db.groceryStores.find(query or {}, {'location.coordinates': 1}))
+        return cls.build(ids, lonlat, leaf_size)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, path=INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        for name in ('ids', 'lonlat', 'points', 'offsets', 'centers', 'radii'):
+            np.save(os.path.join(path, name + '.npy'), np.asarray(getattr(self, name)))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'points': len(self), 'leaves': len(self.radii),
+                       'built': datetime.datetime.now(datetime.timezone.utc).isoformat()}, f)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        def load(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        return cls(*(load(name) for name in ('ids', 'lonlat', 'points', 'offsets', 'centers', 'radii')))
+
+    def _ball_distances(self, queries):
+        """(queries x leaves) chord distance from each query to each leaf center."""
+        squared = 1.0 + self._center_norms - 2.0 * (queries @ np.asarray(self.centers).T)
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def _candidates(self, queries, mask):
+        """(query row, point row, chord) for every point of every (query, leaf) pair in mask."""
+        query, leaf = np.nonzero(mask)
+        starts = self.offsets[leaf]
+        counts = self.offsets[leaf + 1] - starts
+        query = np.repeat(query, counts)
+        point = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        diff = queries[query] - self.points[point]
+        return query, point, np.sqrt((diff * diff).sum(axis=1))
+
+    def _nearest_leaf_bound(self, queries, centers, k):
+        """k-th distance to the points of each query's nearest-center leaf (inf if it has fewer than k)."""
+        leaf = centers.argmin(axis=1)
+        starts, ends = self.offsets[leaf], self.offsets[leaf + 1]
+        width = int((ends - starts).max())
+        if width < k:
+            return np.full(len(queries), np.inf)
+        point = starts[:, None] + np.arange(width)
+        inside = point < ends[:, None]
+        diff = queries[:, None, :] - np.asarray(self.points)[np.where(inside, point, 0)]
+        chord = np.where(inside, np.sqrt((diff * diff).sum(axis=2)), np.inf)
+        return np.partition(chord, k - 1, axis=1)[:, k - 1]
+
+    def _chunks(self, n_queries):
+        step = max(1, CELLS_PER_CHUNK // max(1, len(self.radii)))
+        return range(0, n_queries, step), step
+
+    def knn(self, lonlat, k=DEFAULT_K):
+        """(rows, km): each query's k nearest points, nearest first; missing neighbours are -1 / inf."""
+        queries = unit_vectors(lonlat)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        chords = np.full((len(queries), k), np.inf)
+        if not len(self) or k < 1:
+            return rows, chord_to_km(chords)
+        radii = np.asarray(self.radii)
+        m = int(self._leaves_for[min(k, len(self)) - 1])
+        starts, step = self._chunks(len(queries))
+        for lo in starts:
+            block = queries[lo:lo + step]
+            centers = self._ball_distances(block)
+            bound = self._nearest_leaf_bound(block, centers, k)
+            # Only when that leaf is too small: the m nearest far edges together hold at least k points
+            loose = np.flatnonzero(bound == np.inf)
+            if len(loose):
+                bound[loose] = np.partition(centers[loose] + radii, m - 1, axis=1)[:, m - 1]
+            centers -= radii
+            query, point, chord = self._candidates(block, centers <= bound[:, None])
+            pairs = _smallest_per_group(query, chord, len(block), k)
+            found = pairs >= 0
+            rows[lo:lo + step][found] = point[pairs[found]]
+            chords[lo:lo + step][found] = chord[pairs[found]]
+        return rows, chord_to_km(chords)
+
+    def within(self, lonlat, km):
+        """(query, row, km) of every point within km of each query, by query then distance."""
+        queries = unit_vectors(lonlat)
+        radius = float(km_to_chord(km))
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        radii = np.asarray(self.radii)
+        found = []
+        starts, step = self._chunks(len(queries))
+        for lo in starts:
+            block = queries[lo:lo + step]
+            query, point, chord = self._candidates(block, self._ball_distances(block) - radii <= radius)
+            hit = chord <= radius
+            query, point, chord = query[hit], point[hit], chord[hit]
+            order = np.lexsort((chord, query))
+            found.append((lo + query[order], point[order], chord[order]))
+        query, point, chord = (np.concatenate(parts) for parts in zip(*found)) if found else ([], [], [])
+        return query, point, chord_to_km(chord)
+
+
+def nearest_stores(index, household_ids, lonlat, k=DEFAULT_K, max_km=None):
+    """Long table of each household's k nearest stores (within max_km if given)."""
+    rows, km = index.knn(lonlat, k)
+    found = rows >= 0
+    if max_km is not None:
+        found &= km <= max_km
+    household, rank = np.nonzero(found)
+    return pd.DataFrame({
+        'householdId': np.asarray(household_ids, dtype=object)[household],
+        'rank': rank + 1,
+        'storeId': np.asarray(index.ids)[rows[found]],
+        'km': km[found].round(3),
+    })
+
+
+def catchments(index, lonlat, radius_km=DEFAULT_RADIUS_KM):
+    """Per store: households within radius_km, and households for which it is the nearest store."""
+    query, point, _ = index.within(lonlat, radius_km)
+    nearest, _ = index.knn(lonlat, 1)
+    nearest = nearest[:, 0]
+    return pd.DataFrame({
+        'storeId': np.asarray(index.ids),
+        'within_radius': np.bincount(point, minlength=len(index)),
+        'nearest_for': np.bincount(nearest[nearest >= 0], minlength=len(index)),
+    }).sort_values('nearest_for', ascending=False, ignore_index=True)
+
+
+def _object_id(value):
+    from bson import ObjectId
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def preferred_store_updates(nearest, now=None):
+    """UpdateOne per household of a nearest_stores() table setting its preferredStores, nearest first.
+
+    Only households that still have no preferredStores are touched.
+    """
+    from pymongo import UpdateOne
+
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    updates = []
+    for household_id, stores in nearest.groupby('householdId', sort=False):
+        preferred = [{'storeId': _object_id(store_id), 'priority': int(rank), 'notes': f'{km:.1f} km away'}
+                     for store_id, rank, km in zip(stores['storeId'], stores['rank'], stores['km'])]
+        updates.append(UpdateOne(
+            {'_id': _object_id(household_id), '$or': [{'preferredStores': {'$exists': False}},
+                                                      {'preferredStores': {'$size': 0}}]},
+            {'$set': {'preferredStores': preferred, 'updatedAt': now}}))
+    return updates
+
+
+def synthetic_data(n_stores, n_households, n_cities=60, seed=0):
+    """Stores and households scattered around random North American cities."""
+    rng = np.random.default_rng(seed)
+    cities = np.column_stack([rng.uniform(-125, -65, n_cities), rng.uniform(25, 55, n_cities)])
+
+    def around(n, spread):
+        city = rng.integers(0, n_cities, n)
+        return cities[city] + rng.normal(0, spread, (n, 2))
+
+    stores = around(n_stores, 0.15)
+    households = around(n_households, 0.2)
+    return [f'store{j}' for j in range(n_stores)], stores, [f'household{h}' for h in range(n_households)], households
+
+
+def benchmark(n_stores, n_households, k=DEFAULT_K, radius_km=DEFAULT_RADIUS_KM):
+    store_ids, stores, household_ids, households = synthetic_data(n_stores, n_households)
+    start = time.perf_counter()
+    index = SphereIndex.build(store_ids, stores)
+    print(f"Indexed {len(index)} stores ({len(index.radii)} leaves) in {time.perf_counter() - start:.2f}s")
+
+    path = os.path.join('/tmp', f'geo_index_benchmark_{os.getpid()}')
+    index.save(path)
+    start = time.perf_counter()
+    index = SphereIndex.load(path)
+    print(f"Loaded the snapshot in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    rows, km = index.knn(households, k)
+    elapsed = time.perf_counter() - start
+    print(f"{k} nearest stores for {n_households} households in {elapsed:.2f}s "
+          f"({n_households / elapsed:,.0f} households/s)")
+
+    start = time.perf_counter()
+    query, _, _ = index.within(households, radius_km)
+    elapsed = time.perf_counter() - start
+    print(f"Stores within {radius_km} km of every household in {elapsed:.2f}s "
+          f"({len(query) / n_households:.1f} per household)")
+
+    sample = households[:2000]
+    start = time.perf_counter()
+    distances = haversine_km(sample, index.lonlat)
+    expected = np.sort(np.partition(distances, k - 1, axis=1)[:, :k], axis=1)
+    brute_sec = time.perf_counter() - start
+    same = np.allclose(expected, km[:len(sample)], atol=1e-6)
+    print(f"Pairwise haversine: {brute_sec / len(sample) * 1e6:.0f} us/household "
+          f"(~{brute_sec / len(sample) * n_households:,.1f}s for all); distances match: {same}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--index', default=INDEX_PATH, help='index snapshot directory')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGODB_DB_NAME', 'kitchenassist'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('build', help='index groceryStores and save the snapshot')
+    nearest_parser = commands.add_parser('nearest', help='nearest stores of every household')
+    nearest_parser.add_argument('--k', type=int, default=DEFAULT_K)
+    nearest_parser.add_argument('--household', help='this household _id only')
+    nearest_parser.add_argument('--max-km', type=float, help='ignore stores further away')
+    nearest_parser.add_argument('--write-preferred', action='store_true',
+                                help='set preferredStores of households that have none')
+    nearest_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    catchment_parser = commands.add_parser('catchment', help='households around every store')
+    catchment_parser.add_argument('--radius-km', type=float, default=DEFAULT_RADIUS_KM)
+    benchmark_parser = commands.add_parser('benchmark', help='time against pairwise haversine on synthetic data')
+    benchmark_parser.add_argument('--stores', type=int, default=20_000)
+    benchmark_parser.add_argument('--households', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'benchmark':
+        benchmark(args.stores, args.households)
+        return
+    from pymongo import MongoClient
+    client = MongoClient(args.uri)
+    try:
+        db = client[args.db]
+        if args.command == 'build' or not os.path.exists(os.path.join(args.index, 'meta.json')):
+            start = time.perf_counter()
+            index = SphereIndex.from_db(db)
+            index.save(args.index)
+            print(f"Indexed {len(index)} stores into {args.index} in {time.perf_counter() - start:.2f}s")
+            if args.command == 'build':
+                return
+        else:
+            index = SphereIndex.load(args.index)
+        query = {'_id': _object_id(args.household)} if getattr(args, 'household', None) else {}
+        household_ids, lonlat = coordinates(db.households.find(query, {'location.coordinates': 1}))
+        if args.command == 'catchment':
+            print(catchments(index, lonlat, args.radius_km).to_string(index=False, max_rows=100))
+            return
+        result = nearest_stores(index, household_ids, lonlat, args.k, args.max_km)
+        print(result.to_string(index=False, max_rows=100))
+        if args.write_preferred:
+            updates = preferred_store_updates(result)
+            modified = 0
+            for lo in range(0, len(updates), args.batch_size):
+                modified += db.households.bulk_write(updates[lo:lo + args.batch_size], ordered=False).modified_count
+            print(f"Set preferredStores of {modified} households")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Typed readers for the hammer product and raw price feeds.
+
+A bare pd.read_csv infers every column: vendor, units, brand and other come
+back as one Python string per row, and pd.to_datetime without a format
+guesses the nowtime layout row by row. The schema below declares each column
+instead, so only the requested columns are parsed, low-cardinality strings
+become categoricals (an integer code per row plus one copy of each distinct
+value), identifiers and prices stay text (no leading zeros lost to float, no
+column that is float in one chunk and object in the next) and nowtime is
+parsed with its fixed format.
+
+engine='pyarrow' parses with pyarrow's multi-threaded CSV reader, converting
+straight into the declared types; the default 'c' engine needs only pandas.
+
+Categorical columns of different chunks have different categories, so tables
+folded from several chunks should go through plain_strings() before they are
+written out.
+
+Usage:
+    python hammer_feed.py [--product PATH] [--raw PATH] [--engine pyarrow]
+"""
+import argparse
+import time
+
+import pandas as pd
+
+PRODUCT_PATH = 'hammer-5-csv/hammer-4-product.csv'
+RAW_PATH = 'hammer-5-csv/hammer-4-raw.csv'
+ENGINES = ('c', 'pyarrow')
+NOWTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Bytes per batch when streaming with the pyarrow engine (it batches by size, not rows)
+ARROW_BLOCK_BYTES = 8 * 1024 * 1024
+
+PRODUCT_SCHEMA = {
+    'id': 'int64',
+    'concatted': str,
+    'vendor': 'category',
+    'product_name': str,
+    'units': 'category',
+    'brand': 'category',
+    'detail_url': str,
+    'sku': str,
+    'upc': str,
+}
+RAW_SCHEMA = {
+    'nowtime': 'datetime',
+    # Text in the real feed (mixed with the odd non-numeric value); consumers parse them as needed
+    'current_price': 'category',
+    'old_price': 'category',
+    'price_per_unit': 'category',
+    'other': 'category',
+    'product_id': 'int64',
+}
+
+
+def _columns(schema, columns):
+    columns = list(schema) if columns is None else list(columns)
+    unknown = [c for c in columns if c not in schema]
+    if unknown:
+        raise ValueError(f"Columns not in the feed schema: {unknown}")
+    return columns
+
+
+def _pandas_dtypes(schema, columns):
+    """read_csv dtype= mapping; datetime columns are read as strings and parsed afterwards."""
+    return {c: str if schema[c] == 'datetime' else schema[c] for c in columns}
+
+
+def _parse_datetimes(frame, schema):
+    for column in frame.columns:
+        if schema[column] == 'datetime':
+            frame[column] = pd.to_datetime(frame[column], format=NOWTIME_FORMAT)
+    return frame
+
+
+def _arrow_options(schema, columns, block_size=None):
+    import pyarrow as pa
+    from pyarrow import csv
+
+    arrow_types = {
+        'int64': pa.int64(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'datetime': pa.timestamp('ns'),
+        str: pa.string(),
+    }
+    read_options = csv.ReadOptions(block_size=block_size) if block_size else csv.ReadOptions()
+    convert_options = csv.ConvertOptions(
+        include_columns=columns,
+        column_types={c: arrow_types[schema[c]] for c in columns},
+        timestamp_parsers=[NOWTIME_FORMAT],
+        # Empty fields are missing values, as with read_csv
+        strings_can_be_null=True,
+    )
+    return read_options, convert_options
+
+
+def _read(source, schema, columns, engine):
+    columns = _columns(schema, columns)
+    if engine == 'pyarrow':
+        from pyarrow import csv
+
+        read_options, convert_options = _arrow_options(schema, columns)
+        frame = csv.read_csv(source, read_options=read_options, convert_options=convert_options).to_pandas()
+        return frame[columns]
+    frame = pd.read_csv(source, usecols=columns, dtype=_pandas_dtypes(schema, columns))
+    return _parse_datetimes(frame, schema)[columns]
+
+
+def read_product_csv(path=PRODUCT_PATH, columns=None, engine='c'):
+    """The product catalog with declared dtypes; `columns` defaults to all of them."""
+    return _read(path, PRODUCT_SCHEMA, columns, engine)
+
+
+def read_raw_csv(source=RAW_PATH, columns=None, engine='c'):
+    """A whole raw feed (path or file-like, e.g. a byte range) with nowtime parsed."""
+    return _read(source, RAW_SCHEMA, columns, engine)
+
+
+def iter_raw_csv(path=RAW_PATH, chunksize=500_000, columns=None, engine='c'):
+    """Stream the raw feed as typed frames of `chunksize` rows (ARROW_BLOCK_BYTES with pyarrow)."""
+    columns = _columns(RAW_SCHEMA, columns)
+    if engine == 'pyarrow':
+        from pyarrow import csv
+
+        read_options, convert_options = _arrow_options(RAW_SCHEMA, columns, ARROW_BLOCK_BYTES)
+        with csv.open_csv(path, read_options=read_options, convert_options=convert_options) as reader:
+            for batch in reader:
+                yield batch.to_pandas()[columns]
+        return
+    chunks = pd.read_csv(path, usecols=columns, dtype=_pandas_dtypes(RAW_SCHEMA, columns), chunksize=chunksize)
+    for chunk in chunks:
+        yield _parse_datetimes(chunk, RAW_SCHEMA)[columns]
+
+
+def plain_strings(frame):
+    """Categorical columns back to their category values' dtype, e.g. before writing output."""
+    categorical = [c for c in frame.columns if isinstance(frame[c].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return frame
+    return frame.astype({c: frame[c].cat.categories.dtype for c in categorical})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--product', default=PRODUCT_PATH)
+    parser.add_argument('--raw', default=RAW_PATH)
+    parser.add_argument('--engine', choices=ENGINES, default='c')
+    args = parser.parse_args(argv)
+    for name, read, path in (('product', read_product_csv, args.product), ('raw', read_raw_csv, args.raw)):
+        started = time.perf_counter()
+        frame = read(path, engine=args.engine)
+        elapsed = time.perf_counter() - started
+        print(f"{name}: {len(frame)} rows in {elapsed:.2f}s, "
+              f"{frame.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+        print(frame.dtypes.to_string())
+
+
+if __name__ == "__main__":
+    main()
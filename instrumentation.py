@@ -0,0 +1,337 @@
+"""Lightweight stage instrumentation: named spans, counters and latency histograms.
+
+Off unless enabled, in which case every call below is a global check and a
+return (span() hands back one shared no-op context manager). Enable it with
+PANTRYPILOT_METRICS=<path> in the environment, a script's --metrics flag, or
+enable(path). The collected metrics are written to the path at exit, as
+Prometheus text when it ends in .prom or .txt and as JSON otherwise.
+
+    with span('parse_csv', rows=len(chunk)):
+        ...
+    for chunk in timed_iter(pd.read_csv(path, chunksize=n), 'read_csv'):
+        ...
+    observe('pipeline_run_seconds', latency, pipeline=saved_item_id)
+
+Spans aggregate by name and labels: calls, wall and CPU seconds (total and
+slowest call), rows (so rows/sec) and the process's peak RSS when the span
+ended. Histograms use fixed latency buckets.
+
+Usage:
+    python instrumentation.py --benchmark
+"""
+import argparse
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+ENV_VAR = 'PANTRYPILOT_METRICS'
+METRIC_PREFIX = 'pantrypilot'
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_RSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+
+def _peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_SCALE
+
+
+class SpanStats:
+    __slots__ = ('calls', 'wall', 'cpu', 'max_wall', 'rows', 'peak_rss')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.rows = 0
+        self.peak_rss = 0
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Metrics collected while instrumentation is enabled; safe to update from threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def record_span(self, key, wall, cpu, rows):
+        peak_rss = _peak_rss_bytes()
+        with self.lock:
+            stats = self.spans.get(key)
+            if stats is None:
+                stats = self.spans[key] = SpanStats()
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.max_wall = max(stats.max_wall, wall)
+            stats.rows += rows
+            stats.peak_rss = max(stats.peak_rss, peak_rss)
+
+    def add(self, key, value):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key, value):
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def to_json(self):
+        def labelled(key):
+            name, labels = key
+            return {'name': name, 'labels': dict(labels)}
+
+        with self.lock:
+            spans = [{
+                **labelled(key),
+                'calls': s.calls,
+                'wall_seconds': round(s.wall, 6),
+                'cpu_seconds': round(s.cpu, 6),
+                'max_wall_seconds': round(s.max_wall, 6),
+                'rows': s.rows,
+                'rows_per_second': round(s.rows / s.wall, 1) if s.rows and s.wall else None,
+                'peak_rss_mb': round(s.peak_rss / 1e6, 1),
+            } for key, s in self.spans.items()]
+            counters = [{**labelled(key), 'value': value} for key, value in self.counters.items()]
+            histograms = [{
+                **labelled(key),
+                'buckets': {str(le): count for le, count in zip(LATENCY_BUCKETS + ('+Inf',), h.counts)},
+                'sum': round(h.sum, 6),
+                'count': h.count,
+            } for key, h in self.histograms.items()]
+        return {'spans': spans, 'counters': counters, 'histograms': histograms}
+
+    def to_prometheus(self):
+        lines = []
+
+        def metric(name, kind, samples):
+            full_name = f'{METRIC_PREFIX}_{name}'
+            lines.append(f'# TYPE {full_name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{full_name}{suffix}{_prometheus_labels(labels)} {value}')
+
+        with self.lock:
+            spans = list(self.spans.items())
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+
+        def span_labels(key):
+            name, labels = key
+            return (('span', name),) + labels
+
+        metric('span_calls_total', 'counter', [('', span_labels(k), s.calls) for k, s in spans])
+        metric('span_wall_seconds_total', 'counter', [('', span_labels(k), repr(s.wall)) for k, s in spans])
+        metric('span_cpu_seconds_total', 'counter', [('', span_labels(k), repr(s.cpu)) for k, s in spans])
+        metric('span_max_wall_seconds', 'gauge', [('', span_labels(k), repr(s.max_wall)) for k, s in spans])
+        metric('span_rows_total', 'counter', [('', span_labels(k), s.rows) for k, s in spans if s.rows])
+        metric('span_peak_rss_bytes', 'gauge', [('', span_labels(k), s.peak_rss) for k, s in spans])
+        # One TYPE line per metric name, followed by all of its label sets
+        by_name = {}
+        for (name, labels), value in counters:
+            by_name.setdefault(name, []).append(('', labels, value))
+        for name, samples in by_name.items():
+            metric(f'{name}_total', 'counter', samples)
+        by_name = {}
+        for (name, labels), h in histograms:
+            samples = by_name.setdefault(name, [])
+            cumulative = 0
+            for le, count in zip(LATENCY_BUCKETS + ('+Inf',), h.counts):
+                cumulative += count
+                samples.append(('_bucket', labels + (('le', str(le)),), cumulative))
+            samples += [('_sum', labels, repr(h.sum)), ('_count', labels, h.count)]
+        for name, samples in by_name.items():
+            metric(name, 'histogram', samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_rows(self, rows):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times one block: wall clock, process CPU time and rows handled."""
+
+    __slots__ = ('registry', 'key', 'rows', 'started', 'cpu_started')
+
+    def __init__(self, registry, key, rows):
+        self.registry = registry
+        self.key = key
+        self.rows = rows
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.record_span(self.key, time.perf_counter() - self.started,
+                                  time.process_time() - self.cpu_started, self.rows)
+        return False
+
+    def add_rows(self, rows):
+        """Count rows discovered inside the span (e.g. the length of what it produced)."""
+        self.rows += rows
+
+
+_registry = None
+_output_path = None
+
+
+def enabled():
+    return _registry is not None
+
+
+def enable(path=None):
+    """Start collecting; metrics are written to path (if any) at exit. Returns the registry."""
+    global _registry, _output_path
+    if _registry is None:
+        _registry = Registry()
+        atexit.register(dump)
+    if path:
+        _output_path = path
+    return _registry
+
+
+def span(name, rows=0, **labels):
+    """Context manager timing a named stage; a shared no-op when disabled."""
+    if _registry is None:
+        return _NOOP_SPAN
+    return Span(_registry, _key(name, labels), rows)
+
+
+def add(name, value=1, **labels):
+    """Increment a counter."""
+    if _registry is not None:
+        _registry.add(_key(name, labels), value)
+
+
+def observe(name, seconds, **labels):
+    """Record a latency in the histogram for name + labels."""
+    if _registry is not None:
+        _registry.observe(_key(name, labels), seconds)
+
+
+def timed_iter(iterable, name, **labels):
+    """Yield from iterable, timing each next() as a span with rows = len(item) when it has one."""
+    if _registry is None:
+        return iter(iterable)
+    return _timed_iter(iterable, name, labels)
+
+
+def _timed_iter(iterable, name, labels):
+    iterator = iter(iterable)
+    key = _key(name, labels)
+    while True:
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        rows = len(item) if hasattr(item, '__len__') else 0
+        _registry.record_span(key, time.perf_counter() - started, time.process_time() - cpu_started, rows)
+        yield item
+
+
+def dump(path=None):
+    """Write the collected metrics to path (default: the enabled path); no-op when disabled."""
+    path = path or _output_path
+    if _registry is None or not path:
+        return
+    text = _registry.to_prometheus() if path.endswith(('.prom', '.txt')) else json.dumps(_registry.to_json(), indent=2)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+if os.getenv(ENV_VAR):
+    enable(os.getenv(ENV_VAR))
+
+
+def benchmark(n_calls=1_000_000):
+    """Per-call cost of span() disabled and enabled, against an empty loop."""
+    global _registry
+    saved = _registry
+
+    def loop(with_span):
+        started = time.perf_counter()
+        for _ in range(n_calls):
+            if with_span:
+                with span('benchmark'):
+                    pass
+        return time.perf_counter() - started
+
+    try:
+        _registry = None
+        bare = loop(False)
+        disabled = loop(True)
+        _registry = Registry()
+        on = loop(True)
+    finally:
+        _registry = saved
+    print(f"{n_calls} spans: disabled {(disabled - bare) / n_calls * 1e9:.0f} ns/call, "
+          f"enabled {(on - bare) / n_calls * 1e9:.0f} ns/call")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--benchmark', action='store_true', help='measure the per-span overhead')
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
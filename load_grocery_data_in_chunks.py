@@ -1,45 +1,348 @@
+"""Reduce the hammer raw price feed to the latest price per product and join it onto the product catalog.
+
+The raw feed is streamed once in fixed-size chunks. Each chunk is reduced to its
+latest row per product_id and folded into a running "latest by product" table,
+so memory stays bounded by the chunk size plus one row per product.
+
+With --workers N the feed is split into byte ranges aligned to line boundaries
+and each range is reduced in a separate process. Partial results are folded in
+file order, which gives the same output as the serial path.
+
+The result is written as Parquet by default so downstream steps can load only
+the columns they need. --format json streams the same records to the legacy
+indent=4 JSON file in batches instead of building one list of dicts.
+
+With --incremental the latest-by-product table and the byte offset consumed
+are persisted between runs, and only rows appended to the feed since the last
+run are read.
+
+Both feeds are read with the typed schema in hammer_feed.py (only the needed
+raw columns, categoricals for low-cardinality strings, a fixed nowtime
+format); --engine pyarrow parses them with pyarrow's CSV reader instead.
+
+--metrics PATH (or PANTRYPILOT_METRICS) writes per-stage timings, rows/sec
+and peak RSS to PATH at exit; see instrumentation.py.
+"""
+import argparse
+import io
 import json
-import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 
-# Load the CSV files from hammer-5-csv folder
-product_df = pd.read_csv('hammer-5-csv/hammer-4-product.csv')
-raw_path = 'hammer-5-csv/hammer-4-raw.csv'
+import instrumentation
+from hammer_feed import ENGINES, iter_raw_csv, plain_strings, read_product_csv, read_raw_csv
+from instrumentation import span, timed_iter
+
+PRODUCT_PATH = 'hammer-5-csv/hammer-4-product.csv'
+RAW_PATH = 'hammer-5-csv/hammer-4-raw.csv'
+OUTPUT_PATH = 'latest_grocery_data.parquet'
+JSON_OUTPUT_PATH = 'latest_grocery_data.json'
+# Latest row per product plus a <path>.json sidecar with the consumed byte offset
+STATE_PATH = 'latest_raw_state.parquet'
+CHUNKSIZE = 500_000
+# Upper bound on the bytes a worker parses at once
+RANGE_BYTES = 64 * 1024 * 1024
+# Ranges per worker, so a slow range doesn't leave the other cores idle
+RANGES_PER_WORKER = 4
+# Rows converted to dicts at a time when streaming the JSON export
+JSON_BATCH_ROWS = 10_000
+
+# Columns carried from the raw feed into the final records
+LATEST_COLUMNS = ['product_id', 'current_price', 'old_price', 'price_per_unit', 'other']
+RAW_COLUMNS = ['nowtime'] + LATEST_COLUMNS
+
+
+def reduce_latest(frame):
+    """Keep the row with the latest nowtime for each product_id.
+
+    Ties keep the first row in frame order, so folding a chunk into the running
+    table (running rows first) keeps the earliest row seen in the file.
+    """
+    with span('groupby_latest', rows=len(frame)):
+        latest_indices = frame.groupby('product_id')['nowtime'].idxmax()
+        return frame.loc[latest_indices]
+
+
+def fold_latest(running, chunk_latest):
+    """Fold a chunk's latest rows into the running table."""
+    if running is None:
+        return chunk_latest
+    return reduce_latest(pd.concat([running, chunk_latest], ignore_index=True))
+
+
+def stream_latest_raw(raw_path=RAW_PATH, chunksize=CHUNKSIZE, engine='c'):
+    """Single pass over the raw feed returning the latest row per product."""
+    running = None
+    n_rows = 0
+    n_chunks = 0
+    chunks = iter_raw_csv(raw_path, chunksize, RAW_COLUMNS, engine)
+    for chunk in timed_iter(chunks, 'read_csv'):
+        chunk_latest = reduce_latest(chunk)
+        with span('fold_latest', rows=len(chunk_latest)):
+            running = fold_latest(running, chunk_latest)
+        n_rows += len(chunk)
+        n_chunks += 1
+        print(f"Chunk {n_chunks}: {n_rows} rows read, {len(running)} products tracked")
+    if running is None:
+        return pd.DataFrame(columns=RAW_COLUMNS)
+    return running
+
+
+def split_byte_ranges(raw_path, n_ranges, start=None, end=None):
+    """Split raw feed bytes [start, end) into (start, end) ranges starting on line boundaries.
+
+    start defaults to the first byte after the header and end to the file size.
+    Assumes no quoted field contains a newline, which holds for the hammer feed.
+    """
+    with open(raw_path, 'rb') as f:
+        if start is None:
+            f.readline()
+            start = f.tell()
+        if end is None:
+            end = os.path.getsize(raw_path)
+        step = max(1, (end - start) // max(1, n_ranges))
+        boundaries = [start]
+        for target in range(start + step, end, step):
+            if target <= boundaries[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            offset = f.tell()
+            if offset >= end:
+                break
+            if offset > boundaries[-1]:
+                boundaries.append(offset)
+        boundaries.append(end)
+    return [(lo, hi) for lo, hi in zip(boundaries, boundaries[1:]) if hi > lo]
+
+
+def read_raw_header(raw_path):
+    with open(raw_path, 'rb') as f:
+        return f.readline()
+
+
+def complete_lines_end(raw_path, settled_size=None):
+    """Byte offset just past the last complete row of the feed.
+
+    A final row without a trailing newline may still be being appended, so it is
+    left for a later run. Once the file is still `settled_size` bytes long, i.e.
+    it has not grown since the run that first saw that row, EOF ends the row.
+    """
+    size = os.path.getsize(raw_path)
+    if size == settled_size:
+        return size
+    with open(raw_path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            block = min(pos, 1 << 16)
+            f.seek(pos - block)
+            newline = f.read(block).rfind(b'\n')
+            if newline >= 0:
+                return pos - block + newline + 1
+            pos -= block
+    return 0
+
+
+def reduce_byte_range(raw_path, header, start, end, engine='c'):
+    """Worker: parse one byte range of the raw feed and reduce it to its latest rows."""
+    with open(raw_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    frame = read_raw_csv(io.BytesIO(header + data), RAW_COLUMNS, engine)
+    return reduce_latest(frame)
+
+
+def _reduce_byte_range(args):
+    return reduce_byte_range(*args)
+
+
+def reduce_ranges(raw_path, ranges, workers=1, running=None, engine='c'):
+    """Fold the latest rows of each byte range, in file order, into `running`."""
+    header = read_raw_header(raw_path)
+    tasks = [(raw_path, header, lo, hi, engine) for lo, hi in ranges]
+    if workers > 1:
+        print(f"Reducing {len(ranges)} byte ranges with {workers} workers")
+        pool = ProcessPoolExecutor(max_workers=workers)
+        # map yields in submission order, so folding keeps the earliest row on ties
+        partials = pool.map(_reduce_byte_range, tasks)
+    else:
+        pool = None
+        partials = map(_reduce_byte_range, tasks)
+    try:
+        # Worker-side stages run in other processes; here the wait for each range is what shows
+        for i, partial in enumerate(timed_iter(partials, 'reduce_range_wait'), start=1):
+            with span('fold_latest', rows=len(partial)):
+                running = fold_latest(running, partial)
+            print(f"Range {i}/{len(ranges)}: {len(running)} products tracked")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if running is None:
+        return pd.DataFrame(columns=RAW_COLUMNS)
+    return running
+
+
+def parallel_latest_raw(raw_path=RAW_PATH, workers=os.cpu_count(), engine='c'):
+    """Reduce the raw feed with a process pool over line-aligned byte ranges."""
+    size = os.path.getsize(raw_path)
+    n_ranges = max(workers * RANGES_PER_WORKER, -(-size // RANGE_BYTES))
+    ranges = split_byte_ranges(raw_path, n_ranges)
+    return reduce_ranges(raw_path, ranges, workers, engine=engine)
+
+
+def load_state(state_path, raw_path):
+    """Load the persisted latest-by-product table, consumed byte offset and feed size.
+
+    Returns (None, None, None) when there is no usable state, e.g. the feed was
+    replaced by a file with a different header or truncated below the offset.
+    """
+    meta_path = state_path + '.json'
+    if not (os.path.exists(state_path) and os.path.exists(meta_path)):
+        return None, None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    header = read_raw_header(raw_path).decode('utf-8')
+    if meta.get('header') != header or meta.get('offset', 0) > os.path.getsize(raw_path):
+        print(f"State in {state_path} does not match {raw_path}; rebuilding from scratch")
+        return None, None, None
+    return pd.read_parquet(state_path), meta['offset'], meta.get('size')
+
+
+def save_state(state_path, raw_path, latest_raw, offset, size=None):
+    """Persist the state atomically so an interrupted run never leaves a torn watermark."""
+    tmp_path = state_path + '.tmp'
+    latest_raw[RAW_COLUMNS].to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, state_path)
+    meta = {
+        'raw_path': raw_path,
+        'header': read_raw_header(raw_path).decode('utf-8'),
+        'offset': offset,
+        # Feed size seen by this run; an unterminated last row is read once it stops growing
+        'size': size,
+    }
+    with open(state_path + '.json.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(state_path + '.json.tmp', state_path + '.json')
+
+
+def incremental_latest_raw(raw_path=RAW_PATH, state_path=STATE_PATH, workers=1, engine='c'):
+    """Fold only the rows appended since the last run into the persisted state.
+
+    Rows are only ever appended with newer nowtime values, so the per-product
+    state plus the consumed byte offset is enough to resume. The first run (or a
+    run whose state doesn't match the feed) scans the whole file. A last row with
+    no trailing newline is picked up by the first run that finds the feed the
+    same size as the previous run did.
+    """
+    running, offset, settled_size = load_state(state_path, raw_path)
+    size = os.path.getsize(raw_path)
+    end = complete_lines_end(raw_path, settled_size if running is not None else None)
+    if running is not None and offset >= end:
+        print(f"No new rows in {raw_path} since byte {offset}")
+        if size != settled_size:
+            save_state(state_path, raw_path, running, offset, size)
+        return running
+    if running is not None:
+        print(f"Resuming {raw_path} from byte {offset} ({end - offset} new bytes)")
+    n_ranges = max(workers * RANGES_PER_WORKER, -(-(end - (offset or 0)) // RANGE_BYTES))
+    ranges = split_byte_ranges(raw_path, n_ranges, start=offset, end=end)
+    latest_raw = reduce_ranges(raw_path, ranges, workers, running, engine)
+    save_state(state_path, raw_path, latest_raw, end, size)
+    return latest_raw
+
+
+def build_final(product_df, latest_raw):
+    """Inner-join the latest raw prices onto the product catalog.
+
+    Categorical columns from the typed readers come back as plain strings, so
+    the output has the same types whichever reader and chunking produced it.
+    """
+    with span('merge', rows=len(latest_raw)):
+        return plain_strings(product_df.merge(
+            latest_raw[LATEST_COLUMNS],
+            left_on='id',
+            right_on='product_id',
+            how='inner'
+        ))
+
+
+def write_parquet(final_df, path=OUTPUT_PATH):
+    with span('write_parquet', rows=len(final_df)):
+        final_df.to_parquet(path, index=False)
+
+
+def write_json(final_df, path=JSON_OUTPUT_PATH, batch_rows=JSON_BATCH_ROWS):
+    """Stream records to a JSON array, byte-identical to json.dump(records, f, indent=4)."""
+    with open(path, 'w') as f:
+        if final_df.empty:
+            f.write('[]')
+            return
+        f.write('[\n')
+        first = True
+        for start in range(0, len(final_df), batch_rows):
+            with span('replace_nan', rows=min(batch_rows, len(final_df) - start)):
+                batch = final_df.iloc[start:start + batch_rows].replace({np.nan: None})
+                records = batch.to_dict('records')
+            with span('json_dump', rows=len(records)):
+                for record in records:
+                    if not first:
+                        f.write(',\n')
+                    first = False
+                    f.write('    ' + json.dumps(record, indent=4).replace('\n', '\n    '))
+        f.write('\n]')
 
-with open(raw_path, 'r', encoding='utf-8') as f:
-    total_rows = max(0, sum(1 for _ in f) - 1)
 
-chunksize = max(1, math.ceil(total_rows / 10))
-estimated_chunks = max(1, math.ceil(total_rows / chunksize))
-print(f"Processing {total_rows} rows from {raw_path} in {estimated_chunks} chunks (chunksize={chunksize})")
-latest_by_product = {}
+def load_latest_grocery_data(path=OUTPUT_PATH, columns=None):
+    """Load the reduced catalog, reading only `columns` when given."""
+    return pd.read_parquet(path, columns=columns)
 
-for chunk in pd.read_csv(raw_path, chunksize=chunksize):
-    chunk['nowtime'] = pd.to_datetime(chunk['nowtime'])
-    latest_indices = chunk.groupby('product_id')['nowtime'].idxmax()
-    latest_chunk = chunk.loc[latest_indices]
 
-    for _, row in latest_chunk.iterrows():
-        product_id = row['product_id']
-        existing = latest_by_product.get(product_id)
-        if existing is None or row['nowtime'] > existing['nowtime']:
-            latest_by_product[product_id] = row
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes for the raw feed reduction (1 = serial streaming)')
+    parser.add_argument('--format', choices=['parquet', 'json'], default='parquet',
+                        help='output format (json is the legacy indent=4 export)')
+    parser.add_argument('--incremental', action='store_true',
+                        help=f'only read rows appended since the last run (state in {STATE_PATH})')
+    parser.add_argument('--state', default=STATE_PATH,
+                        help='state file used by --incremental')
+    parser.add_argument('--output', default=None,
+                        help=f'output path (default: {OUTPUT_PATH} or {JSON_OUTPUT_PATH})')
+    parser.add_argument('--metrics', default=None,
+                        help='write stage metrics here at exit (.prom/.txt for Prometheus text, else JSON)')
+    parser.add_argument('--engine', choices=ENGINES, default='c',
+                        help='CSV parser for both feeds (pyarrow is multi-threaded)')
+    return parser.parse_args(argv)
 
-latest_raw = pd.DataFrame(latest_by_product.values())
 
-final_df = product_df.merge(
-    latest_raw[['product_id', 'current_price', 'old_price', 'price_per_unit', 'other']], 
-    left_on='id', 
-    right_on='product_id', 
-    how='inner'
-)
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        instrumentation.enable(args.metrics)
+    with span('read_product_csv'):
+        product_df = read_product_csv(PRODUCT_PATH, engine=args.engine)
+    with span('reduce_raw'):
+        if args.incremental:
+            latest_raw = incremental_latest_raw(RAW_PATH, args.state, args.workers, args.engine)
+        elif args.workers > 1:
+            latest_raw = parallel_latest_raw(RAW_PATH, args.workers, args.engine)
+        else:
+            print(f"Processing {RAW_PATH} in chunks of {CHUNKSIZE} rows")
+            latest_raw = stream_latest_raw(RAW_PATH, CHUNKSIZE, args.engine)
 
-result = final_df.to_dict('records')
-final_df_clean = final_df.replace({np.nan: None})
+    final_df = build_final(product_df, latest_raw)
+    if args.format == 'json':
+        output_path = args.output or JSON_OUTPUT_PATH
+        write_json(final_df, output_path)
+    else:
+        output_path = args.output or OUTPUT_PATH
+        write_parquet(final_df, output_path)
+    print(f"Saved {len(final_df)} records to {output_path}")
 
-result = final_df_clean.to_dict('records')
 
-with open('latest_grocery_data.json', 'w') as f:
-    json.dump(result, f, indent=4)
+if __name__ == "__main__":
+    main()
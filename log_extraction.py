@@ -0,0 +1,321 @@
+"""Single-pass extraction of recipes and item/store JSONs from Gumloop run logs.
+
+Shared by article-recipe.py, youtube-recipe.py, extract_item_jsons.py and the
+vision scripts. Each `log` entry is routed through a prefix dispatch table:
+
+- "__standard__: Key item '<key>' extracted successfully: <value>" feeds the
+  recipe fields (later entries for the same key win);
+- "__standard__: Successfully created JSON: <json>" yields an item/store object.
+
+A run response can be passed as a dict, or as a path / binary file of
+run_response.json. Files are streamed with ijson when it is installed, so a
+multi-MB response is never materialized. Without ijson it falls back to
+json.load.
+
+Usage:
+    python log_extraction.py --benchmark [--entries N]
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+
+try:
+    import ijson
+except ImportError:  # optional: streaming parse of run_response.json files
+    ijson = None
+
+STANDARD_PREFIX = "__standard__: "
+KEY_ITEM_PREFIX = "Key item '"
+KEY_ITEM_INFIX = "' extracted successfully: "
+CREATED_JSON_PREFIX = "Successfully created JSON: "
+
+NUTRITIONAL_FIELDS = [
+    "totalCalories", "caloriesPerServing", "protein",
+    "carbs", "fat", "fiber", "sugar", "sodium"
+]
+
+
+def clean_value(value):
+    """Replace 'Unknown' or 'N/A' with empty string"""
+    if isinstance(value, str):
+        cleaned = value.strip()
+        if cleaned.lower() in ['unknown', 'n/a', 'na']:
+            return ""
+        return cleaned
+    return value
+
+
+class LogExtraction:
+    """What one pass over a run log found."""
+
+    def __init__(self):
+        self.key_items = {}
+        self.created_jsons = []
+
+    def recipe(self):
+        return build_recipe(self.key_items)
+
+
+def _on_key_item(rest, extraction):
+    quote = rest.find("'")
+    if quote <= 0 or not rest.startswith(KEY_ITEM_INFIX, quote):
+        return
+    value = rest[quote + len(KEY_ITEM_INFIX):]
+    if value:
+        extraction.key_items[rest[:quote]] = clean_value(value)
+
+
+def _on_created_json(rest, extraction):
+    try:
+        extraction.created_jsons.append(json.loads(rest.strip()))
+    except json.JSONDecodeError:
+        pass
+
+
+# Handlers for the text after STANDARD_PREFIX, keyed by the prefix they own
+LOG_HANDLERS = (
+    (KEY_ITEM_PREFIX, _on_key_item),
+    (CREATED_JSON_PREFIX, _on_created_json),
+)
+
+# Dispatch on the first few characters after STANDARD_PREFIX, so most entries
+# (node progress and other noise) cost one slice and one dict miss
+_DISPATCH_WIDTH = 3
+_DISPATCH = {
+    prefix[:_DISPATCH_WIDTH]: (STANDARD_PREFIX + prefix, handler)
+    for prefix, handler in LOG_HANDLERS
+}
+assert len(_DISPATCH) == len(LOG_HANDLERS), "LOG_HANDLERS prefixes must differ in their first characters"
+
+
+def iter_log_entries(source):
+    """Yield `log` entries from a run response dict, a run_response.json path, or a binary file."""
+    if isinstance(source, dict):
+        yield from source.get("log", [])
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from iter_log_entries(f)
+        return
+    if ijson is not None:
+        yield from ijson.items(source, "log.item")
+    else:
+        yield from json.load(source).get("log", [])
+
+
+def scan_log(source):
+    """One pass over the log, dispatching each entry on its prefix."""
+    extraction = LogExtraction()
+    lo = len(STANDARD_PREFIX)
+    hi = lo + _DISPATCH_WIDTH
+    dispatch = _DISPATCH
+    for entry in iter_log_entries(source):
+        if not isinstance(entry, str):
+            continue
+        route = dispatch.get(entry[lo:hi])
+        if route is not None and entry.startswith(route[0]):
+            route[1](entry[len(route[0]):], extraction)
+    return extraction
+
+
+def _string_field(value):
+    return value
+
+
+def _int_field(value):
+    return int(value)
+
+
+def _tags_field(value):
+    tags = json.loads(value)
+    # Clean tags array - remove empty strings, "Unknown", and "N/A"
+    cleaned_tags = [clean_value(tag) for tag in tags if clean_value(tag)]
+    if not cleaned_tags:
+        raise ValueError("no tags")
+    return cleaned_tags
+
+
+def _ingredients_field(value):
+    ingredients = json.loads(value)
+    for ingredient in ingredients:
+        for key in ["itemId", "unit", "notes"]:
+            if key in ingredient:
+                ingredient[key] = clean_value(ingredient[key])
+
+        # Convert quantity strings to numbers where possible
+        if "quantity" in ingredient and ingredient["quantity"]:
+            cleaned_qty = clean_value(str(ingredient["quantity"]))
+            if cleaned_qty:
+                try:
+                    ingredient["quantity"] = float(cleaned_qty)
+                except (ValueError, TypeError):
+                    ingredient["quantity"] = ""
+            else:
+                ingredient["quantity"] = ""
+    return ingredients
+
+
+def _instructions_field(value):
+    instructions = json.loads(value)
+    for instruction in instructions:
+        if "instruction" in instruction:
+            instruction["instruction"] = clean_value(instruction["instruction"])
+        if "imageUrl" in instruction:
+            instruction["imageUrl"] = clean_value(instruction["imageUrl"])
+    return instructions
+
+
+# Recipe fields in output order; a converter raising ValueError/TypeError drops the field
+RECIPE_FIELDS = (
+    ("name", _string_field),
+    ("description", _string_field),
+    ("imageUrl", _string_field),
+    ("sourceUrl", _string_field),
+    ("sourceType", _string_field),
+    ("prepTime", _int_field),
+    ("cookTime", _int_field),
+    ("servings", _int_field),
+    ("difficulty", _string_field),
+    ("cuisine", _string_field),
+    ("tags", _tags_field),
+    ("ingredients", _ingredients_field),
+    ("instructions", _instructions_field),
+)
+
+
+def build_recipe(extracted_data):
+    """Build clean recipe JSON according to schema from the extracted key items."""
+    recipe = {}
+    for field, convert in RECIPE_FIELDS:
+        value = extracted_data.get(field)
+        if not value:
+            continue
+        try:
+            recipe[field] = convert(value)
+        except (ValueError, TypeError):
+            # json.JSONDecodeError is a ValueError
+            pass
+
+    nutritional_info = {}
+    for field in NUTRITIONAL_FIELDS:
+        if field in extracted_data:
+            try:
+                value = float(extracted_data[field])
+                if value > 0:  # Only include non-zero values
+                    nutritional_info[field] = value
+            except (ValueError, TypeError):
+                pass
+    if nutritional_info:
+        recipe["nutritionalInfo"] = nutritional_info
+    return recipe
+
+
+def extract_recipe_from_logs(run_response):
+    """Extract and format recipe data from Gumloop log entries"""
+    return scan_log(run_response).recipe()
+
+
+def extract_created_jsons(run_response):
+    """Parsed objects from the 'Successfully created JSON' log entries, in log order."""
+    return scan_log(run_response).created_jsons
+
+
+def build_combined(all_objs):
+    """Build combined JSON: store is always the last JSON created; the rest are items."""
+    store = all_objs[-1] if all_objs else {}
+    items = all_objs[:-1]
+    return {"store": store, "items": items}
+
+
+def _legacy_scan(run_response):
+    """The per-script scan this module replaced: regex per entry after json.load. For benchmarking."""
+    import re
+    extracted_data = {}
+    all_objs = []
+    for log_entry in run_response.get("log", []):
+        if "__standard__: Key item" in log_entry and "extracted successfully:" in log_entry:
+            match = re.match(r"__standard__: Key item '([^']+)' extracted successfully: (.+)", log_entry, re.DOTALL)
+            if match:
+                extracted_data[match.group(1)] = clean_value(match.group(2))
+    prefix = STANDARD_PREFIX + CREATED_JSON_PREFIX
+    for entry in run_response.get("log", []):
+        if isinstance(entry, str) and entry.startswith(prefix):
+            try:
+                all_objs.append(json.loads(entry[len(prefix):].strip()))
+            except json.JSONDecodeError:
+                pass
+    return extracted_data, all_objs
+
+
+def synthetic_run_response(n_entries, seed=0):
+    """A run response whose log mixes noise, recipe key items and created JSONs."""
+    rng = random.Random(seed)
+    log = []
+    for i in range(n_entries):
+        roll = rng.random()
+        if roll < 0.05:
+            ingredients = [{"itemId": f"item {j}", "quantity": str(rng.randint(1, 5)), "unit": "cup", "notes": "N/A"}
+                           for j in range(rng.randint(3, 15))]
+            log.append(f"__standard__: Key item 'ingredients' extracted successfully: {json.dumps(ingredients)}")
+        elif roll < 0.10:
+            key = rng.choice(["name", "description", "prepTime", "servings", "tags", "protein"])
+            value = json.dumps(["easy", "Unknown", "dinner"]) if key == "tags" else str(rng.randint(1, 60))
+            log.append(f"__standard__: Key item '{key}' extracted successfully: {value}")
+        elif roll < 0.20:
+            obj = {"name": f"Product {i}", "price": round(rng.uniform(1, 20), 2), "quantity": rng.randint(1, 3)}
+            log.append(f"__standard__: Successfully created JSON: {json.dumps(obj)}")
+        else:
+            log.append(f"__standard__: Node {i} finished in {rng.random():.3f}s " + "x" * rng.randint(20, 400))
+    return {"state": "DONE", "outputs": {}, "log": log}
+
+
+def _measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def benchmark(n_entries, path="bench_run_response.json"):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(synthetic_run_response(n_entries), f)
+    size_mb = os.path.getsize(path) / 1e6
+
+    def legacy():
+        with open(path, encoding="utf-8") as f:
+            return _legacy_scan(json.load(f))
+
+    def streamed():
+        extraction = scan_log(path)
+        return extraction.key_items, extraction.created_jsons
+
+    (old_items, old_objs), old_sec, old_peak = _measure(legacy)
+    (new_items, new_objs), new_sec, new_peak = _measure(streamed)
+    os.remove(path)
+    assert (old_items, old_objs) == (new_items, new_objs), "scan_log disagrees with the legacy scan"
+
+    mode = "ijson" if ijson is not None else "json.load fallback"
+    print(f"{n_entries} log entries ({size_mb:.1f} MB), streaming via {mode}")
+    print(f"  legacy json.load + regex: {old_sec:7.3f}s  peak {old_peak / 1e6:7.1f} MB")
+    print(f"  scan_log:                 {new_sec:7.3f}s  peak {new_peak / 1e6:7.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run log extraction benchmark")
+    parser.add_argument("--benchmark", action="store_true", help="compare against the legacy per-script scan")
+    parser.add_argument("--entries", type=int, default=200_000)
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark(args.entries)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
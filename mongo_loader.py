@@ -0,0 +1,301 @@
+"""Bulk-load the reduced hammer catalog into the items and storeInventory collections.
+
+Records are streamed from latest_grocery_data (Parquet, or the legacy JSON
+export) and mapped onto the SCHEMA.txt shapes:
+
+- items: upserted by name (as seed-db.js dedupes them), with brand, barcode,
+  package size, item URL and aisle category when present;
+- storeInventory: upserted by (storeId, itemId), setting price, salePrice and
+  onSale, and appending the price paid to priceHistory when it differs from
+  the one stored by the previous load.
+
+Each record is routed to a writer thread by product name, so upserts of the
+same item never race each other. Writers flush unordered bulk_write batches.
+Run it against a local mongod, or pass any pymongo-compatible Database (e.g.
+mongomock) to load().
+
+Usage:
+    MONGODB_URI=... MONGODB_DB_NAME=kitchenassist \\
+        python mongo_loader.py --input latest_grocery_data.parquet --batch-size 1000 --workers 4
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+
+from pymongo import MongoClient, UpdateOne
+
+DEFAULT_INPUT = 'latest_grocery_data.parquet'
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_WORKERS = 4
+# Most recent priceHistory entries kept per inventory document
+PRICE_HISTORY_LIMIT = 365
+
+UNITS_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)\s*$')
+
+
+def _clean(value):
+    """None for NaN/empty values coming out of pandas or JSON."""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str) and not value.strip():
+        return None
+    return value
+
+
+def _to_float(value):
+    value = _clean(value)
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace('$', '').replace(',', ''))
+    except ValueError:
+        return None
+
+
+def iter_records(path, batch_rows=DEFAULT_BATCH_SIZE):
+    """Stream records (dicts) from the Parquet output or the legacy JSON export."""
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            yield from batch.to_pylist()
+        return
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    with open(path, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'item', use_float=True)
+        else:
+            yield from json.load(f)
+
+
+def item_update(record, now):
+    """UpdateOne for the items collection, keyed by product name."""
+    fields = {'name': record['product_name'], 'updatedAt': now}
+    on_insert = {'createdAt': now, 'tags': ['real-data']}
+    if _clean(record.get('aisle')):
+        fields['category'] = record['aisle']
+    else:
+        on_insert['category'] = 'Other'
+    if _clean(record.get('brand')):
+        fields['brand'] = record['brand']
+    upc = _clean(record.get('upc'))
+    if upc is not None:
+        # pandas reads UPCs as floats when the column has gaps
+        fields['barcode'] = str(int(upc)) if isinstance(upc, float) else str(upc)
+    if _clean(record.get('detail_url')):
+        fields['itemUrl'] = record['detail_url']
+    match = UNITS_RE.match(record.get('units') or '')
+    if match:
+        fields['packageQuantity'] = float(match.group(1))
+        fields['packageUnit'] = match.group(2)
+    return UpdateOne({'name': fields['name']}, {'$set': fields, '$setOnInsert': on_insert}, upsert=True)
+
+
+def inventory_prices(record):
+    """(price, salePrice or None, onSale) from current_price / old_price / other.
+
+    In the hammer feed old_price is the regular price shown next to a
+    discounted current_price, so a higher old_price means the item is on sale.
+    """
+    current = _to_float(record.get('current_price'))
+    old = _to_float(record.get('old_price'))
+    if current is None:
+        current = old
+    if old is not None and current is not None and old > current:
+        return old, current, True
+    return current, None, _clean(record.get('other')) == 'SALE'
+
+
+def paid_price(price, sale_price, on_sale):
+    return sale_price if on_sale and sale_price is not None else price
+
+
+def inventory_update(record, store_id, item_id, now, previous=None):
+    """UpdateOne for storeInventory, keyed by (storeId, itemId).
+
+    previous is the stored document (price, salePrice, onSale) or None. The
+    price paid is appended to priceHistory only for a new document or when it
+    changed, so re-loading an unchanged feed doesn't add an entry per run.
+    """
+    price, sale_price, on_sale = inventory_prices(record)
+    fields = {'price': price, 'onSale': on_sale, 'inStock': True, 'lastUpdated': now}
+    update = {'$set': fields}
+    if sale_price is not None:
+        fields['salePrice'] = sale_price
+    else:
+        update['$unset'] = {'salePrice': ''}
+    if _clean(record.get('aisle')):
+        fields['aisle'] = record['aisle']
+    paid = paid_price(price, sale_price, on_sale)
+    if previous is None or paid != paid_price(previous.get('price'), previous.get('salePrice'),
+                                              previous.get('onSale')):
+        update['$push'] = {'priceHistory': {
+            '$each': [{'price': paid, 'date': now}],
+            '$slice': -PRICE_HISTORY_LIMIT,
+        }}
+    return UpdateOne({'storeId': store_id, 'itemId': item_id}, update, upsert=True)
+
+
+class StoreResolver:
+    """Maps a hammer vendor to a groceryStores _id the way seed-db.js does.
+
+    The first store whose name contains the vendor wins; unmatched vendors
+    fall back to the first store.
+    """
+
+    def __init__(self, stores):
+        self.stores = [(store['name'].lower(), store['_id']) for store in stores]
+        self._by_vendor = {}
+
+    def __call__(self, vendor):
+        vendor = (vendor or '').lower()
+        if vendor not in self._by_vendor:
+            store_id = next((sid for name, sid in self.stores if vendor and vendor in name), None)
+            if store_id is None and self.stores:
+                store_id = self.stores[0][1]
+            self._by_vendor[vendor] = store_id
+        return self._by_vendor[vendor]
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = 0
+        self.items = 0
+        self.inventory = 0
+        self.skipped = 0
+
+    def add(self, records=0, items=0, inventory=0, skipped=0):
+        with self.lock:
+            self.records += records
+            self.items += items
+            self.inventory += inventory
+            self.skipped += skipped
+
+
+def write_batch(db, records, resolve_store, stats, now):
+    """Upsert one batch: items first, then their inventory rows with the resolved item ids."""
+    by_name = {}
+    for record in records:
+        by_name[record['product_name']] = record
+    item_result = db.items.bulk_write([item_update(r, now) for r in by_name.values()], ordered=False)
+
+    item_ids = {doc['name']: doc['_id']
+                for doc in db.items.find({'name': {'$in': list(by_name)}}, {'name': 1})}
+    # One inventory row per (store, item): later records in the batch win
+    latest = {}
+    skipped = 0
+    for record in records:
+        store_id = resolve_store(record.get('vendor'))
+        item_id = item_ids.get(record['product_name'])
+        if store_id is None or item_id is None:
+            skipped += 1
+            continue
+        latest[(store_id, item_id)] = record
+    # Prices stored by the previous load; only this writer touches these items
+    previous = {(doc['storeId'], doc['itemId']): doc
+                for doc in db.storeInventory.find({'itemId': {'$in': list(item_ids.values())}},
+                                                  {'storeId': 1, 'itemId': 1, 'price': 1, 'salePrice': 1,
+                                                   'onSale': 1})}
+    ops = [inventory_update(record, store_id, item_id, now, previous.get((store_id, item_id)))
+           for (store_id, item_id), record in latest.items()]
+    inventory_result = None
+    if ops:
+        inventory_result = db.storeInventory.bulk_write(ops, ordered=False)
+    stats.add(
+        records=len(records),
+        items=item_result.upserted_count + item_result.modified_count,
+        inventory=(inventory_result.upserted_count + inventory_result.modified_count) if inventory_result else 0,
+        skipped=skipped,
+    )
+
+
+def _writer(db, inbox, resolve_store, stats, now, errors):
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            return
+        try:
+            write_batch(db, batch, resolve_store, stats, now)
+        except Exception as e:
+            errors.append(e)
+
+
+def load(db, records, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS, now=None, progress_every=50_000):
+    """Stream records into db with `workers` writer threads; returns LoadStats."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    resolve_store = StoreResolver(db.groceryStores.find({}, {'name': 1}).sort('_id', 1))
+    stats = LoadStats()
+    errors = []
+    # Bounded inboxes give the reader backpressure when writers fall behind
+    inboxes = [queue.Queue(maxsize=4) for _ in range(workers)]
+    threads = [threading.Thread(target=_writer, args=(db, inbox, resolve_store, stats, now, errors), daemon=True)
+               for inbox in inboxes]
+    for thread in threads:
+        thread.start()
+
+    pending = [[] for _ in range(workers)]
+    started = time.monotonic()
+    read = 0
+    for record in records:
+        if not _clean(record.get('product_name')):
+            stats.add(records=1, skipped=1)
+            continue
+        # Same name -> same writer, so concurrent upserts never duplicate an item
+        slot = zlib.crc32(record['product_name'].encode('utf-8')) % workers
+        pending[slot].append(record)
+        if len(pending[slot]) >= batch_size:
+            inboxes[slot].put(pending[slot])
+            pending[slot] = []
+        read += 1
+        if progress_every and read % progress_every == 0:
+            rate = read / (time.monotonic() - started)
+            print(f"Read {read} records ({rate:.0f}/s)")
+    for slot, batch in enumerate(pending):
+        if batch:
+            inboxes[slot].put(batch)
+    for inbox in inboxes:
+        inbox.put(None)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--input', default=DEFAULT_INPUT, help='latest_grocery_data .parquet or .json')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGODB_DB_NAME', 'kitchenassist'))
+    args = parser.parse_args(argv)
+
+    client = MongoClient(args.uri)
+    try:
+        started = time.monotonic()
+        stats = load(client[args.db], iter_records(args.input, args.batch_size), args.batch_size, args.workers)
+        elapsed = time.monotonic() - started
+    finally:
+        client.close()
+    docs = stats.items + stats.inventory
+    print(f"Loaded {stats.records} records in {elapsed:.1f}s: {stats.items} items, "
+          f"{stats.inventory} storeInventory docs written, {stats.skipped} skipped")
+    print(f"Throughput: {docs / elapsed if elapsed else 0:.0f} docs/s, "
+          f"{stats.records / elapsed if elapsed else 0:.0f} records/s")
+
+
+if __name__ == "__main__":
+    main()
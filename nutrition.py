@@ -0,0 +1,368 @@
+"""Recipe nutrition computed from item nutritionalInfo instead of copied from LLM output.
+
+Every item's per-serving nutritionalInfo is packed into one items x nutrients
+matrix. Each recipe ingredient's quantity is converted to a number of that
+item's servings (through the unit_normalization base units; mass <-> volume
+assumes water density, as convertQuantity() does), which makes all recipes
+one sparse recipes x items matrix in CSR form. A single sparse x dense
+product then yields every ingredient's nutritionalContribution and every
+recipe's nutritionalInfo totals.
+
+--incremental only recalculates recipes whose nutritionalInfo.lastCalculated
+is missing or older than the recipe's or any of its ingredient items'
+updatedAt, so item edits don't trigger a full pass.
+
+Ingredients whose quantity can't be expressed in servings (unknown unit, no
+serving size, a count of an item sold by weight) are left out and counted.
+
+Usage:
+    MONGODB_URI=... MONGODB_DB_NAME=kitchenassist python nutrition.py [--incremental]
+    python nutrition.py --benchmark [--recipes 200000]
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from unit_normalization import UNIT_ALIASES, UNIT_FACTORS, canonical_units
+
+# Per-serving fields of items.nutritionalInfo, in matrix column order
+NUTRIENTS = ['calories', 'protein', 'carbs', 'fat', 'saturatedFat', 'transFat', 'fiber', 'sugar', 'sodium']
+# recipes.ingredients[].nutritionalContribution fields
+CONTRIBUTION_FIELDS = ['calories', 'protein', 'carbs', 'fat', 'fiber']
+# recipes.nutritionalInfo field -> item nutrient
+RECIPE_FIELDS = {
+    'totalCalories': 'calories',
+    'protein': 'protein',
+    'carbs': 'carbs',
+    'fat': 'fat',
+    'fiber': 'fiber',
+    'sugar': 'sugar',
+    'sodium': 'sodium',
+}
+# g per ml when a recipe measures by volume and the label by mass (or back)
+DENSITY = 1.0
+SERVING_UNITS = {'serving', 'servings'}
+DEFAULT_BATCH_SIZE = 1000
+
+# Base units as small ints so per-ingredient comparisons stay numeric; -1 is unknown
+BASE_UNITS = ['g', 'ml', 'each']
+GRAM, ML, EACH = range(len(BASE_UNITS))
+_BASE_CODE = {unit: BASE_UNITS.index(base) for unit, (base, _) in UNIT_FACTORS.items()}
+_FACTOR = {unit: factor for unit, (_, factor) in UNIT_FACTORS.items()}
+
+
+def _numbers(values):
+    """Float array of numeric-ish values (None -> NaN); only mixed input goes through pd.to_numeric."""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(list(values), dtype=object), errors='coerce').to_numpy(dtype=float)
+
+
+def _unit_table(units):
+    """(codes, distinct lowercased strings, base unit code and factor per string) of a unit column."""
+    # Few distinct unit strings: canonicalize those, then gather by code
+    codes, uniques = pd.factorize(pd.Series(list(units), dtype=object).fillna(''))
+    strings = pd.Series(uniques, dtype=object).astype(str).str.strip().str.lower()
+    canonical = canonical_units(strings)
+    base = canonical.map(_BASE_CODE).fillna(-1).to_numpy(dtype=np.int64)
+    return codes, strings, base, canonical.map(_FACTOR).to_numpy(dtype=float)
+
+
+def _to_base(quantity, unit):
+    """(base unit code, quantity in base units) for parallel quantity / unit-string sequences."""
+    codes, _, base, factor = _unit_table(unit)
+    return base[codes], _numbers(quantity) * factor[codes]
+
+
+class NutrientMatrix:
+    """Per-serving nutrients of items (rows) plus what converting to servings needs."""
+
+    def __init__(self, item_ids, values, serving_unit, serving_size, servings_per_piece):
+        self.item_ids = list(item_ids)
+        self.item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.values = values
+        self.serving_unit = serving_unit
+        self.serving_size = serving_size
+        self.servings_per_piece = servings_per_piece
+
+    @classmethod
+    def from_items(cls, docs):
+        """Matrix from items documents; missing nutrients count as 0."""
+        docs = list(docs)
+        info = pd.DataFrame([doc.get('nutritionalInfo') or {} for doc in docs],
+                            columns=NUTRIENTS + ['servingSize', 'servingUnit', 'servingsPerContainer'])
+        values = info[NUTRIENTS].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+        serving_unit, serving_size = _to_base(info['servingSize'], info['servingUnit'])
+        # A piece of an item packaged by count ("12 each") holds servingsPerContainer / 12 servings
+        package_unit, package_size = _to_base([doc.get('packageQuantity') for doc in docs],
+                                              [doc.get('packageUnit') for doc in docs])
+        per_container = pd.to_numeric(info['servingsPerContainer'], errors='coerce').to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            servings_per_piece = np.where(package_unit == EACH, per_container / package_size, np.nan)
+            servings_per_piece = np.where(serving_unit == EACH, 1 / serving_size, servings_per_piece)
+        servings_per_piece[~np.isfinite(servings_per_piece)] = np.nan
+        return cls([doc['_id'] for doc in docs], values, serving_unit, serving_size, servings_per_piece)
+
+    @classmethod
+    def from_db(cls, db, item_ids=None):
+        query = {} if item_ids is None else {'_id': {'$in': list(item_ids)}}
+        projection = {'nutritionalInfo': 1, 'packageQuantity': 1, 'packageUnit': 1}
+        return cls.from_items(db.items.find(query, projection))
+
+
+def serving_multiples(matrix, rows, quantities, units):
+    """Number of item servings each (item row, quantity, unit) ingredient amounts to; NaN if unknown."""
+    rows = np.asarray(rows, dtype=np.int64)
+    quantities = _numbers(quantities)
+    codes, strings, base, factor = _unit_table(units)
+    unit, amount = base[codes], quantities * factor[codes]
+    serving_unit = matrix.serving_unit[rows]
+    measured = ((unit == GRAM) | (unit == ML)) & ((serving_unit == GRAM) | (serving_unit == ML))
+    # Same base unit is an exact ratio; g <-> ml goes through DENSITY
+    density = np.where(unit == serving_unit, 1.0, np.where(unit == ML, DENSITY, 1 / DENSITY))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        multiples = np.where(measured, amount * density / matrix.serving_size[rows], np.nan)
+    counted = (unit == EACH) | (strings == '').to_numpy()[codes]
+    multiples = np.where(counted, quantities * matrix.servings_per_piece[rows], multiples)
+    multiples = np.where(strings.isin(SERVING_UNITS).to_numpy()[codes], quantities, multiples)
+    multiples[~np.isfinite(multiples) | (multiples < 0)] = np.nan
+    return multiples
+
+
+class RecipeMatrix:
+    """Recipes x items servings in CSR form; entry k is recipe r's ingredient k - indptr[r]."""
+
+    def __init__(self, recipe_ids, servings, indptr, rows, multiples):
+        self.recipe_ids = list(recipe_ids)
+        self.servings = servings
+        self.indptr = indptr
+        self.rows = rows
+        self.multiples = multiples
+
+    @classmethod
+    def from_recipes(cls, recipes, matrix):
+        """Flatten recipes' ingredients against a NutrientMatrix; unknown items get row -1."""
+        recipes = list(recipes)
+        per_recipe = [recipe.get('ingredients') or [] for recipe in recipes]
+        ingredients = [ingredient for recipe_ingredients in per_recipe for ingredient in recipe_ingredients]
+        rows = pd.Index(matrix.item_ids).get_indexer([ingredient.get('itemId') for ingredient in ingredients])
+        quantities = np.array([ingredient.get('quantity') for ingredient in ingredients], dtype=object)
+        units = np.array([ingredient.get('unit') for ingredient in ingredients], dtype=object)
+        known = rows >= 0
+        multiples = np.full(len(rows), np.nan)
+        multiples[known] = serving_multiples(matrix, rows[known], quantities[known], units[known])
+        indptr = np.r_[0, np.cumsum([len(recipe_ingredients) for recipe_ingredients in per_recipe])].astype(np.int64)
+        servings = pd.to_numeric(pd.Series([recipe.get('servings') for recipe in recipes], dtype=object),
+                                 errors='coerce').to_numpy(dtype=float)
+        return cls([recipe['_id'] for recipe in recipes], servings, indptr, rows, multiples)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @property
+    def resolved(self):
+        return ~np.isnan(self.multiples)
+
+    def multiply(self, matrix):
+        """(per-ingredient contributions, per-recipe totals): the CSR x dense product against matrix.values."""
+        resolved = self.resolved
+        contributions = np.zeros((len(self.rows), matrix.values.shape[1]))
+        contributions[resolved] = self.multiples[resolved, None] * matrix.values[self.rows[resolved]]
+        totals = np.zeros((len(self), matrix.values.shape[1]))
+        nonempty = np.diff(self.indptr) > 0
+        if nonempty.any():
+            totals[nonempty] = np.add.reduceat(contributions, self.indptr[:-1][nonempty], axis=0)
+        return contributions, totals
+
+
+def recipe_updates(recipes, contributions, totals, now):
+    """UpdateOne per recipe setting nutritionalContribution and nutritionalInfo from multiply()."""
+    from pymongo import UpdateOne
+
+    columns = {name: NUTRIENTS.index(name) for name in NUTRIENTS}
+    resolved = recipes.resolved
+    # bincount over each entry's recipe: reduceat would index past the end for a trailing empty recipe
+    recipe_of = np.repeat(np.arange(len(recipes)), np.diff(recipes.indptr))
+    resolved_counts = np.bincount(recipe_of[resolved], minlength=len(recipes))
+    updates = []
+    for r, recipe_id in enumerate(recipes.recipe_ids):
+        fields = {'nutritionalInfo.lastCalculated': now}
+        lo, hi = recipes.indptr[r], recipes.indptr[r + 1]
+        # Leave whatever the recipe had when none of its ingredients could be resolved
+        if hi > lo and resolved_counts[r]:
+            for k in range(lo, hi):
+                if resolved[k]:
+                    fields[f'ingredients.{k - lo}.nutritionalContribution'] = {
+                        name: round(float(contributions[k, columns[name]]), 2) for name in CONTRIBUTION_FIELDS}
+            for field, name in RECIPE_FIELDS.items():
+                fields[f'nutritionalInfo.{field}'] = round(float(totals[r, columns[name]]), 2)
+            if recipes.servings[r] > 0:
+                fields['nutritionalInfo.caloriesPerServing'] = round(
+                    float(totals[r, columns['calories']] / recipes.servings[r]), 2)
+        updates.append(UpdateOne({'_id': recipe_id}, {'$set': fields}))
+    return updates
+
+
+def stale_recipes(recipes, item_updated):
+    """Recipes (docs with ingredients, updatedAt, nutritionalInfo) needing a recalculation.
+
+    item_updated maps item _id -> updatedAt. A recipe is stale when it was
+    never calculated or anything it depends on changed after lastCalculated.
+    """
+    item_ids = list(item_updated)
+    item_index = {item_id: i for i, item_id in enumerate(item_ids)}
+    # Trailing 0 is the "never updated" time of unknown items (row -1)
+    updated = np.array([_seconds(item_updated[i]) for i in item_ids] + [0.0])
+    stale = []
+    for recipe in recipes:
+        calculated = (recipe.get('nutritionalInfo') or {}).get('lastCalculated')
+        if calculated is None:
+            stale.append(recipe)
+            continue
+        rows = [item_index.get(ingredient.get('itemId'), -1) for ingredient in recipe.get('ingredients') or []]
+        newest = max(updated[rows].max() if rows else 0.0, _seconds(recipe.get('updatedAt')))
+        if newest > _seconds(calculated):
+            stale.append(recipe)
+    return stale
+
+
+def _seconds(value):
+    """Epoch seconds of a (naive UTC or aware) datetime; 0 for None."""
+    return pd.Timestamp(value).timestamp() if value is not None else 0.0
+
+
+def recalculate(db, incremental=False, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Recalculate recipe nutrition in db; returns (recipes updated, ingredients left out)."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    projection = {'servings': 1, 'updatedAt': 1, 'nutritionalInfo.lastCalculated': 1,
+                  'ingredients.itemId': 1, 'ingredients.quantity': 1, 'ingredients.unit': 1}
+    recipes = list(db.recipes.find({}, projection))
+    item_ids = {ingredient.get('itemId') for recipe in recipes for ingredient in recipe.get('ingredients') or []}
+    if incremental:
+        item_updated = {doc['_id']: doc.get('updatedAt')
+                        for doc in db.items.find({'_id': {'$in': list(item_ids)}}, {'updatedAt': 1})}
+        recipes = stale_recipes(recipes, item_updated)
+        item_ids = {ingredient.get('itemId') for recipe in recipes for ingredient in recipe.get('ingredients') or []}
+    if not recipes:
+        return 0, 0
+
+    matrix = NutrientMatrix.from_db(db, item_ids)
+    recipe_matrix = RecipeMatrix.from_recipes(recipes, matrix)
+    contributions, totals = recipe_matrix.multiply(matrix)
+    updates = recipe_updates(recipe_matrix, contributions, totals, now)
+    for lo in range(0, len(updates), batch_size):
+        db.recipes.bulk_write(updates[lo:lo + batch_size], ordered=False)
+    return len(updates), int((~recipe_matrix.resolved).sum())
+
+
+def synthetic_data(n_items, n_recipes, seed=0):
+    """Items with nutrition labels and recipes using 3-15 of them in mixed units."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_items):
+        by_count = rng.random() < 0.2
+        items.append({
+            '_id': i,
+            'packageQuantity': 12 if by_count else rng.choice([250, 500, 1000]),
+            'packageUnit': 'each' if by_count else rng.choice(['g', 'ml']),
+            'nutritionalInfo': {
+                'servingSize': rng.choice([15, 30, 50, 100, 250]),
+                'servingUnit': rng.choice(['g', 'ml']),
+                'servingsPerContainer': rng.choice([6, 12, 24]),
+                **{name: round(rng.uniform(0, 300 if name in ('calories', 'sodium') else 20), 1) for name in NUTRIENTS},
+            },
+        })
+    units = ['g', 'kg', 'ml', 'cup', 'tbsp', 'tsp', 'lb', 'oz', 'each', 'servings', 'pinch']
+    recipes = [{
+        '_id': r,
+        'servings': rng.randint(1, 8),
+        'ingredients': [{'itemId': rng.randrange(n_items), 'quantity': rng.choice([0.5, 1, 2, 3, 100, 250]),
+                         'unit': rng.choice(units)} for _ in range(rng.randint(3, 15))],
+    } for r in range(n_recipes)]
+    return items, recipes
+
+
+def python_totals(items, recipe):
+    """Per-recipe dict loop with the same conversion rules; the baseline the benchmark compares against."""
+    totals = dict.fromkeys(NUTRIENTS, 0.0)
+    for ingredient in recipe['ingredients']:
+        item = items.get(ingredient['itemId'])
+        if item is None:
+            continue
+        info = item['nutritionalInfo']
+        unit = UNIT_FACTORS.get(UNIT_ALIASES.get(ingredient['unit']))
+        serving = UNIT_FACTORS.get(UNIT_ALIASES.get(info['servingUnit']))
+        if ingredient['unit'] in SERVING_UNITS:
+            multiple = ingredient['quantity']
+        elif unit and unit[0] == 'each':
+            package = UNIT_FACTORS.get(UNIT_ALIASES.get(item['packageUnit']))
+            if not package or package[0] != 'each':
+                continue
+            multiple = ingredient['quantity'] * info['servingsPerContainer'] / (item['packageQuantity'] * package[1])
+        elif unit and serving and unit[0] != 'each' and serving[0] != 'each':
+            multiple = ingredient['quantity'] * unit[1] / (info['servingSize'] * serving[1])
+        else:
+            continue
+        for name in NUTRIENTS:
+            totals[name] += multiple * info[name]
+    return totals
+
+
+def benchmark(n_recipes, n_items=50_000):
+    items, recipes = synthetic_data(n_items, n_recipes)
+    start = time.perf_counter()
+    matrix = NutrientMatrix.from_items(items)
+    build_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    recipe_matrix = RecipeMatrix.from_recipes(recipes, matrix)
+    flatten_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    _, totals = recipe_matrix.multiply(matrix)
+    multiply_sec = time.perf_counter() - start
+    print(f"{n_items} items -> nutrient matrix in {build_sec:.2f}s; {n_recipes} recipes "
+          f"({len(recipe_matrix.rows)} ingredients, {recipe_matrix.resolved.mean():.0%} resolved) "
+          f"flattened in {flatten_sec:.2f}s, multiplied in {multiply_sec * 1000:.0f} ms")
+
+    by_id = {item['_id']: item for item in items}
+    sample = recipes[:2000]
+    start = time.perf_counter()
+    expected = np.array([[python_totals(by_id, recipe)[name] for name in NUTRIENTS] for recipe in sample])
+    loop_sec = time.perf_counter() - start
+    same = np.allclose(totals[:len(sample)], expected)
+    print(f"Python loop: {loop_sec / len(sample) * 1000:.2f} ms/recipe (~{loop_sec / len(sample) * n_recipes:,.0f}s "
+          f"for all); totals match: {same}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--incremental', action='store_true',
+                        help='only recipes whose items changed since their lastCalculated')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGODB_DB_NAME', 'kitchenassist'))
+    parser.add_argument('--benchmark', action='store_true', help='time against a Python loop on synthetic data')
+    parser.add_argument('--recipes', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.recipes)
+        return
+    from pymongo import MongoClient
+    client = MongoClient(args.uri)
+    try:
+        start = time.perf_counter()
+        updated, left_out = recalculate(client[args.db], args.incremental, args.batch_size)
+    finally:
+        client.close()
+    print(f"Recalculated {updated} recipes in {time.perf_counter() - start:.1f}s; "
+          f"{left_out} ingredients could not be converted to servings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Async client for Gumloop pipeline runs (start_pipeline + get_pl_run polling).
+
+One PipelineClient shares a single HTTP session, so connections are reused
+across runs, and a semaphore bounds how many runs are in flight at once.
+submit() returns a per-run asyncio.Task; run_many() fans a list of payloads
+out and gathers the run responses in order.
+
+    async with PipelineClient(BASE_URL, USER_ID, headers=headers) as client:
+        responses = await client.run_many(SAVED_ITEM_ID, payloads)
+
+Polling is adaptive. All in-flight runs share one poll loop, which wakes up
+when the earliest run is due and checks every due run_id concurrently. The
+first poll of a run is delayed to a low quantile of the latencies observed
+for its saved_item_id (optionally persisted with latency_path), and later
+polls back off exponentially with jitter.
+
+Pass cache=ResultCache(...) to serve repeated sources (same recipe URL or
+receipt image for the same pipeline) from disk; see result_cache.py.
+
+run_pipeline() is a blocking wrapper for the single-run scripts.
+
+With instrumentation enabled (see instrumentation.py), runs record the
+start_pipeline call as a span, semaphore queue wait and end-to-end run latency
+as histograms per saved_item_id, and poll / outcome counters.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+from collections import deque
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import aiohttp
+
+from instrumentation import add, observe, span
+from result_cache import DEFAULT_CACHE_PATH, ResultCache, payload_source
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_MAX_CONCURRENCY = 16
+# Observed run latencies per saved_item_id, shared by the scripts between runs
+DEFAULT_LATENCY_PATH = 'pipeline_latency.json'
+
+
+class PipelineError(Exception):
+    """A pipeline run could not be started or finished in state FAILED."""
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class PipelineTimeout(PipelineError):
+    """A pipeline run did not reach DONE or FAILED within the timeout."""
+
+
+def _drop_none(mapping):
+    return {k: v for k, v in (mapping or {}).items() if v is not None}
+
+
+def pipeline_key(saved_item_id=None, start_url=None):
+    """Key latencies by saved_item_id, falling back to the one in start_url (or the URL itself)."""
+    if saved_item_id:
+        return saved_item_id
+    if start_url:
+        query = parse_qs(urlparse(start_url).query)
+        return query.get('saved_item_id', [start_url.split('?')[0]])[0]
+    return 'default'
+
+
+class LatencyStats:
+    """Recent run latencies (seconds) per pipeline, optionally persisted as JSON."""
+
+    def __init__(self, path=None, max_samples=100):
+        self.path = path
+        self.max_samples = max_samples
+        self.samples = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for key, values in json.load(f).items():
+                    self.samples[key] = deque(values, maxlen=max_samples)
+
+    def record(self, key, seconds):
+        self.samples.setdefault(key, deque(maxlen=self.max_samples)).append(round(seconds, 3))
+
+    def quantile(self, key, q, min_samples=1):
+        values = sorted(self.samples.get(key, ()))
+        if len(values) < min_samples or not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({key: list(values) for key, values in self.samples.items()}, f, indent=2)
+
+
+class PollPolicy:
+    """When to poll a run: seeded first poll, then capped exponential backoff with jitter.
+
+    The first poll waits for the seed_quantile of the pipeline's observed
+    latencies (once min_samples are known), so a pipeline that usually takes
+    60 s isn't polled 30 times before it can possibly be done. After that,
+    intervals start at initial_interval and grow by multiplier up to
+    max_interval; each is scaled by a random factor in [1 - jitter, 1] so
+    many runs started together don't poll in lockstep.
+    """
+
+    def __init__(self, initial_interval=1.0, max_interval=8.0, multiplier=2.0, jitter=0.25,
+                 seed_quantile=0.1, min_samples=3):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.seed_quantile = seed_quantile
+        self.min_samples = min_samples
+
+    def _jittered(self, delay):
+        return delay * (1 - self.jitter * random.random())
+
+    def first_delay(self, stats, key):
+        seed = stats.quantile(key, self.seed_quantile, self.min_samples)
+        if seed is None:
+            return self._jittered(self.initial_interval)
+        return max(self.initial_interval, self._jittered(seed))
+
+    def next_delay(self, attempt):
+        """Delay before poll number attempt + 1 (attempt counts polls already made)."""
+        delay = self.initial_interval * self.multiplier ** max(0, attempt - 1)
+        return self._jittered(min(self.max_interval, delay))
+
+
+class _InflightRun:
+    __slots__ = ('run_id', 'key', 'future', 'started', 'attempts', 'on_state')
+
+    def __init__(self, run_id, key, future, started, on_state):
+        self.run_id = run_id
+        self.key = key
+        self.future = future
+        self.started = started
+        self.attempts = 0
+        self.on_state = on_state
+
+
+class PipelineClient:
+    """Submits pipeline runs and polls them to completion with bounded concurrency."""
+
+    def __init__(self, base_url, user_id, headers=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, poll_url=None, poll_policy=None, latency_path=None, cache=None):
+        self.base_url = base_url.rstrip('/') if base_url else base_url
+        self.user_id = user_id
+        self.headers = _drop_none(headers)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.poll_url = poll_url or f"{self.base_url}/get_pl_run"
+        self.poll_policy = poll_policy or PollPolicy()
+        self.latency = LatencyStats(latency_path)
+        self.cache = cache
+        # (pipeline, source) -> task of the run currently fetching it
+        self._inflight = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+        # Shared poll loop state: heap of (due_time, seq, run)
+        self._due = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._poll_task = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.latency.save()
+
+    def start_url(self, saved_item_id):
+        query = urlencode(_drop_none({"user_id": self.user_id, "saved_item_id": saved_item_id}))
+        return f"{self.base_url}/start_pipeline?{query}"
+
+    async def start(self, saved_item_id=None, payload=None, start_url=None):
+        """POST start_pipeline; returns the JSON response (with run_id, or outputs when synchronous)."""
+        url = start_url or self.start_url(saved_item_id)
+        async with self._session.post(url, json=payload) as response:
+            return await response.json(content_type=None)
+
+    async def get_run(self, run_id):
+        params = _drop_none({"run_id": run_id, "user_id": self.user_id})
+        async with self._session.get(self.poll_url, params=params) as response:
+            return await response.json(content_type=None)
+
+    async def wait(self, run_id, key='default', on_state=None, started=None):
+        """Wait for the shared poll loop to see the run DONE (returns the run response) or FAILED (raises)."""
+        loop = asyncio.get_running_loop()
+        run = _InflightRun(run_id, key, loop.create_future(), started or loop.time(), on_state)
+        self._schedule(run, self.poll_policy.first_delay(self.latency, key))
+        return await run.future
+
+    def _schedule(self, run, delay):
+        loop = asyncio.get_running_loop()
+        due_at = loop.time() + delay
+        heapq.heappush(self._due, (due_at, next(self._seq), run))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.ensure_future(self._poll_loop())
+        elif self._due[0][2] is run:
+            # New earliest deadline: wake the loop so it re-computes its sleep
+            self._wakeup.set()
+
+    async def _poll_loop(self):
+        try:
+            await self._poll_due()
+        except Exception as exc:
+            # Timeouts are only checked here, so a dead loop would leave every waiting run() stuck
+            while self._due:
+                run = heapq.heappop(self._due)[2]
+                if not run.future.done():
+                    run.future.set_exception(exc)
+
+    async def _poll_due(self):
+        loop = asyncio.get_running_loop()
+        while self._due:
+            due_at = self._due[0][0]
+            now = loop.time()
+            if due_at > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), due_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = []
+            while self._due and self._due[0][0] <= now:
+                # Checked before popping, so a run is never lost to an error raised here
+                run = self._due[0][2]
+                if not run.future.done() and now - run.started > self.timeout:
+                    run.future.set_exception(
+                        PipelineTimeout(f"Polling timed out after {self.timeout}s (run_id={run.run_id})"))
+                heapq.heappop(self._due)
+                if not run.future.done():
+                    batch.append(run)
+            if not batch:
+                continue
+
+            results = await asyncio.gather(*(self.get_run(run.run_id) for run in batch),
+                                           return_exceptions=True)
+            for run, data in zip(batch, results):
+                try:
+                    self._handle_poll(run, data)
+                except Exception as exc:
+                    if not run.future.done():
+                        run.future.set_exception(exc)
+
+    def _handle_poll(self, run, data):
+        if run.future.done():
+            return
+        if isinstance(data, BaseException):
+            run.future.set_exception(data)
+            return
+        run.attempts += 1
+        add('pipeline_polls', pipeline=run.key)
+        if not isinstance(data, dict):
+            # Empty body (None) or a JSON list: fail this run rather than the shared loop
+            add('pipeline_runs', pipeline=run.key, state='INVALID')
+            run.future.set_exception(PipelineError(f"Unexpected get_pl_run response (run_id={run.run_id})", data))
+            return
+        state = data.get("state", "")
+        if run.on_state is not None:
+            try:
+                run.on_state(state)
+            except Exception as exc:
+                # Fail this run only; letting it escape would stall the shared poll loop
+                run.future.set_exception(exc)
+                return
+        if state == "DONE":
+            elapsed = asyncio.get_running_loop().time() - run.started
+            self.latency.record(run.key, elapsed)
+            observe('pipeline_run_seconds', elapsed, pipeline=run.key)
+            add('pipeline_runs', pipeline=run.key, state=state)
+            run.future.set_result(data)
+        elif state == "FAILED":
+            add('pipeline_runs', pipeline=run.key, state=state)
+            run.future.set_exception(PipelineError(f"Run failed (run_id={run.run_id})", data))
+        else:
+            self._schedule(run, self.poll_policy.next_delay(run.attempts))
+
+    async def run(self, saved_item_id=None, payload=None, start_url=None, on_state=None):
+        """Start one run and wait for its full run response.
+
+        With a cache, a hit is returned without starting a run (on_state sees
+        "CACHED"), and concurrent calls for the same pipeline and source share
+        one in-flight run.
+        """
+        source = payload_source(payload) if self.cache is not None else None
+        if source is None:
+            return await self._run_uncached(saved_item_id, payload, start_url, on_state)
+
+        pipeline = pipeline_key(saved_item_id, start_url)
+        cached = self.cache.get(pipeline, source)
+        if cached is not None:
+            add('pipeline_runs', pipeline=pipeline, state='CACHED')
+            if on_state is not None:
+                on_state("CACHED")
+            return cached
+        task = self._inflight.get((pipeline, source))
+        if task is None:
+            task = asyncio.ensure_future(
+                self._run_and_cache(pipeline, source, saved_item_id, payload, start_url, on_state))
+            self._inflight[(pipeline, source)] = task
+        # shield: one caller being cancelled must not cancel the run the others wait on
+        return await asyncio.shield(task)
+
+    async def _run_and_cache(self, pipeline, source, saved_item_id, payload, start_url, on_state):
+        try:
+            response = await self._run_uncached(saved_item_id, payload, start_url, on_state)
+            self.cache.put(pipeline, source, response)
+            return response
+        finally:
+            self._inflight.pop((pipeline, source), None)
+
+    async def _run_uncached(self, saved_item_id, payload, start_url, on_state):
+        key = pipeline_key(saved_item_id, start_url)
+        queued = asyncio.get_running_loop().time()
+        async with self._semaphore:
+            started = asyncio.get_running_loop().time()
+            observe('pipeline_queue_wait_seconds', started - queued, pipeline=key)
+            with span('pipeline_start', pipeline=key):
+                result = await self.start(saved_item_id, payload, start_url)
+            run_id = result.get("run_id")
+            if not run_id:
+                # Maybe synchronous: outputs returned directly
+                if "outputs" in result and result.get("state") == "DONE":
+                    return result
+                raise PipelineError("No run_id in start_pipeline response", result)
+            return await self.wait(run_id, key, on_state, started)
+
+    def submit(self, saved_item_id=None, payload=None, start_url=None, on_state=None):
+        """Schedule a run; the returned task resolves to the run response."""
+        return asyncio.ensure_future(self.run(saved_item_id, payload, start_url, on_state))
+
+    async def run_many(self, saved_item_id, payloads, return_exceptions=True):
+        """Run one pipeline over many payloads; results (or exceptions) come back in payload order."""
+        tasks = [self.submit(saved_item_id, payload) for payload in payloads]
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+
+
+def run_pipeline(start_url, payload=None, base_url=None, user_id=None, headers=None, on_state=None,
+                 timeout=DEFAULT_TIMEOUT, poll_policy=None, latency_path=DEFAULT_LATENCY_PATH,
+                 cache_path=DEFAULT_CACHE_PATH):
+    """Blocking single run: start the pipeline at start_url and return the full run response.
+
+    Responses are cached in cache_path (None disables the cache).
+    """
+    async def _run():
+        async with PipelineClient(base_url, user_id, headers=headers, max_concurrency=1, timeout=timeout,
+                                  poll_policy=poll_policy, latency_path=latency_path, cache=cache) as client:
+            return await client.run(payload=payload, start_url=start_url, on_state=on_state)
+
+    cache = ResultCache(cache_path) if cache_path else None
+    try:
+        return asyncio.run(_run())
+    finally:
+        if cache is not None:
+            cache.close()
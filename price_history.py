@@ -0,0 +1,276 @@
+"""Columnar price-history store built from the hammer raw feed.
+
+load_grocery_data_in_chunks.py keeps only the latest row per product. This
+module keeps every (timestamp, price) observation instead, in flat NumPy arrays
+sorted by product and time, so each product's history is one contiguous slice:
+
+    <store>/product_ids.npy  sorted product ids
+    <store>/offsets.npy      history of product_ids[i] is rows offsets[i]:offsets[i + 1]
+    <store>/keys.npy         int64 (product index << 32 | epoch seconds) per row
+    <store>/prices.npy       price per row (the day's close when downsampled)
+    <store>/min_prices.npy   the day's minimum (daily stores only)
+    <store>/meta.json
+
+Arrays are memory-mapped on open. A product's history is a binary search plus
+a slice. Because keys sort by (product, time), a single searchsorted finds
+"each product's price as of t" for every product at once, which is what
+price_drops() needs.
+
+--daily downsamples to one row per product per day (min and close), which is
+enough for SCHEMA.txt priceHistory and much smaller than the raw feed.
+
+Usage:
+    python price_history.py build [--daily] [--workers 8]
+    python price_history.py history 12345
+    python price_history.py drops --pct 20 --days 7
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from load_grocery_data_in_chunks import RANGE_BYTES, RANGES_PER_WORKER, RAW_PATH, complete_lines_end, \
+    read_raw_header, split_byte_ranges
+
+STORE_PATH = 'price_history'
+HISTORY_COLUMNS = ['nowtime', 'current_price', 'product_id']
+DAY_SECONDS = 24 * 3600
+# Low 32 bits of a key hold epoch seconds (good until 2106)
+TIME_BITS = 32
+TIME_MASK = (1 << TIME_BITS) - 1
+
+
+def parse_observations(frame):
+    """(product_id, epoch seconds, price) arrays from raw feed rows, dropping rows without a price."""
+    product_id = pd.to_numeric(frame['product_id'], errors='coerce')
+    price = pd.to_numeric(frame['current_price'], errors='coerce')
+    seconds = pd.to_datetime(frame['nowtime'], errors='coerce').to_numpy(dtype='datetime64[s]').astype(np.int64)
+    valid = (product_id.notna() & price.notna()).to_numpy() & (seconds >= 0)
+    return (product_id.to_numpy()[valid].astype(np.int64), seconds[valid],
+            price.to_numpy(dtype=np.float64)[valid])
+
+
+def daily_partial(product_id, seconds, price):
+    """Reduce observations to one row per (product, day): min price, close price and close time."""
+    day = seconds - seconds % DAY_SECONDS
+    # Stable sort keeps file order among rows with the same timestamp
+    order = np.lexsort((seconds, day, product_id))
+    product_id, day, seconds, price = product_id[order], day[order], seconds[order], price[order]
+    if not len(product_id):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0), empty
+    starts = np.flatnonzero(np.r_[True, (product_id[1:] != product_id[:-1]) | (day[1:] != day[:-1])])
+    ends = np.r_[starts[1:], len(product_id)] - 1
+    return product_id[starts], day[starts], np.minimum.reduceat(price, starts), price[ends], seconds[ends]
+
+
+def read_range(raw_path, header, start, end, daily):
+    """Worker: parse one byte range of the raw feed into observation (or daily) arrays."""
+    with open(raw_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    frame = pd.read_csv(io.BytesIO(header + data), usecols=HISTORY_COLUMNS, dtype=str)
+    observations = parse_observations(frame)
+    return daily_partial(*observations) if daily else observations
+
+
+def _read_range(args):
+    return read_range(*args)
+
+
+def daily_partial_merge(product_id, day, min_price, close, close_seconds):
+    """Combine per-range daily partials into one row per (product, day).
+
+    Returns (product_id, day, close, min_price) ordered for _pack, which sorts
+    by (product, day).
+    """
+    order = np.lexsort((close_seconds, day, product_id))
+    product_id, day, min_price, close = product_id[order], day[order], min_price[order], close[order]
+    if not len(product_id):
+        return product_id, day, close, min_price
+    starts = np.flatnonzero(np.r_[True, (product_id[1:] != product_id[:-1]) | (day[1:] != day[:-1])])
+    ends = np.r_[starts[1:], len(product_id)] - 1
+    return product_id[starts], day[starts], close[ends], np.minimum.reduceat(min_price, starts)
+
+
+def _pack(product_id, seconds, price, min_price=None):
+    """Sort rows by (product, time) and build the offset index and packed keys."""
+    # Stable: rows with the same product and timestamp keep feed order
+    order = np.lexsort((seconds, product_id))
+    product_id, seconds, price = product_id[order], seconds[order], price[order]
+    product_ids, starts = np.unique(product_id, return_index=True)
+    offsets = np.r_[starts, len(product_id)].astype(np.int64)
+    product_index = np.repeat(np.arange(len(product_ids), dtype=np.int64), np.diff(offsets))
+    arrays = {
+        'product_ids': product_ids,
+        'offsets': offsets,
+        'keys': (product_index << TIME_BITS) | seconds,
+        'prices': price,
+    }
+    if min_price is not None:
+        arrays['min_prices'] = min_price[order]
+    return arrays
+
+
+def build(raw_path=RAW_PATH, store_path=STORE_PATH, daily=False, workers=1):
+    """Scan the raw feed once (optionally in parallel byte ranges) and write a store."""
+    started = time.perf_counter()
+    header = read_raw_header(raw_path)
+    end = complete_lines_end(raw_path)
+    n_ranges = max(workers * RANGES_PER_WORKER, -(-end // RANGE_BYTES))
+    tasks = [(raw_path, header, lo, hi, daily) for lo, hi in split_byte_ranges(raw_path, n_ranges, end=end)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_read_range, tasks))
+    else:
+        parts = [_read_range(task) for task in tasks]
+    if not parts:
+        # Empty or header-only feed: write an empty store
+        observations = parse_observations(pd.DataFrame(columns=HISTORY_COLUMNS, dtype=str))
+        parts = [daily_partial(*observations) if daily else observations]
+    columns = [np.concatenate(column) for column in zip(*parts)]
+    print(f"Parsed {len(tasks)} ranges of {raw_path} in {time.perf_counter() - started:.1f}s")
+
+    if daily:
+        # A day can straddle two ranges: fold the partials again by close time
+        product_id, day, min_price, close, close_seconds = columns
+        arrays = _pack(*daily_partial_merge(product_id, day, min_price, close, close_seconds))
+    else:
+        arrays = _pack(*columns)
+
+    os.makedirs(store_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(store_path, name + '.npy'), array)
+    meta = {
+        'raw_path': raw_path,
+        'header': header.decode('utf-8'),
+        'offset': end,
+        'resolution': 'daily' if daily else 'raw',
+        'rows': int(len(arrays['prices'])),
+        'products': int(len(arrays['product_ids'])),
+        'latest': int((arrays['keys'] & TIME_MASK).max()) if len(arrays['keys']) else 0,
+    }
+    with open(os.path.join(store_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Wrote {meta['rows']} {meta['resolution']} rows for {meta['products']} products to {store_path} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return PriceHistory(store_path)
+
+
+class PriceHistory:
+    """Read side of a price-history store; arrays are memory-mapped."""
+
+    def __init__(self, store_path=STORE_PATH):
+        self.store_path = store_path
+        with open(os.path.join(store_path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(store_path, name + '.npy'), mmap_mode='r')
+
+        self.product_ids = load('product_ids')
+        self.offsets = load('offsets')
+        self.keys = load('keys')
+        self.prices = load('prices')
+        self.min_prices = load('min_prices') if self.meta['resolution'] == 'daily' else None
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def _index(self, product_id):
+        i = int(np.searchsorted(self.product_ids, product_id))
+        if i == len(self.product_ids) or self.product_ids[i] != product_id:
+            raise KeyError(product_id)
+        return i
+
+    def history(self, product_id):
+        """DataFrame of date, price (and min_price for daily stores) for one product, oldest first."""
+        i = self._index(product_id)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        seconds = np.asarray(self.keys[lo:hi]) & TIME_MASK
+        frame = pd.DataFrame({
+            'date': seconds.astype('datetime64[s]'),
+            'price': np.asarray(self.prices[lo:hi]),
+        })
+        if self.min_prices is not None:
+            frame['min_price'] = np.asarray(self.min_prices[lo:hi])
+        return frame
+
+    def schema_history(self, product_id):
+        """History in the storeInventory priceHistory shape: [{price, date}]."""
+        frame = self.history(product_id)
+        return [{'price': float(price), 'date': date.to_pydatetime().replace(tzinfo=datetime.timezone.utc)}
+                for date, price in zip(frame['date'], frame['price'])]
+
+    def rows_as_of(self, seconds):
+        """Row index of each product's last observation at or before `seconds` (-1 if none)."""
+        product_index = np.arange(len(self.product_ids), dtype=np.int64)
+        rows = np.searchsorted(self.keys, (product_index << TIME_BITS) | int(seconds), side='right') - 1
+        rows[rows < self.offsets[:-1]] = -1
+        return rows
+
+    def price_drops(self, pct, days=7, as_of=None):
+        """Products whose price as of `as_of` is at least pct% below their price `days` earlier.
+
+        The earlier price is the last one observed at or before the start of
+        the window, or the product's first price if it was first seen inside
+        the window. `as_of` defaults to the newest timestamp in the store.
+        """
+        end = self.meta['latest'] if as_of is None else int(pd.Timestamp(as_of).timestamp())
+        start = end - int(days * DAY_SECONDS)
+        new_rows = self.rows_as_of(end)
+        old_rows = self.rows_as_of(start)
+        seen = new_rows >= 0
+        old_rows = np.where(old_rows >= 0, old_rows, self.offsets[:-1])
+        new_price = np.asarray(self.prices)[np.where(seen, new_rows, 0)]
+        old_price = np.asarray(self.prices)[old_rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drop = (old_price - new_price) / old_price * 100
+        hits = np.flatnonzero(seen & (old_price > 0) & (drop >= pct))
+        result = pd.DataFrame({
+            'product_id': np.asarray(self.product_ids)[hits],
+            'old_price': old_price[hits],
+            'new_price': new_price[hits],
+            'drop_pct': drop[hits],
+        })
+        return result.sort_values('drop_pct', ascending=False, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', default=STORE_PATH, help='store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='scan the raw feed and write the store')
+    build_parser.add_argument('--raw', default=RAW_PATH)
+    build_parser.add_argument('--daily', action='store_true', help='keep one min/close row per product per day')
+    build_parser.add_argument('--workers', type=int, default=1)
+    history_parser = commands.add_parser('history', help='print one product\'s history')
+    history_parser.add_argument('product_id', type=int)
+    drops_parser = commands.add_parser('drops', help='products whose price dropped')
+    drops_parser.add_argument('--pct', type=float, default=20.0)
+    drops_parser.add_argument('--days', type=float, default=7.0)
+    drops_parser.add_argument('--as-of', help='end of the window (default: newest observation)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        build(args.raw, args.store, args.daily, args.workers)
+        return
+    store = PriceHistory(args.store)
+    start = time.perf_counter()
+    if args.command == 'history':
+        result = store.history(args.product_id)
+    else:
+        result = store.price_drops(args.pct, args.days, args.as_of)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(result.to_string(index=False))
+    print(f"{len(result)} rows in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
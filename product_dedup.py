@@ -0,0 +1,301 @@
+"""Near-duplicate product detection across vendors with MinHash and LSH.
+
+drop_duplicates() only removes byte-identical rows, so "PC Blueberries 170 g"
+at Loblaws and "President's Choice Blueberries, 170g" at Metro survive as two
+products. This stage finds such near-duplicates without comparing all pairs:
+
+1. each row's brand + product_name (minus its size text) is shingled into
+   byte trigrams and summarized by a MinHash signature (NUM_PERM
+   permutations, all rows at once in NumPy);
+2. signatures are cut into BANDS bands; rows sharing a band hash *and* the same
+   package size (parsed by unit_normalization) land in one LSH bucket, so
+   candidate pairs come from sorting band hashes, near-linear in the row count;
+3. each candidate pair's exact shingle Jaccard similarity is computed from
+   the trigram sets (the MinHash estimate alone is too noisy at NUM_PERM
+   permutations: over many pairs it links names that share half their
+   trigrams), pairs reaching `threshold` are linked, and the connected
+   components become canonical products;
+4. every member must also reach `threshold` against its cluster's canonical
+   row, so a chain A~B~C cannot merge A and C when they aren't similar;
+   members that fail are clustered again among themselves.
+
+Usage:
+    python product_dedup.py --benchmark [--rows 1000000]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog_matcher import normalize_name
+from unit_normalization import QUANTITY_RE, parse_quantities
+
+NUM_PERM = 32
+BANDS = 8
+DEFAULT_THRESHOLD = 0.7
+# Rows hashed per step; bounds the shingle arrays to a few hundred MB
+CHUNK_ROWS = 200_000
+# Shingles compared per step when verifying pairs
+CHUNK_SHINGLES = 4_000_000
+
+# Universal hashing (a * x + b) mod p over 24-bit trigram codes
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240218)
+_PERM_A = _rng.integers(1, (1 << 31) - 1, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 31) - 1, NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shingle_codes(texts):
+    """(row, trigram code) pairs for the padded byte trigrams of each text, vectorized over all texts."""
+    encoded = [f' {text} '.encode('utf-8') for text in texts]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint32)
+    starts = np.cumsum(lengths) - lengths
+    codes = (buffer[:-2] << 16) | (buffer[1:-1] << 8) | buffer[2:] if len(buffer) >= 3 else np.zeros(0, np.uint32)
+    # A trigram starting in the last two bytes of a text runs into the next one
+    n_shingles = np.maximum(lengths - 2, 0)
+    positions = np.repeat(starts - np.cumsum(n_shingles) + n_shingles, n_shingles) + np.arange(n_shingles.sum())
+    rows = np.repeat(np.arange(len(texts)), n_shingles)
+    return rows, codes[positions], n_shingles
+
+
+def minhash_signatures(texts):
+    """(len(texts), NUM_PERM) uint64 MinHash signatures of the texts' byte trigrams."""
+    signatures = np.full((len(texts), NUM_PERM), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for lo in range(0, len(texts), CHUNK_ROWS):
+        _, codes, n_shingles = shingle_codes(texts[lo:lo + CHUNK_ROWS])
+        has_shingles = n_shingles > 0
+        starts = (np.cumsum(n_shingles) - n_shingles)[has_shingles]
+        codes = codes.astype(np.uint64)
+        rows = np.arange(lo, lo + len(n_shingles))[has_shingles]
+        for k in range(NUM_PERM):
+            hashed = (codes * _PERM_A[k] + _PERM_B[k]) % _PRIME
+            signatures[rows, k] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def shingle_sets(texts):
+    """CSR (indptr, codes) of each text's distinct trigram codes, sorted within a row."""
+    rows, codes, _ = shingle_codes(texts)
+    keys = np.sort(rows.astype(np.int64) << 24 | codes)
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+    counts = np.bincount(keys >> 24, minlength=len(texts))
+    return np.r_[0, np.cumsum(counts)], (keys & 0xFFFFFF).astype(np.int64)
+
+
+def jaccard(indptr, codes, left, right):
+    """Exact Jaccard similarity of the shingle sets of rows left[i] and right[i]."""
+    sizes = np.diff(indptr)
+    similarity = np.zeros(len(left))
+    per_pair = sizes[left] + sizes[right]
+    bounds = np.searchsorted(np.cumsum(per_pair), np.arange(CHUNK_SHINGLES, per_pair.sum(), CHUNK_SHINGLES))
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(left)]):
+        # Tag each pair's codes from both sides with the pair; a tag seen twice is a shared shingle
+        keys = []
+        for rows in (left[lo:hi], right[lo:hi]):
+            counts = sizes[rows]
+            gather = np.repeat(indptr[rows] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            keys.append(np.repeat(np.arange(hi - lo, dtype=np.int64), counts) << 24 | codes[gather])
+        keys = np.sort(np.concatenate(keys))
+        shared = keys[1:][keys[1:] == keys[:-1]] >> 24
+        intersection = np.bincount(shared, minlength=hi - lo)
+        union = per_pair[lo:hi] - intersection
+        similarity[lo:hi] = intersection / np.maximum(union, 1)
+    return similarity
+
+
+def band_hashes(signatures, block_keys):
+    """(BANDS, n) uint64 hash of each signature band, salted with the row's block key."""
+    rows_per_band = NUM_PERM // BANDS
+    hashes = np.empty((BANDS, len(signatures)), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for band in range(BANDS):
+            h = block_keys * _MIX + np.uint64(band)
+            for column in signatures[:, band * rows_per_band:(band + 1) * rows_per_band].T:
+                h = (h ^ column) * _MIX
+            hashes[band] = h
+    return hashes
+
+
+def candidate_pairs(hashes):
+    """Pairs of rows sharing a bucket in any band, each bucket linked as a chain (to be verified)."""
+    left, right = [], []
+    for band_hash in hashes:
+        order = np.argsort(band_hash, kind='stable')
+        same = band_hash[order[1:]] == band_hash[order[:-1]]
+        left.append(order[:-1][same])
+        right.append(order[1:][same])
+    left = np.concatenate(left)
+    right = np.concatenate(right)
+    pairs = np.unique(np.minimum(left, right).astype(np.int64) << 32 | np.maximum(left, right))
+    return pairs >> 32, pairs & 0xFFFFFFFF
+
+
+def connected_components(n, left, right):
+    """Component label (smallest member) of each of n nodes, by vectorized label propagation."""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        # Pointer jumping: follow labels to their own labels until they settle
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def block_keys_for(df, units_column):
+    """Hash of the normalized package size (base unit + rounded base quantity); 0 when unknown."""
+    if units_column is None or units_column not in df:
+        return np.zeros(len(df), dtype=np.uint64)
+    sizes = parse_quantities(df[units_column])
+    quantity = sizes['base_quantity'].round(0).fillna(-1).to_numpy()
+    key = sizes['base_unit'].fillna('') + ':' + pd.Series(quantity, index=df.index).astype(int).astype(str)
+    codes, _ = pd.factorize(key)
+    return codes.astype(np.uint64) + np.uint64(1)
+
+
+def find_near_duplicates(df, name_column='product_name', brand_column='brand', units_column='units',
+                         threshold=DEFAULT_THRESHOLD):
+    """Cluster label per row: the index label of the cluster's canonical row.
+
+    Rows only match within the same parsed package size; brand text, when
+    present, is prepended to the shingled name unless the name already has
+    it. Rows with nothing to shingle (blank name and brand) stay on their
+    own. The canonical row of a cluster is the one with the most non-null
+    fields (first on ties).
+    """
+    # Sizes are compared through the block key, so "170 g" vs "170g" in the name shouldn't count
+    names = df[name_column].fillna('').astype(str).str.replace(QUANTITY_RE, ' ', regex=True)
+    texts = [normalize_name(name) for name in names]
+    if brand_column is not None and brand_column in df:
+        brands = [normalize_name(brand) if isinstance(brand, str) else '' for brand in df[brand_column]]
+        texts = [text if not brand or brand in text else f'{brand} {text}' for brand, text in zip(brands, texts)]
+
+    signatures = minhash_signatures(texts)
+    left, right = candidate_pairs(band_hashes(signatures, block_keys_for(df, units_column)))
+    # Only rows in some candidate pair need their shingle sets
+    involved, pair_rows = np.unique(np.r_[left, right], return_inverse=True)
+    indptr, codes = shingle_sets([texts[row] for row in involved])
+    local_left, local_right = pair_rows[:len(left)], pair_rows[len(left):]
+    # Rows without shingles (blank names) would all match each other
+    keep = (jaccard(indptr, codes, local_left, local_right) >= threshold) & (np.diff(indptr)[local_left] > 0)
+    left, right = local_left[keep], local_right[keep]
+
+    # Canonical row per component: most non-null fields, then first position
+    filled = df.notna().sum(axis=1).to_numpy()[involved]
+    canonical = np.arange(len(involved))
+    unverified = np.ones(len(involved), dtype=bool)
+    while unverified.any():
+        labels = connected_components(len(involved), left, right)
+        order = np.lexsort((np.arange(len(involved)), -filled, labels))
+        first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+        head = np.empty(len(involved), dtype=np.int64)
+        head[labels[order][first]] = order[first]
+        members = np.flatnonzero(unverified & (head[labels] != np.arange(len(involved))))
+        close = jaccard(indptr, codes, members, head[labels[members]]) >= threshold
+        canonical[unverified] = head[labels[unverified]]
+        canonical[members[~close]] = members[~close]
+        # Members too far from their canonical row cluster again among themselves
+        unverified = np.zeros(len(involved), dtype=bool)
+        unverified[members[~close]] = True
+        both = unverified[left] & unverified[right]
+        left, right = left[both], right[both]
+
+    cluster = np.arange(len(df))
+    cluster[involved] = involved[canonical]
+    return pd.Series(df.index.to_numpy()[cluster], index=df.index, name='canonical_id')
+
+
+def drop_near_duplicates(df, **options):
+    """One row per canonical product, with cluster_size counting the listings it stands for."""
+    canonical_id = find_near_duplicates(df, **options)
+    sizes = canonical_id.value_counts()
+    kept = df.loc[canonical_id.index[canonical_id.index == canonical_id.to_numpy()]]
+    return kept.assign(cluster_size=sizes.reindex(kept.index).to_numpy())
+
+
+def synthetic_listings(n_products, seed=0):
+    """Catalog rows where each product is listed 1-3 times with vendor-style name variations."""
+    rng = random.Random(seed)
+    words = ['organic', 'whole', 'milk', 'chicken', 'breast', 'boneless', 'cheddar', 'cheese', 'bread', 'white',
+             'wheat', 'greek', 'yogurt', 'vanilla', 'butter', 'salted', 'large', 'eggs', 'brown', 'rice', 'pasta',
+             'tomato', 'sauce', 'ground', 'beef', 'frozen', 'peas', 'orange', 'juice', 'coffee', 'dark', 'roast']
+    vendors = ['Loblaws', 'Metro', 'Walmart', 'Voila', 'NoFrills', 'SaveOnFoods']
+    rows = []
+    for product in range(n_products):
+        brand = f"Brand{rng.randrange(n_products // 4 + 1)}"
+        name = ' '.join(rng.sample(words, rng.randint(2, 4))) + f" {rng.choice(['Family', 'Classic', 'Select'])}" \
+            + f" No{product}"
+        size = f"{rng.choice([100, 250, 355, 500, 750, 1000])}{rng.choice(['g', 'ml'])}"
+        for vendor in rng.sample(vendors, rng.randint(1, 3)):
+            variant = name
+            roll = rng.random()
+            if roll < 0.3:
+                variant = variant.title()
+            elif roll < 0.5:
+                variant = f"{variant}, {size}"
+            elif roll < 0.6:
+                variant = variant.replace(' ', '  ', 1) + '.'
+            rows.append({'vendor': vendor, 'product_name': variant, 'brand': brand, 'units': size,
+                         'true_product': product})
+    return pd.DataFrame(rows)
+
+
+def pairwise_near_duplicates(texts, threshold=DEFAULT_THRESHOLD):
+    """All-pairs exact trigram Jaccard; the quadratic baseline the benchmark extrapolates."""
+    shingles = [{f' {t} '[i:i + 3] for i in range(len(t))} for t in texts]
+    pairs = 0
+    for i in range(len(shingles)):
+        for j in range(i + 1, len(shingles)):
+            a, b = shingles[i], shingles[j]
+            if len(a & b) >= threshold * len(a | b):
+                pairs += 1
+    return pairs
+
+
+def benchmark(max_rows):
+    n_products = max(1, max_rows // 2)
+    df_all = synthetic_listings(n_products)
+    sample = df_all.head(2000)
+    texts = [normalize_name(b + ' ' + n) for b, n in zip(sample['brand'], sample['product_name'])]
+    start = time.perf_counter()
+    pairwise_near_duplicates(texts)
+    pair_sec = time.perf_counter() - start
+    print(f"pairwise on {len(sample)} rows: {pair_sec:.2f}s")
+
+    sizes = sorted({min(len(df_all), n) for n in (10_000, 100_000, max_rows)})
+    for n_rows in sizes:
+        df = df_all.head(n_rows)
+        start = time.perf_counter()
+        canonical_id = find_near_duplicates(df)
+        elapsed = time.perf_counter() - start
+        # Quality against the generator's ground truth: pairs of rows put in the same cluster
+        truth = pd.Series(df['true_product'].to_numpy())
+        found = pd.Series(canonical_id.to_numpy())
+        merged_wrong = int((truth.groupby(found).nunique() > 1).sum())
+        missed = int((found.groupby(truth).nunique() > 1).sum())
+        pairwise_est = pair_sec * (n_rows / len(sample)) ** 2
+        print(f"{n_rows} rows: {elapsed:.2f}s, {found.nunique()} canonical products "
+              f"({df['true_product'].nunique()} true); {merged_wrong} clusters mixing products, "
+              f"{missed} duplicated products not fully merged; pairwise would take ~{pairwise_est:,.0f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark(args.rows)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""Local receipt image preprocessing: fetch, downscale, recompress and dedup before submission.
+
+Phone photos of receipts are often 3-12 MB at 4000px, and the vision pipeline
+fetches (and is billed for) whatever it is given. Here each image is fetched
+or read in a thread pool, decoded (JPEG decoding is scaled down in the codec
+via Image.draft), rotated per its EXIF orientation, shrunk to at most
+MAX_SIDE px on its long side and recompressed as JPEG. The result is sent
+inline as a base64 data URI.
+
+Each image is identified by the SHA-256 of its original bytes, and a receipt
+whose bytes match one already submitted is skipped as a duplicate instead of
+being billed again.
+
+Re-photographs of a receipt have different bytes, so each image also gets
+a fingerprint of its layout: the paper is found against the background,
+turned upright, and split into text lines, and each line is described by
+where its left and right runs of text start and end across the paper. A
+receipt is skipped as a re-photo of one already seen when its line count is
+the same and at most MAX_DISTANCE of its lines moved by more than
+LINE_TOLERANCE. Re-photos of one receipt (different framing, rotation,
+lighting, JPEG quality) measure 0 to 0.07; two different receipts from one
+store with the same number of lines measure 0.2 or more, since item names
+and prices vary in length.
+
+The fingerprint needs the whole receipt in frame and photographed roughly
+head-on: a cropped re-photo has fewer lines and a strongly tilted one
+(perspective) moves every line, so both are submitted again. Two receipts
+with the same items bought twice, differing only in digits, look the same
+and the second is skipped; pass --max-distance -1 to only skip exact copies.
+
+Images Pillow can't decode (e.g. HEIC without a plugin) are sent as they are,
+without a fingerprint. Without Pillow installed, nothing is preprocessed.
+
+Usage:
+    python receipt_images.py receipts/ [--max-side 1600] [--quality 80] [--max-distance 0.12]
+"""
+import argparse
+import base64
+import hashlib
+import io
+import mimetypes
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: without Pillow images are submitted unprocessed
+    Image = None
+
+MAX_SIDE = 1600
+JPEG_QUALITY = 80
+# Fingerprints are measured with the image's short side at most WORK_SIDE px
+WORK_SIDE = 600
+# A pixel is ink if darker than INK_LEVEL times its row's paper level
+INK_LEVEL = 0.65
+# Corrections (degrees) tried after turning the paper's long axis upright
+FINE_ANGLES = np.arange(-1.0, 1.01, 0.25)
+# Text lines kept per fingerprint (the rest of a longer receipt is ignored), and the fewest
+# for an image to get one at all
+MAX_LINES = 96
+MIN_LINES = 5
+# Gray levels between the darkest and lightest pixel needed to look for text at all
+MIN_CONTRAST = 64
+# Blank space (fraction of the width) that splits a line into a left and a right run
+LINE_GAP = 0.05
+# A line whose extents moved by more than this (255ths of the width) counts as different
+LINE_TOLERANCE = 8
+# Fraction of text lines that may differ for a receipt to be skipped as a re-photo of an earlier
+# one; re-photos of one receipt measure under 0.08, different receipts from one store 0.2 or more
+MAX_DISTANCE = 0.12
+FETCH_TIMEOUT = 30
+# Threads fetching and decoding; fetches are I/O bound and Pillow releases the GIL while decoding
+DEFAULT_WORKERS = 8
+
+
+def available():
+    return Image is not None
+
+
+def read_image(source, timeout=FETCH_TIMEOUT):
+    """Raw bytes of a URL, data URI or local path."""
+    if source.startswith("data:"):
+        return base64.b64decode(source.split(",", 1)[1])
+    if source.startswith(("http://", "https://")):
+        request = urllib.request.Request(source, headers={"User-Agent": "pantrypilot-receipts"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _mime(source):
+    if source.startswith("data:"):
+        return source[5:].split(";", 1)[0] or "image/jpeg"
+    return mimetypes.guess_type(source.split("?")[0])[0] or "image/jpeg"
+
+
+def _otsu(values):
+    """Gray level that best splits values (uint8) into dark and light."""
+    p = np.bincount(values.ravel(), minlength=256) / values.size
+    omega = np.cumsum(p)
+    mu = np.cumsum(p * np.arange(256))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mu[-1] * omega - mu) ** 2 / (omega * (1 - omega))
+    return int(np.nanargmax(between))
+
+
+def _paper_box(gray):
+    """(x0, y0, x1, y1) of the light region covering most rows and columns of gray."""
+    paper = gray > _otsu(gray)
+    rows, cols = paper.mean(axis=1), paper.mean(axis=0)
+    r = np.flatnonzero(rows > 0.5 * rows.max())
+    c = np.flatnonzero(cols > 0.5 * cols.max())
+    return c[0], r[0], c[-1] + 1, r[-1] + 1
+
+
+def _ink(gray, rotation):
+    """Ink mask of the paper in gray rotated by rotation degrees, without its edges."""
+    rotated = np.asarray(gray.rotate(rotation, Image.BILINEAR, expand=True, fillcolor=0))
+    x0, y0, x1, y1 = _paper_box(rotated)
+    dx, dy = int((x1 - x0) * 0.03), int((y1 - y0) * 0.01)
+    crop = rotated[y0 + dy:y1 - dy, x0 + dx:x1 - dx].astype(np.float32)
+    # Relative to each row's paper level, so uneven lighting doesn't read as ink
+    return crop < INK_LEVEL * np.percentile(crop, 90, axis=1, keepdims=True)
+
+
+def _deskewed_ink(gray):
+    """Ink mask of the receipt turned upright: coarse angle from the paper's long axis, then the
+    angle within a degree whose text rows stand out most."""
+    paper = np.asarray(gray) > _otsu(np.asarray(gray))
+    rotation = 0.0
+    if paper.mean() < 0.9:  # a photo with background around the paper, not a scan
+        ys, xs = np.nonzero(paper)
+        xs, ys = xs - xs.mean(), ys - ys.mean()
+        theta = 0.5 * np.degrees(np.arctan2(2 * (xs * ys).mean(), (xs * xs).mean() - (ys * ys).mean()))
+        rotation = theta - 90 if theta > 0 else theta + 90
+    # Small rotations are nearly shears, so score them on the ink's row profile without rotating
+    ys, xs = np.nonzero(_ink(gray, rotation))
+    if not len(ys):
+        return np.zeros((0, 0), dtype=bool)
+    scores = []
+    for fine in FINE_ANGLES:
+        rows = np.round(ys - xs * np.tan(np.radians(fine))).astype(np.int64)
+        scores.append(np.bincount(rows - rows.min()).astype(np.float64).var())
+    return _ink(gray, rotation + FINE_ANGLES[int(np.argmax(scores))])
+
+
+def fingerprint(image):
+    """uint8 [line count, 4 * MAX_LINES extents] of the receipt's text lines, or None if it has fewer
+    than MIN_LINES.
+
+    Each line is described by where its first and last runs of text start and end, as 255ths of
+    the paper width; a line with no gap wider than LINE_GAP has one run.
+    """
+    gray = image.convert("L")
+    scale = WORK_SIDE / min(gray.size)
+    if scale < 1:
+        gray = gray.resize((round(gray.size[0] * scale), round(gray.size[1] * scale)), Image.BOX)
+    low, high = gray.getextrema()
+    if high - low < MIN_CONTRAST:  # blank, or too dark to tell paper from ink
+        return None
+    ink = _deskewed_ink(gray)
+    on = np.r_[0, (ink.mean(axis=1) > 0.01).astype(np.int8), 0]
+    starts, ends = np.flatnonzero(np.diff(on) == 1), np.flatnonzero(np.diff(on) == -1)
+    keep = ends - starts >= 3
+    starts, ends = starts[keep][:MAX_LINES], ends[keep][:MAX_LINES]
+    if len(starts) < MIN_LINES:
+        return None
+    width = ink.shape[1]
+    result = np.zeros(1 + 4 * MAX_LINES, dtype=np.uint8)
+    result[0] = len(starts)
+    for line, (start, end) in enumerate(zip(starts, ends)):
+        cols = np.flatnonzero(ink[start:end].any(axis=0))
+        gaps = np.diff(cols)
+        if len(gaps) and gaps.max() > LINE_GAP * width:
+            split = int(gaps.argmax())
+            extents = np.array([cols[0], cols[split] + 1, cols[split + 1], cols[-1] + 1])
+        else:
+            extents = np.array([cols[0], cols[-1] + 1, cols[0], cols[-1] + 1])
+        result[1 + 4 * line:5 + 4 * line] = np.round(extents * 255 / width)
+    return result
+
+
+def downscale(data, max_side=MAX_SIDE, quality=JPEG_QUALITY):
+    """(jpeg_bytes, fingerprint, resized) for encoded image bytes."""
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder skip detail we would throw away (1/2, 1/4 or 1/8 scale)
+        scale = min(1.0, max_side / max(image.size))
+        image.draft("RGB", (int(image.size[0] * scale) + 1, int(image.size[1] * scale) + 1))
+        image = ImageOps.exif_transpose(image)
+        resized = max(image.size) > max_side
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=quality, optimize=True)
+        return out.getvalue(), fingerprint(image), resized
+
+
+class PreparedImage:
+    """An image ready to submit: the bytes to send, their MIME type, the SHA-256 of the original bytes
+    and the fingerprint (None if undecodable)."""
+
+    __slots__ = ("source", "original_bytes", "data", "mime", "digest", "fingerprint")
+
+    def __init__(self, source, original_bytes, data, mime, digest, fingerprint):
+        self.source = source
+        self.original_bytes = original_bytes
+        self.data = data
+        self.mime = mime
+        self.digest = digest
+        self.fingerprint = fingerprint
+
+    def data_uri(self):
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+    def payload(self):
+        return {"receipt_image": self.data_uri()}
+
+
+def prepare_image(source, max_side=MAX_SIDE, quality=JPEG_QUALITY):
+    """Fetch and downscale one image; the original is kept when recompressing doesn't shrink it."""
+    original = read_image(source)
+    digest = hashlib.sha256(original).hexdigest()
+    if Image is None:
+        return PreparedImage(source, len(original), original, _mime(source), digest, None)
+    try:
+        data, thumbprint, resized = downscale(original, max_side, quality)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return PreparedImage(source, len(original), original, _mime(source), digest, None)
+    if not resized and len(data) >= len(original):
+        return PreparedImage(source, len(original), original, _mime(source), digest, thumbprint)
+    return PreparedImage(source, len(original), data, "image/jpeg", digest, thumbprint)
+
+
+def distances(fingerprints, fingerprint):
+    """Fraction of text lines that differ between each row of fingerprints and fingerprint
+    (inf where the line counts differ)."""
+    lines = int(fingerprint[0])
+    result = np.full(len(fingerprints), np.inf)
+    same = np.flatnonzero(fingerprints[:, 0] == lines)
+    if len(same):
+        moved = np.abs(fingerprints[same, 1:1 + 4 * lines].astype(np.int16)
+                       - fingerprint[1:1 + 4 * lines].astype(np.int16))
+        result[same] = (moved.reshape(len(same), lines, 4).max(axis=2) > LINE_TOLERANCE).mean(axis=1)
+    return result
+
+
+def encode_fingerprint(fingerprint):
+    return base64.b64encode(fingerprint.tobytes()).decode("ascii")
+
+
+def decode_fingerprint(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.uint8)
+
+
+class FingerprintIndex:
+    """Receipts already submitted: find() returns the id of an exact copy, similar() the nearest re-photo."""
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.digests = {}
+        self.fingerprints = np.empty((64, 1 + 4 * MAX_LINES), dtype=np.uint8)
+        self.ids = []
+
+    def find(self, digest):
+        return self.digests.get(digest)
+
+    def similar(self, fingerprint):
+        if fingerprint is None or self.max_distance < 0 or not self.ids:
+            return None
+        distance = distances(self.fingerprints[:len(self.ids)], fingerprint)
+        nearest = int(distance.argmin())
+        return self.ids[nearest] if distance[nearest] <= self.max_distance else None
+
+    def add(self, digest, fingerprint, receipt_id):
+        if digest is not None:
+            self.digests.setdefault(digest, receipt_id)
+        if fingerprint is None or len(fingerprint) != self.fingerprints.shape[1]:
+            return
+        if len(self.ids) == len(self.fingerprints):
+            self.fingerprints = np.concatenate([self.fingerprints, np.empty_like(self.fingerprints)])
+        self.fingerprints[len(self.ids)] = fingerprint
+        self.ids.append(receipt_id)
+
+
+class PrepStats:
+    """Bytes saved by downscaling and the duplicate hit rate, for the batch summary."""
+
+    def __init__(self):
+        self.images = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self.duplicates = 0
+        self.similar = 0
+        self.unhashed = 0
+
+    def record(self, prepared, duplicate, similar=False):
+        self.images += 1
+        self.original_bytes += prepared.original_bytes
+        if duplicate:
+            self.duplicates += 1
+        elif similar:
+            self.similar += 1
+        else:
+            self.sent_bytes += len(prepared.data)
+        if prepared.fingerprint is None:
+            self.unhashed += 1
+
+    def report(self):
+        skipped = self.duplicates + self.similar
+        submitted = self.images - skipped
+        saved = self.original_bytes - self.sent_bytes
+        hit_rate = skipped / self.images if self.images else 0.0
+        lines = [
+            f"Images: {self.images} prepared, {submitted} submitted, {self.duplicates} exact duplicates and "
+            f"{self.similar} re-photos skipped (hit rate {hit_rate:.1%})",
+            f"Bytes: {self.original_bytes / 1e6:.1f} MB original -> {self.sent_bytes / 1e6:.1f} MB sent "
+            f"({saved / 1e6:.1f} MB saved, {saved / self.original_bytes if self.original_bytes else 0:.1%})",
+        ]
+        if self.unhashed:
+            lines.append(f"{self.unhashed} images had no fingerprint (undecodable or too few text lines); "
+                         "only exact copies of them are skipped")
+        return "\n".join(lines)
+
+
+def prepare_all(receipts, workers=DEFAULT_WORKERS, max_side=MAX_SIDE, quality=JPEG_QUALITY,
+                max_distance=MAX_DISTANCE):
+    """Prepare (receipt_id, source) pairs in a thread pool and find duplicates in input order.
+
+    Yields (receipt_id, prepared or exception, duplicate_of, similar_to) in
+    input order: duplicate_of is the first receipt with the same bytes,
+    similar_to the nearest earlier receipt this one is a re-photo of. Either
+    means the receipt should be skipped.
+    """
+    index = FingerprintIndex(max_distance)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(rid, pool.submit(prepare_image, source, max_side, quality)) for rid, source in receipts]
+        for receipt_id, future in futures:
+            try:
+                prepared = future.result()
+            except Exception as e:
+                yield receipt_id, e, None, None
+                continue
+            duplicate_of = index.find(prepared.digest)
+            similar_to = None
+            if duplicate_of is None:
+                similar_to = index.similar(prepared.fingerprint)
+                if similar_to is None:
+                    index.add(prepared.digest, prepared.fingerprint, receipt_id)
+            yield receipt_id, prepared, duplicate_of, similar_to
+
+
+def main(argv=None):
+    from batch_receipts import load_receipts
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="directory, glob, or .jsonl manifest of receipt images")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--max-side", type=int, default=MAX_SIDE, help="longest side in px after downscaling")
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY, help="JPEG quality of the recompressed image")
+    parser.add_argument("--max-distance", type=float, default=MAX_DISTANCE,
+                        help="fraction of text lines that may differ for a receipt to be skipped as a "
+                             "re-photo; -1 only skips exact copies")
+    args = parser.parse_args(argv)
+    if not available():
+        parser.error("Pillow is not installed (pip install Pillow)")
+
+    receipts = load_receipts(args.input)
+    stats = PrepStats()
+    started = time.perf_counter()
+    for receipt_id, prepared, duplicate_of, similar_to in prepare_all(receipts, args.workers, args.max_side,
+                                                                      args.quality, args.max_distance):
+        if isinstance(prepared, Exception):
+            print(f"{receipt_id}: FAILED {type(prepared).__name__}: {prepared}")
+            continue
+        stats.record(prepared, duplicate_of is not None, similar_to is not None)
+        if duplicate_of:
+            note = f"duplicate of {duplicate_of}"
+        elif similar_to:
+            note = f"re-photo of {similar_to}"
+        else:
+            note = f"{len(prepared.data) / 1e3:.0f} KB"
+        print(f"{receipt_id}: {prepared.original_bytes / 1e3:.0f} KB -> {note}")
+    print(f"\nPrepared {len(receipts)} images in {time.perf_counter() - started:.1f}s")
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""Rank recipes by how much of each one a household already has ("what can I cook now").
+
+Scanning every recipe's ingredient list for every household costs recipes x
+ingredients per request. Instead an inverted index keeps, for each item, the
+recipes that use it and whether it is required there (not isOptional). A
+fridge is scored by gathering only the postings of the items in it, so the
+work is proportional to how many recipes use those items. All households are
+scored in one pass: their fridge items are flattened to (household, item)
+entries, joined against the postings, and the postings of each (household,
+recipe) cell are summed with np.bincount over the cells that occur, a block
+of households at a time. Cells no fridge item touches are never built.
+
+Per recipe pair:
+
+- coverage: the share of its required ingredients in the fridge;
+- missing: how many required ingredients are not;
+- expiring: fridge items it uses that expire within EXPIRING_DAYS, each
+  weighted by how soon (1 today, falling to 0 at EXPIRING_DAYS);
+
+score = coverage - MISSING_PENALTY * missing + EXPIRING_WEIGHT * (expiring
+weights). Only recipes that use at least one fridge item are ranked; equal
+scores keep index order. Expired fridge items and those with quantity 0 don't
+count as on hand.
+
+Recipes added later go into a small postings segment of their own (merged
+once there are MAX_SEGMENTS), and re-adding a recipe replaces its old postings.
+
+Usage:
+    MONGODB_URI=... MONGODB_DB_NAME=kitchenassist python recipe_ranking.py [--household ID] [--k 10]
+    python recipe_ranking.py --benchmark [--recipes 100000] [--households 10000]
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_K = 10
+EXPIRING_DAYS = 3
+MISSING_PENALTY = 0.1
+EXPIRING_WEIGHT = 0.25
+MAX_SEGMENTS = 8
+# Postings expanded per step
+PAIRS_PER_CHUNK = 10_000_000
+
+
+class Postings:
+    """item column -> (recipe row, required) postings of some recipes, CSR by item column."""
+
+    def __init__(self, items, recipes, required, n_items):
+        order = np.argsort(items, kind='stable')
+        self.indptr = np.zeros(n_items + 1, dtype=np.int64)
+        np.cumsum(np.bincount(items, minlength=n_items), out=self.indptr[1:])
+        self.recipes = recipes[order]
+        self.required = required[order]
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def items(self):
+        return np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+    def counts(self, columns):
+        """Number of postings of each item column."""
+        known = columns < len(self.indptr) - 1
+        safe = np.where(known, columns, 0)
+        return np.where(known, self.indptr[safe + 1] - self.indptr[safe], 0)
+
+    def lookup(self, columns):
+        """(position in columns, recipe row, required) of every posting of the given item columns."""
+        # Columns added to the vocabulary after this segment was built have no postings in it
+        known = columns < len(self.indptr) - 1
+        safe = np.where(known, columns, 0)
+        starts = self.indptr[safe]
+        counts = np.where(known, self.indptr[safe + 1] - starts, 0)
+        entry = np.repeat(np.arange(len(columns)), counts)
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return entry, self.recipes[positions], self.required[positions]
+
+
+class RecipeIndex:
+    """Inverted item -> recipe index with per-recipe required-ingredient lists."""
+
+    def __init__(self):
+        self.recipe_ids = []
+        self.recipe_row = {}
+        self.item_ids = []
+        self.item_index = {}
+        self.n_required = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        # Required item columns of each recipe row, for listing what is missing
+        self.required_items = []
+        self.segments = []
+
+    @classmethod
+    def from_recipes(cls, recipes):
+        index = cls()
+        index.add_recipes(recipes)
+        return index
+
+    @classmethod
+    def from_db(cls, db, query=None):
+        return cls.from_recipes(db.recipes.find(query or {}, {'ingredients.itemId': 1, 'ingredients.isOptional': 1}))
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def _column(self, item_id):
+        column = self.item_index.get(item_id)
+        if column is None:
+            column = self.item_index[item_id] = len(self.item_ids)
+            self.item_ids.append(item_id)
+        return column
+
+    def add_recipes(self, recipes):
+        """Index recipes; one already in the index is replaced by the new version."""
+        items, rows, required, n_required = [], [], [], []
+        first_row = len(self.recipe_ids)
+        replaced = []
+        for recipe in recipes:
+            recipe_id = recipe.get('_id')
+            if recipe_id in self.recipe_row:
+                replaced.append(self.recipe_row[recipe_id])
+            row = len(self.recipe_ids)
+            self.recipe_row[recipe_id] = row
+            self.recipe_ids.append(recipe_id)
+            # An item listed twice is required if either listing is
+            ingredients = {}
+            for ingredient in recipe.get('ingredients') or []:
+                if ingredient.get('itemId') is None:
+                    continue
+                column = self._column(ingredient['itemId'])
+                ingredients[column] = ingredients.get(column, False) or not ingredient.get('isOptional')
+            for column, is_required in ingredients.items():
+                items.append(column)
+                rows.append(row)
+                required.append(is_required)
+            needed = [column for column, is_required in ingredients.items() if is_required]
+            self.required_items.append(np.asarray(needed, dtype=np.int64))
+            n_required.append(len(needed))
+        self.n_required = np.concatenate([self.n_required, np.asarray(n_required, dtype=np.int64)])
+        self.active = np.concatenate([self.active, np.ones(len(self.recipe_ids) - first_row, dtype=bool)])
+        self.active[replaced] = False
+        if items:
+            self.segments.append(Postings(np.asarray(items, dtype=np.int64), np.asarray(rows, dtype=np.int64),
+                                          np.asarray(required, dtype=bool), len(self.item_ids)))
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+
+    def remove_recipes(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            row = self.recipe_row.pop(recipe_id, None)
+            if row is not None:
+                self.active[row] = False
+
+    def compact(self):
+        """Merge all segments into one, dropping postings of removed or replaced recipes."""
+        items = np.concatenate([segment.items() for segment in self.segments])
+        recipes = np.concatenate([segment.recipes for segment in self.segments])
+        required = np.concatenate([segment.required for segment in self.segments])
+        keep = self.active[recipes]
+        self.segments = [Postings(items[keep], recipes[keep], required[keep], len(self.item_ids))]
+
+    def fridge_entries(self, households, now=None):
+        """(household, item column, expiring weight) per usable fridge item, one per (household, item)."""
+        now = pd.Timestamp(now or datetime.datetime.now(datetime.timezone.utc))
+        now = now.tz_localize('UTC') if now.tzinfo is None else now
+        owners, columns, expirations = [], [], []
+        for h, household in enumerate(households):
+            for entry in household.get('fridgeItems') or []:
+                column = self.item_index.get(entry.get('itemId'))
+                quantity = entry.get('quantity')
+                if column is None or (quantity is not None and quantity <= 0):
+                    continue
+                owners.append(h)
+                columns.append(column)
+                expirations.append(entry.get('expirationDate'))
+        # Naive datetimes (as pymongo returns them) are UTC
+        days_left = (pd.to_datetime(pd.Series(expirations, dtype=object), utc=True) - now).dt.total_seconds() / 86_400
+        days_left = days_left.to_numpy(dtype=float, na_value=np.inf)
+        fresh = days_left >= 0
+        weight = np.clip(1 - days_left / EXPIRING_DAYS, 0, 1)
+        owners = np.asarray(owners, dtype=np.int64)[fresh]
+        columns = np.asarray(columns, dtype=np.int64)[fresh]
+        weight = weight[fresh]
+        # The same item twice in a fridge counts once, with its soonest expiry
+        key = owners * max(len(self.item_ids), 1) + columns
+        order = np.lexsort((-weight, key))
+        first = np.r_[True, key[order][1:] != key[order][:-1]] if len(key) else np.zeros(0, dtype=bool)
+        order = order[first]
+        return owners[order], columns[order], weight[order]
+
+    def score(self, owners, columns, weight):
+        """(household, recipe row, score, coverage, missing, optional, expiring) of every household x recipe
+        cell the fridge entries touch, ordered by household, then recipe row.
+
+        Removed and replaced recipes are left out.
+        """
+        looked_up = [segment.lookup(columns) for segment in self.segments]
+        entry = np.concatenate([entry for entry, _, _ in looked_up] or [np.zeros(0, dtype=np.int64)])
+        recipe = np.concatenate([recipe for _, recipe, _ in looked_up] or [np.zeros(0, dtype=np.int64)])
+        required = np.concatenate([required for _, _, required in looked_up] or [np.zeros(0, dtype=bool)])
+        if not self.active.all():
+            live = self.active[recipe]
+            entry, recipe, required = entry[live], recipe[live], required[live]
+        # Number the distinct (household, recipe) cells in key order: sort the keys and count the runs
+        key = owners[entry] * max(len(self.recipe_ids), 1) + recipe
+        order = np.argsort(key, kind='stable')
+        first = np.r_[True, key[order][1:] != key[order][:-1]] if len(key) else np.zeros(0, dtype=bool)
+        cell = np.empty(len(key), dtype=np.int64)
+        cell[order] = np.cumsum(first) - 1
+        touched = np.bincount(cell)
+        have_required = np.bincount(cell, weights=required)
+        bonus = np.bincount(cell, weights=weight[entry])
+        expiring = np.bincount(cell, weights=(weight > 0)[entry])
+        heads = order[first]
+        owner, row = owners[entry[heads]], recipe[heads]
+        n_required = self.n_required[row]
+        coverage = np.where(n_required > 0, have_required / np.maximum(n_required, 1), 1.0)
+        missing = n_required - have_required
+        score = coverage - MISSING_PENALTY * missing + EXPIRING_WEIGHT * bonus
+        return owner, row, score, coverage, missing, touched - have_required, expiring
+
+    def rank(self, households, k=DEFAULT_K, now=None):
+        """Top-k recipes for every household in one pass, as a DataFrame (rank 1 is best)."""
+        households = list(households)
+        owners, columns, weight = self.fridge_entries(households, now)
+        # Households per step: about PAIRS_PER_CHUNK postings
+        pairs = sum(segment.counts(columns) for segment in self.segments) if self.segments else np.zeros(len(owners))
+        cumulative = np.cumsum(np.bincount(owners, weights=pairs, minlength=len(households)))
+        frames = []
+        lo = 0
+        while lo < len(households):
+            done = cumulative[lo - 1] if lo else 0
+            hi = int(np.searchsorted(cumulative, done + PAIRS_PER_CHUNK, side='right'))
+            hi = min(max(lo + 1, hi), len(households))
+            # fridge_entries orders entries by household
+            a, b = np.searchsorted(owners, [lo, hi])
+            frames.append(self._top(households[lo:hi], self.score(owners[a:b] - lo, columns[a:b], weight[a:b]), k))
+            lo = hi
+        columns = ['householdId', 'rank', 'recipeId', 'score', 'coverage', 'missing', 'optional', 'expiring']
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+    def _top(self, households, scored, k):
+        owner, row, score, coverage, missing, optional, expiring = scored
+        # Everything scoring at least each household's k-th best, ties included, then an exact sort of those
+        starts = np.r_[0, np.flatnonzero(owner[1:] != owner[:-1]) + 1] if len(owner) else owner
+        ends = np.r_[starts[1:], len(owner)]
+        threshold = np.full(len(starts), -np.inf)
+        for h, (start, end) in enumerate(zip(starts, ends)):
+            if end - start > k:
+                threshold[h] = np.partition(score[start:end], end - start - k)[end - start - k]
+        keep = np.flatnonzero(score >= np.repeat(threshold, ends - starts))
+        keep = keep[np.lexsort((row[keep], -score[keep], owner[keep]))]
+        owner, row, score, coverage, missing, optional, expiring = (
+            a[keep] for a in (owner, row, score, coverage, missing, optional, expiring))
+        starts = np.r_[0, np.flatnonzero(owner[1:] != owner[:-1]) + 1] if len(owner) else owner
+        position = np.arange(len(owner)) - np.repeat(starts, np.diff(np.r_[starts, len(owner)]))
+        keep = position < k
+        return pd.DataFrame({
+            'householdId': [households[h].get('_id') for h in owner[keep]],
+            'rank': position[keep] + 1,
+            'recipeId': [self.recipe_ids[r] for r in row[keep]],
+            'score': score[keep].round(4),
+            'coverage': coverage[keep].round(4),
+            'missing': missing[keep].astype(np.int64),
+            'optional': optional[keep].astype(np.int64),
+            'expiring': expiring[keep].astype(np.int64),
+        })
+
+    def missing_items(self, recipe_id, household, now=None):
+        """itemIds of the recipe's required ingredients the household's fridge doesn't have."""
+        _, columns, _ = self.fridge_entries([household], now)
+        on_hand = np.zeros(len(self.item_ids), dtype=bool)
+        on_hand[columns] = True
+        needed = self.required_items[self.recipe_row[recipe_id]]
+        return [self.item_ids[c] for c in needed[~on_hand[needed]]]
+
+
+def rank_households(db, k=DEFAULT_K, query=None, now=None):
+    """Top-k recipes for every household matching `query`."""
+    index = RecipeIndex.from_db(db)
+    households = db.households.find(query or {}, {'fridgeItems': 1})
+    return index.rank(households, k, now)
+
+
+def naive_rank(recipes, household, k=DEFAULT_K, now=None):
+    """Scan every recipe's ingredient list for one household; the baseline the benchmark compares against."""
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    fridge = {}
+    for entry in household.get('fridgeItems') or []:
+        quantity = entry.get('quantity')
+        if quantity is not None and quantity <= 0:
+            continue
+        days_left = (entry['expirationDate'] - now).total_seconds() / 86_400 if entry.get('expirationDate') else np.inf
+        if days_left < 0:
+            continue
+        weight = min(1.0, max(0.0, 1 - days_left / EXPIRING_DAYS))
+        fridge[entry['itemId']] = max(weight, fridge.get(entry['itemId'], 0.0))
+    scored = []
+    for row, recipe in enumerate(recipes):
+        ingredients = {}
+        for ingredient in recipe.get('ingredients') or []:
+            ingredients[ingredient['itemId']] = ingredients.get(ingredient['itemId'], False) \
+                or not ingredient.get('isOptional')
+        used = [item for item in ingredients if item in fridge]
+        if not used:
+            continue
+        n_required = sum(ingredients.values())
+        have = sum(1 for item in used if ingredients[item])
+        coverage = have / n_required if n_required else 1.0
+        score = coverage - MISSING_PENALTY * (n_required - have) + EXPIRING_WEIGHT * sum(fridge[i] for i in used)
+        scored.append((-score, row, recipe['_id']))
+    return [(recipe_id, -neg_score) for neg_score, _, recipe_id in sorted(scored)[:k]]
+
+
+def synthetic_data(n_items, n_recipes, n_households, fridge_size=40, seed=0):
+    """Recipes over Zipf-popular items (a few staples in most recipes) and fridges with expiry dates."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, n_items + 1) ** 0.9
+    weights /= weights.sum()
+    items = [f'item{i}' for i in range(n_items)]
+    sizes = rng.integers(4, 16, n_recipes)
+    picks = rng.choice(n_items, sizes.sum(), p=weights)
+    optional = rng.random(sizes.sum()) < 0.15
+    recipes = []
+    start = 0
+    for r, size in enumerate(sizes):
+        recipes.append({'_id': f'recipe{r}', 'ingredients': [
+            {'itemId': items[i], 'isOptional': bool(o)}
+            for i, o in zip(picks[start:start + size], optional[start:start + size])]})
+        start += size
+    now = datetime.datetime(2024, 6, 1)
+    picker = random.Random(seed)
+    households = []
+    for h in range(n_households):
+        fridge = rng.choice(n_items, fridge_size, p=weights)
+        households.append({'_id': f'household{h}', 'fridgeItems': [
+            {'itemId': items[i], 'quantity': picker.choice([0, 1, 1, 2, 3]),
+             'expirationDate': now + datetime.timedelta(days=picker.uniform(-2, 20))} for i in fridge]})
+    return recipes, households, now
+
+
+def benchmark(n_recipes, n_households, n_items=20_000, k=DEFAULT_K):
+    recipes, households, now = synthetic_data(n_items, n_recipes, n_households)
+    start = time.perf_counter()
+    index = RecipeIndex.from_recipes(recipes)
+    print(f"Indexed {n_recipes} recipes ({sum(len(s) for s in index.segments):,} postings) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    result = index.rank(households, k, now)
+    elapsed = time.perf_counter() - start
+    print(f"Ranked top {k} for {n_households} households in {elapsed:.2f}s "
+          f"({elapsed / n_households * 1000:.2f} ms/household)")
+
+    start = time.perf_counter()
+    single = index.rank(households[:1], k, now)
+    print(f"One fridge: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    sample = households[:20]
+    start = time.perf_counter()
+    naive = [naive_rank(recipes, household, k, now) for household in sample]
+    naive_sec = (time.perf_counter() - start) / len(sample)
+    same = all(
+        np.allclose([score for _, score in expected],
+                    result.loc[result['householdId'] == household['_id'], 'score'].to_numpy(), atol=1e-4)
+        for household, expected in zip(sample, naive))
+    print(f"Scanning every recipe: {naive_sec * 1000:.0f} ms/household (~{naive_sec * n_households:,.0f}s for all); "
+          f"top-{k} scores match: {same}; single-fridge result matches: "
+          f"{single['score'].tolist() == result.loc[result['householdId'] == 'household0', 'score'].tolist()}")
+
+    extra, _, _ = synthetic_data(n_items, 1_000, 0, seed=1)
+    for recipe in extra:
+        recipe['_id'] = 'new-' + recipe['_id']
+    start = time.perf_counter()
+    index.add_recipes(extra)
+    print(f"Added {len(extra)} recipes in {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"({len(index.segments)} segments)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help='recipes per household')
+    parser.add_argument('--household', help='rank for this household _id only')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGODB_DB_NAME', 'kitchenassist'))
+    parser.add_argument('--benchmark', action='store_true', help='time against a full scan on synthetic data')
+    parser.add_argument('--recipes', type=int, default=100_000)
+    parser.add_argument('--households', type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.recipes, args.households, k=args.k)
+        return
+    from bson import ObjectId
+    from pymongo import MongoClient
+    client = MongoClient(args.uri)
+    try:
+        db = client[args.db]
+        query = {'_id': ObjectId(args.household)} if args.household else None
+        result = rank_households(db, args.k, query)
+        names = {recipe['_id']: recipe['name'] for recipe in db.recipes.find(
+            {'_id': {'$in': list(result['recipeId'])}}, {'name': 1})}
+    finally:
+        client.close()
+    result['recipe'] = result['recipeId'].map(names)
+    print(result.drop(columns='recipeId').to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
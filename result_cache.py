@@ -0,0 +1,157 @@
+"""Persistent cache of pipeline run responses, keyed by pipeline + normalized source.
+
+URL fields of a payload are normalized before hashing (scheme/host case,
+fragments, tracking parameters, YouTube short links and timestamps), so
+re-submitting the same article or video with a different share link is still
+a hit. The rest of the payload is part of the key as given.
+Receipt images can be keyed by content hash with image_source().
+
+Entries live in a SQLite file with a TTL, LRU eviction and a total size cap.
+PipelineClient(cache=ResultCache(...)) serves hits without starting a run and
+coalesces concurrent requests for the same key into one in-flight run.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_CACHE_PATH = 'pipeline_cache.sqlite'
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 100_000
+
+# Click-tracking query parameters that never change what a page is, on any host
+TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'mc_cid', 'mc_eid'}
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com'}
+# Share and playback parameters that are only known to be safe to drop on these hosts;
+# elsewhere e.g. t= or ref= can select the content
+HOST_PARAMS = {host: {'t', 'si', 'pp', 'feature'} for host in YOUTUBE_HOSTS}
+
+
+def normalize_url(url):
+    """Canonical form of a source URL for cache keys."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'https'
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in {('http', 80), ('https', 443)}:
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+
+    # Every YouTube link form for a video collapses to watch?v=<id>
+    if host == 'youtu.be':
+        return f"https://www.youtube.com/watch?v={path.lstrip('/')}"
+    if host in YOUTUBE_HOSTS:
+        video_id = dict(parse_qsl(parts.query)).get('v')
+        if path.startswith('/shorts/'):
+            video_id = path.split('/')[2]
+        if video_id:
+            return f"https://www.youtube.com/watch?v={video_id}"
+
+    if scheme == 'http':
+        scheme = 'https'
+    if host.startswith('www.'):
+        host = host[4:]
+    dropped = TRACKING_PARAMS | HOST_PARAMS.get(parts.hostname, set())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in dropped and not k.startswith('utm_'))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def image_source(data):
+    """Content-hash source for a receipt image given as bytes."""
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def payload_source(payload):
+    """Source identity of a start_pipeline payload, or None if it has nothing to key on.
+
+    The key is a hash of the whole payload's canonical JSON with URL-valued
+    fields normalized, so two payloads for the same link but different options
+    stay apart. An empty payload (e.g. the email pipeline, whose input is an
+    inbox) is never cached.
+    """
+    if not payload:
+        return None
+    normalized = dict(payload)
+    for key, value in payload.items():
+        if isinstance(value, str) and value.startswith(('http://', 'https://')):
+            normalized[key] = normalize_url(value)
+    canonical = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return 'sha256:' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def cache_key(pipeline, source):
+    return hashlib.sha256(f"{pipeline}\0{source}".encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """SQLite-backed run response cache with TTL, LRU eviction and a size cap."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, pipeline TEXT, source TEXT, value BLOB,"
+            " size INTEGER, created_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def get(self, pipeline, source):
+        """Cached run response, or None if missing or expired."""
+        key = cache_key(pipeline, source)
+        row = self._db.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        now = time.time()
+        if now - created_at > self.ttl:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return json.loads(zlib.decompress(value))
+
+    def put(self, pipeline, source, response):
+        value = zlib.compress(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cache_key(pipeline, source), pipeline, source, value, len(value), now, now),
+        )
+        self.evict(now)
+        self._db.commit()
+
+    def evict(self, now=None):
+        """Drop expired entries, then least recently used ones beyond the size and entry caps."""
+        now = now or time.time()
+        self._db.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+        total_bytes, total_entries = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM results").fetchone()
+        if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+            return
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+            if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                break
+            doomed.append((key,))
+            total_bytes -= size
+            total_entries -= 1
+        self._db.executemany("DELETE FROM results WHERE key = ?", doomed)
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
@@ -0,0 +1,11 @@
+import pandas as pd
+
+from aisle_classifier import AisleClassifier, assign_aisle_rule_loop, synthetic_names
+
+
+def test_classifier_matches_rule_loop():
+    names = pd.Series(synthetic_names(5_000) + ['', 'CHEDDAR', 'whole wheat bread 675g'])
+    expected = names.apply(assign_aisle_rule_loop)
+    classifier = AisleClassifier()
+    assert names.apply(classifier.classify).equals(expected)
+    assert (classifier.classify_series(names).to_numpy() == expected.to_numpy()).all()
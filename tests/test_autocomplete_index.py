@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+
+from autocomplete_index import AutocompleteIndex, RANKINGS, index_names, synthetic_catalog
+from catalog_matcher import normalize_name
+
+
+def token_prefix_top(names, text, k):
+    """Suggestions (in rank order) having a token-start suffix that starts with text."""
+    return [entry for entry, name in enumerate(names)
+            if (' ' + name).find(' ' + text) >= 0][:k]
+
+
+def test_top_matches_brute_force():
+    ids, names, prices = synthetic_catalog(20_000)
+    for rank in RANKINGS:
+        index = AutocompleteIndex.build(ids, names, prices, rank=rank, k=10, scan_limit=32)
+        normalized = index_names(index)
+        rng = random.Random(0)
+        for _ in range(200):
+            name = rng.choice(normalized)
+            starts = [0] + [i + 1 for i, c in enumerate(name) if c == ' ']
+            start = rng.choice(starts)
+            text = name[start:start + rng.randint(1, 40)]
+            assert list(index.top(text)) == token_prefix_top(normalized, text, 10), (rank, text)
+
+
+def test_save_load_round_trip(tmp_path):
+    ids, names, prices = synthetic_catalog(2_000)
+    index = AutocompleteIndex.build(ids, names, prices)
+    index.save(tmp_path / 'index')
+    loaded = AutocompleteIndex.load(tmp_path / 'index')
+    for text in ('a', 'ch', 'milk', 'zzz'):
+        assert list(loaded.top(text)) == list(index.top(text))
+
+
+def test_accents_are_stripped():
+    assert normalize_name('Crème Fraîche, 35%!') == 'creme fraiche 35'
+    assert normalize_name('BŒUF haché') == 'boeuf hache'
+    ids = np.array(['a', 'b', 'c'])
+    names = np.array(['Crème fraîche 35%', 'Café Noir', 'Bœuf haché'], dtype=object)
+    index = AutocompleteIndex.build(ids, names, np.array([1.0, 2.0, 3.0]))
+    assert [s['id'] for s in index.complete('creme')] == ['a']
+    assert [s['id'] for s in index.complete('crème fr')] == ['a']
+    assert [s['id'] for s in index.complete('cafe')] == ['b']
+    assert [s['id'] for s in index.complete('boeuf')] == ['c']
+    assert index.complete('me') == []
@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+
+from basket_optimizer import PriceMatrix, ShoppingLists, naive_optimize, optimize, synthetic_data
+
+
+def assert_matches_naive(matrix, households, result, k, nearest=None):
+    naive = np.array([naive_optimize(matrix, h, k, (nearest or {}).get(h['_id'])) for h in households])
+    # optimize() reports totals rounded to the cent
+    assert np.allclose(np.nan_to_num(result['best_store_total'][:len(households)], nan=np.inf), naive[:, 0],
+                       atol=0.01)
+    assert np.allclose(np.nan_to_num(result['split_total'][:len(households)], nan=np.inf), naive[:, 1], atol=0.01)
+
+
+def test_optimize_matches_naive():
+    docs, households = synthetic_data(300, 12, 150, list_size=10)
+    matrix = PriceMatrix.from_inventory(docs)
+    for k in (1, 2, 3):
+        assert_matches_naive(matrix, households, optimize(matrix, ShoppingLists(households, matrix), k), k)
+
+
+def test_households_without_preferred_stores_are_capped():
+    docs, households = synthetic_data(300, 40, 100, list_size=10)
+    for household in households:
+        household['preferredStores'] = []
+    matrix = PriceMatrix.from_inventory(docs)
+    lists = ShoppingLists(households, matrix, max_candidates=8)
+    assert (lists.n_candidates == 8).all()
+    assert_matches_naive(matrix, households, optimize(matrix, lists, 2), 2)
+
+
+def test_nearest_candidates():
+    docs, households = synthetic_data(300, 40, 100, list_size=10)
+    for household in households:
+        household['preferredStores'] = []
+    matrix = PriceMatrix.from_inventory(docs)
+    rng = random.Random(0)
+    nearest = {h['_id']: rng.sample(matrix.store_ids, 10) for h in households}
+    result = optimize(matrix, ShoppingLists(households, matrix, nearest), 3)
+    assert_matches_naive(matrix, households, result, 3, nearest)
+    for stores, household in zip(result['split_stores'], households):
+        assert set(stores) <= set(nearest[household['_id']][:8])
+
+
+def test_empty_and_unknown_lists():
+    docs, households = synthetic_data(50, 5, 2, list_size=5)
+    matrix = PriceMatrix.from_inventory(docs)
+    households += [{'_id': 'empty'}, {'_id': 'unknown', 'shoppingList': [{'itemId': 'nope'}]}]
+    result = optimize(matrix, ShoppingLists(households, matrix), 2)
+    assert result['split_total'].tolist()[-2:] == [0.0, 0.0]
+    assert result['unavailable'].tolist()[-2:] == [0, 0]
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+import batch_receipts
+
+Image = pytest.importorskip("PIL.Image")
+
+
+class FakeClient:
+    """Stands in for PipelineClient: each run takes RUN_SECONDS within the in-flight limit."""
+
+    RUN_SECONDS = 0.1
+
+    def __init__(self, *args, max_concurrency=16, **kwargs):
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def run(self, saved_item_id, payload):
+        async with self._slots:
+            await asyncio.sleep(self.RUN_SECONDS)
+            return {"state": "DONE", "log": []}
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    image = tmp_path / "receipt.jpg"
+    Image.new("RGB", (300, 800), "white").save(image)
+    path = tmp_path / "manifest.jsonl"
+    lines = [json.dumps({"image": str(image), "id": f"r{i}"}) for i in range(12)]
+    lines += [json.dumps({"id": "no-source"}), "42"]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_manifest_lines_without_a_source_are_skipped(manifest):
+    loaded = batch_receipts.load_receipts(str(manifest))
+    assert [rid for rid, _ in loaded] == [f"r{i}" for i in range(12)]
+
+
+def test_batch_latency_is_run_time(manifest, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_receipts, "PipelineClient", FakeClient)
+    loaded = batch_receipts.load_receipts(str(manifest))
+    records, _, _ = asyncio.run(batch_receipts.run_batch(loaded, tmp_path / "out", 3, {}, preprocess=False))
+    assert all(record["status"] == "done" for record in records)
+    assert max(record["latency"] for record in records) < 2 * FakeClient.RUN_SECONDS
+    assert max(record["wait"] for record in records) >= 3 * FakeClient.RUN_SECONDS
+
+
+def test_resume_skips_truncated_status_line(manifest, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_receipts, "PipelineClient", FakeClient)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    # A run killed while writing its last record
+    (out_dir / "status.jsonl").write_text(json.dumps({"id": "old", "status": "done"}) + '\n{"id": "r0", "sta')
+    loaded = batch_receipts.load_receipts(str(manifest))
+    records, _, _ = asyncio.run(batch_receipts.run_batch(loaded, out_dir, 3, {}))
+    assert len(records) == 12
+
+    lines = (out_dir / "status.jsonl").read_text().splitlines()
+    assert lines[1] == '{"id": "r0", "sta'
+    assert sorted(json.loads(line)["id"] for line in lines[2:]) == sorted(rid for rid, _ in loaded)
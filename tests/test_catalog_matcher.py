@@ -0,0 +1,62 @@
+import math
+import random
+
+import pytest
+
+import catalog_matcher
+from catalog_matcher import TOKEN_BOOST, TOKEN_PREFIX, CatalogIndex, name_features, normalize_name, synthetic_names
+
+
+def brute_force(names):
+    """Scorer of a query against every row with the index's weights, returning the best k scores."""
+    features = [name_features(name) for name in names]
+    df = {}
+    for row in features:
+        for feature in row:
+            df[feature] = df.get(feature, 0) + 1
+    weight = {feature: ((math.log((len(names) + 1) / (count + 1)) + 1.0)
+                        * (TOKEN_BOOST if feature.startswith(TOKEN_PREFIX) else 1.0)) ** 2
+              for feature, count in df.items()}
+    norms = [math.sqrt(sum(weight[feature] for feature in row)) for row in features]
+
+    def top(query, k):
+        query = {feature for feature in name_features(query) if feature in df}
+        query_norm = math.sqrt(sum(weight[feature] for feature in query))
+        scores = [sum(weight[feature] for feature in query & row) / norm / query_norm
+                  for row, norm in zip(features, norms)]
+        return sorted((score for score in scores if score > 0), reverse=True)[:k]
+    return top
+
+
+@pytest.mark.parametrize('budget', [catalog_matcher.CANDIDATE_BUDGET, 64])
+def test_matches_are_the_true_top_k(budget, monkeypatch):
+    # A small first budget makes most queries go back for more postings
+    monkeypatch.setattr(catalog_matcher, 'CANDIDATE_BUDGET', budget)
+    names = synthetic_names(5_000)
+    index = CatalogIndex()
+    index.add(range(len(names)), names)
+    index.rebuild()
+    top = brute_force(names)
+    rng = random.Random(1)
+    for name in rng.sample(names, 50):
+        # Receipt-style: no brand or size
+        query = ' '.join(name.split()[1:-1])
+        got = [score for _, _, score in index.match(query, 5)]
+        expected = top(query, 5)
+        assert len(got) == len(expected)
+        assert all(math.isclose(a, b) for a, b in zip(got, expected))
+
+
+def test_full_name_matches_itself():
+    names = synthetic_names(2_000)
+    index = CatalogIndex()
+    index.add(range(len(names)), names)
+    for row in (0, 17, 1_999):
+        best, _, score = index.match(names[row], 1)[0]
+        assert normalize_name(names[best]) == normalize_name(names[row])
+        assert math.isclose(score, 1.0)
+
+
+def test_normalize_name():
+    assert normalize_name('  Fresh, 2% MILK! 4L ') == 'fresh 2 milk 4l'
+    assert normalize_name(None) == 'none'
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from consumption_forecast import KEYS, ConsumptionModel, fridge_frame, python_stats, synthetic_data, update
+
+
+def test_stats_match_python_loop():
+    history, _, _, _ = synthetic_data(20_000, 300)
+    model = ConsumptionModel.from_history(history.iloc[:15_000])
+    # Incremental folds must add up to the same statistics
+    model.fold(history.iloc[15_000:])
+    stats = model.stats.set_index(KEYS)
+    expected = pd.DataFrame.from_dict(python_stats(history.to_dict('records')), orient='index')
+    assert len(stats) == len(expected)
+    assert np.allclose(stats.loc[list(expected.index), ['events', 'quantity', 'waste_events']].to_numpy(),
+                       expected[['events', 'quantity', 'waste_events']].to_numpy())
+
+
+def test_empty_fridge():
+    history, _, shelf_life, now = synthetic_data(2_000, 20)
+    model = ConsumptionModel.from_history(history)
+    for households in ([], [{'_id': 'h', 'fridgeItems': []}]):
+        assert len(model.forecast(fridge_frame(households), shelf_life, now)) == 0
+
+
+def test_likely_waste_needs_a_rate():
+    history, _, shelf_life, now = synthetic_data(2_000, 20)
+    model = ConsumptionModel.from_history(history)
+    fridge = fridge_frame([{'_id': 'new', 'fridgeItems': [
+        {'_id': 'e', 'itemId': 'never-seen', 'quantity': 1, 'unit': 'g', 'expirationDate': now}]}])
+    result = model.forecast(fridge, shelf_life, now)
+    assert result['rate'].isna().all()
+    assert not result['likely_waste'].any()
+
+
+def test_update_folds_late_events_at_the_watermark_once(tmp_path):
+    mongomock = pytest.importorskip("mongomock")
+    history, _, _, _ = synthetic_data(2_000, 20)
+    records = history.to_dict('records')
+    for record in records:
+        record['createdAt'] = record['createdAt'].to_pydatetime()
+        record['consumptionDate'] = record['consumptionDate'].to_pydatetime()
+        record['originalPurchaseDate'] = record['originalPurchaseDate'].to_pydatetime()
+    db = mongomock.MongoClient().db
+    # The last event of the first read shares its createdAt with one inserted after the read
+    late = dict(records[1_000], _id='late')
+    db.consumptionHistory.insert_many(records[:1_001])
+    model, read = update(db, str(tmp_path))
+    assert read == 1_001
+    db.consumptionHistory.insert_many([late] + records[1_001:])
+    model, read = update(db, str(tmp_path))
+    assert read == len(records) - 1_001 + 2
+    assert model.events == len(records) + 1
+    expected = ConsumptionModel.from_history(pd.DataFrame(records + [late]))
+    assert model.stats['events'].sum() == expected.stats['events'].sum()
+    assert model.stats['waste_events'].sum() == expected.stats['waste_events'].sum()
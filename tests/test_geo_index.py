@@ -0,0 +1,19 @@
+import numpy as np
+
+from geo_index import SphereIndex, haversine_km, synthetic_data
+
+
+def test_knn_and_within_match_pairwise_haversine(tmp_path):
+    store_ids, stores, _, households = synthetic_data(3_000, 500)
+    index = SphereIndex.build(store_ids, stores)
+    index.save(tmp_path / 'index')
+    index = SphereIndex.load(tmp_path / 'index')
+    distances = haversine_km(households, index.lonlat)
+
+    rows, km = index.knn(households, 5)
+    assert np.allclose(km, np.sort(distances, axis=1)[:, :5], atol=1e-6)
+    assert np.allclose(np.take_along_axis(distances, rows, axis=1), km, atol=1e-6)
+
+    query, point, _ = index.within(households, 5.0)
+    got = set(zip(query.tolist(), point.tolist()))
+    assert got == set(zip(*np.nonzero(distances <= 5.0)))
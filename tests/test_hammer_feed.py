@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+import hammer_feed
+
+PRODUCT_CSV = """id,concatted,vendor,product_name,units,brand,detail_url,sku,upc
+1,a,Metro,Milk 2%,4 L,Natrel,https://x/1,00123,000111222333
+2,b,Loblaws,Bread,675 g,,https://x/2,,
+3,c,Metro,Eggs,12,Burnbrae,https://x/3,77,4011
+"""
+RAW_CSV = """nowtime,current_price,old_price,price_per_unit,other,product_id
+2024-02-18 09:30:00,4.99,,$1.25/1L,,1
+2024-02-18 10:00:00,3.49,3.99,,SALE,2
+2024-02-19 08:15:00,Call for price,,,,1
+"""
+
+
+@pytest.fixture
+def feeds(tmp_path):
+    product, raw = tmp_path / 'product.csv', tmp_path / 'raw.csv'
+    product.write_text(PRODUCT_CSV)
+    raw.write_text(RAW_CSV)
+    return str(product), str(raw)
+
+
+@pytest.mark.parametrize('engine', hammer_feed.ENGINES)
+def test_declared_dtypes(feeds, engine):
+    product_path, raw_path = feeds
+    product = hammer_feed.read_product_csv(product_path, engine=engine)
+    assert list(product.columns) == list(hammer_feed.PRODUCT_SCHEMA)
+    assert product['id'].dtype == 'int64'
+    for column in ('vendor', 'units', 'brand'):
+        assert isinstance(product[column].dtype, pd.CategoricalDtype)
+    # Identifiers stay text: no leading zeros lost to a float column
+    assert product['upc'].tolist()[::2] == ['000111222333', '4011']
+    assert product['sku'][0] == '00123'
+    assert product['upc'].isna()[1] and product['brand'].isna()[1]
+
+    raw = hammer_feed.read_raw_csv(raw_path, columns=['nowtime', 'current_price', 'product_id'], engine=engine)
+    assert list(raw.columns) == ['nowtime', 'current_price', 'product_id']
+    assert pd.api.types.is_datetime64_any_dtype(raw['nowtime'])
+    assert raw['nowtime'][2] == pd.Timestamp('2024-02-19 08:15:00')
+    assert raw['current_price'].astype(str).tolist() == ['4.99', '3.49', 'Call for price']
+
+
+@pytest.mark.parametrize('engine', hammer_feed.ENGINES)
+def test_streamed_chunks_match_whole_read(feeds, engine):
+    _, raw_path = feeds
+    chunks = list(hammer_feed.iter_raw_csv(raw_path, chunksize=2, engine=engine))
+    streamed = hammer_feed.plain_strings(pd.concat(chunks, ignore_index=True))
+    whole = hammer_feed.plain_strings(hammer_feed.read_raw_csv(raw_path, engine=engine))
+    # A chunk where a column is all missing has no categories to take a dtype from, so compare values
+    pd.testing.assert_frame_equal(streamed, whole, check_dtype=False)
+    assert not any(isinstance(dtype, pd.CategoricalDtype) for dtype in streamed.dtypes)
+
+
+def test_unknown_columns_are_rejected(feeds):
+    with pytest.raises(ValueError, match='not in the feed schema'):
+        hammer_feed.read_raw_csv(feeds[1], columns=['nowtime', 'price'])
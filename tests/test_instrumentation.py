@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Enabled instrumentation with a fresh registry, without the atexit dump."""
+    registry = instrumentation.Registry()
+    monkeypatch.setattr(instrumentation, '_registry', registry)
+    monkeypatch.setattr(instrumentation, '_output_path', None)
+    return registry
+
+
+def record_some():
+    with instrumentation.span('parse', rows=10, stage='a'):
+        pass
+    with instrumentation.span('parse', stage='a') as span:
+        span.add_rows(5)
+    assert list(instrumentation.timed_iter([[1, 2], [3]], 'read')) == [[1, 2], [3]]
+    instrumentation.add('receipts', 2, status='done')
+    instrumentation.add('receipts', status='done')
+    for seconds in (0.01, 0.3, 500):
+        instrumentation.observe('run_seconds', seconds, pipeline='p"1')
+
+
+def test_disabled_is_a_no_op(monkeypatch, tmp_path):
+    monkeypatch.setattr(instrumentation, '_registry', None)
+    assert not instrumentation.enabled()
+    assert instrumentation.span('parse', rows=3) is instrumentation._NOOP_SPAN
+    items = [[1], [2]]
+    assert list(instrumentation.timed_iter(items, 'read')) == items
+    record_some()
+    instrumentation.dump(str(tmp_path / 'metrics.json'))
+    assert not (tmp_path / 'metrics.json').exists()
+
+
+def test_json_dump(registry, tmp_path):
+    record_some()
+    path = tmp_path / 'metrics.json'
+    instrumentation.dump(str(path))
+    metrics = json.loads(path.read_text())
+
+    spans = {span['name']: span for span in metrics['spans']}
+    assert spans['parse']['labels'] == {'stage': 'a'}
+    assert (spans['parse']['calls'], spans['parse']['rows']) == (2, 15)
+    assert (spans['read']['calls'], spans['read']['rows']) == (2, 3)
+    assert spans['parse']['peak_rss_mb'] > 0
+    assert metrics['counters'] == [{'name': 'receipts', 'labels': {'status': 'done'}, 'value': 3}]
+    [histogram] = metrics['histograms']
+    assert histogram['count'] == 3
+    assert (histogram['buckets']['0.05'], histogram['buckets']['0.5'], histogram['buckets']['+Inf']) == (1, 1, 1)
+
+
+def test_prometheus_dump(registry, tmp_path):
+    record_some()
+    path = tmp_path / 'metrics.prom'
+    instrumentation.dump(str(path))
+    lines = path.read_text().splitlines()
+    assert '# TYPE pantrypilot_span_calls_total counter' in lines
+    assert 'pantrypilot_span_calls_total{span="parse",stage="a"} 2' in lines
+    assert 'pantrypilot_span_rows_total{span="read"} 3' in lines
+    assert 'pantrypilot_receipts_total{status="done"} 3' in lines
+    assert '# TYPE pantrypilot_run_seconds histogram' in lines
+    # Buckets are cumulative; label values are escaped
+    assert 'pantrypilot_run_seconds_bucket{pipeline="p\\"1",le="0.5"} 2' in lines
+    assert 'pantrypilot_run_seconds_bucket{pipeline="p\\"1",le="+Inf"} 3' in lines
+    assert 'pantrypilot_run_seconds_count{pipeline="p\\"1"} 3' in lines
+    assert len([line for line in lines if line.startswith('# TYPE pantrypilot_run_seconds ')]) == 1
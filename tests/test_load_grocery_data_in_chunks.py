@@ -0,0 +1,68 @@
+import pandas as pd
+
+import load_grocery_data_in_chunks as grocery
+from benchmarks import write_raw_csv
+
+
+def naive_latest(raw_path):
+    """Whole-file read and idxmax per product, the reference the other paths must match."""
+    frame = pd.read_csv(raw_path, usecols=grocery.RAW_COLUMNS, parse_dates=['nowtime'])
+    return frame.loc[frame.groupby('product_id')['nowtime'].idxmax()]
+
+
+def comparable(frame):
+    frame = frame[grocery.RAW_COLUMNS].sort_values('product_id', ignore_index=True)
+    return frame.astype({'nowtime': 'datetime64[s]'}).astype(str)
+
+
+def test_streaming_matches_naive(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    write_raw_csv(raw, 30_000, 500)
+    expected = comparable(naive_latest(raw))
+    pd.testing.assert_frame_equal(comparable(grocery.stream_latest_raw(str(raw), chunksize=7_000)), expected)
+
+
+def test_parallel_matches_naive(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    write_raw_csv(raw, 30_000, 500)
+    expected = comparable(naive_latest(raw))
+    pd.testing.assert_frame_equal(comparable(grocery.parallel_latest_raw(str(raw), workers=2)), expected)
+
+
+def test_incremental_matches_naive(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    write_raw_csv(raw, 30_000, 500)
+    expected = comparable(naive_latest(raw))
+    # Consume the first part of the feed, then the rows appended after it
+    lines = raw.read_text().splitlines(keepends=True)
+    partial = tmp_path / 'partial.csv'
+    partial.write_text(''.join(lines[:12_000]))
+    state = str(tmp_path / 'state.parquet')
+    grocery.incremental_latest_raw(str(partial), state)
+    partial.write_text(''.join(lines))
+    pd.testing.assert_frame_equal(comparable(grocery.incremental_latest_raw(str(partial), state)), expected)
+
+
+def test_incremental_reads_unterminated_last_row_once_feed_stops_growing(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    write_raw_csv(raw, 5_000, 100)
+    text = raw.read_text()
+    raw.write_text(text.rstrip('\n'))
+    state = str(tmp_path / 'state.parquet')
+
+    # The unterminated row may still be being written, so the first run leaves it
+    lines = text.splitlines(keepends=True)
+    head = tmp_path / 'head.csv'
+    head.write_text(''.join(lines[:-1]))
+    first = grocery.incremental_latest_raw(str(raw), state)
+    pd.testing.assert_frame_equal(comparable(first), comparable(naive_latest(head)))
+
+    # Same size on the next run: EOF ends the row
+    settled = grocery.incremental_latest_raw(str(raw), state)
+    pd.testing.assert_frame_equal(comparable(settled), comparable(naive_latest(raw)))
+
+    # The writer finishes the row and appends more; nothing is read twice or lost
+    with open(raw, 'a') as f:
+        f.write('\n' + ''.join(lines[1:50]))
+    grown = grocery.incremental_latest_raw(str(raw), state)
+    pd.testing.assert_frame_equal(comparable(grown), comparable(naive_latest(raw)))
@@ -0,0 +1,11 @@
+import json
+
+from log_extraction import _legacy_scan, scan_log, synthetic_run_response
+
+
+def test_scan_log_matches_legacy_scan(tmp_path):
+    run_response = synthetic_run_response(3_000)
+    path = tmp_path / 'run_response.json'
+    path.write_text(json.dumps(run_response))
+    extraction = scan_log(str(path))
+    assert (extraction.key_items, extraction.created_jsons) == _legacy_scan(run_response)
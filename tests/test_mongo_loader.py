@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+import mongo_loader
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def record(name, vendor, price, old_price=None, **fields):
+    return {'product_name': name, 'vendor': vendor, 'current_price': price, 'old_price': old_price, **fields}
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()['kitchenassist']
+    db.groceryStores.insert_many([{'_id': 1, 'name': 'Loblaws Queen St'}, {'_id': 2, 'name': 'Metro Bloor'}])
+    return db
+
+
+def day(n):
+    return datetime.datetime(2024, 3, n, tzinfo=datetime.timezone.utc)
+
+
+def inventory(db, name, store_id):
+    item = db.items.find_one({'name': name})
+    return db.storeInventory.find_one({'storeId': store_id, 'itemId': item['_id']})
+
+
+def test_load_upserts_items_and_inventory(db):
+    records = [
+        record('Milk 2%', 'Loblaws', '$4.99', units='4 L', aisle='Dairy'),
+        record('Milk 2%', 'Metro', '3.99', old_price='4.49', units='4 L', aisle='Dairy'),
+        record('Bread', 'Nowhere', '2.50'),
+        record('', 'Metro', '1.00'),
+    ]
+    stats = mongo_loader.load(db, records, batch_size=2, workers=2, now=day(1))
+    assert (stats.records, stats.skipped) == (4, 1)
+    assert db.items.count_documents({}) == 2
+    milk = db.items.find_one({'name': 'Milk 2%'})
+    assert (milk['category'], milk['packageQuantity'], milk['packageUnit']) == ('Dairy', 4.0, 'L')
+
+    loblaws = inventory(db, 'Milk 2%', 1)
+    assert (loblaws['price'], loblaws['onSale'], 'salePrice' in loblaws) == (4.99, False, False)
+    metro = inventory(db, 'Milk 2%', 2)
+    assert (metro['price'], metro['salePrice'], metro['onSale']) == (4.49, 3.99, True)
+    assert metro['priceHistory'][0]['price'] == 3.99
+    # Unmatched vendors fall back to the first store
+    assert inventory(db, 'Bread', 1)['price'] == 2.5
+
+
+def test_price_history_only_grows_when_the_price_changes(db):
+    mongo_loader.load(db, [record('Eggs', 'Metro', '5.00')], now=day(1))
+    mongo_loader.load(db, [record('Eggs', 'Metro', '5.00')], now=day(2))
+    assert [entry['price'] for entry in inventory(db, 'Eggs', 2)['priceHistory']] == [5.0]
+
+    mongo_loader.load(db, [record('Eggs', 'Metro', '4.50', old_price='5.00')], now=day(3))
+    mongo_loader.load(db, [record('Eggs', 'Metro', '5.00')], now=day(4))
+    doc = inventory(db, 'Eggs', 2)
+    assert [entry['price'] for entry in doc['priceHistory']] == [5.0, 4.5, 5.0]
+    assert doc['lastUpdated'].replace(tzinfo=datetime.timezone.utc) == day(4)
+    assert 'salePrice' not in doc
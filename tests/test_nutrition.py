@@ -0,0 +1,27 @@
+import datetime
+
+import numpy as np
+
+from nutrition import NUTRIENTS, NutrientMatrix, RecipeMatrix, python_totals, recipe_updates, synthetic_data
+
+
+def test_multiply_matches_python_totals():
+    items, recipes = synthetic_data(500, 300)
+    matrix = NutrientMatrix.from_items(items)
+    _, totals = RecipeMatrix.from_recipes(recipes, matrix).multiply(matrix)
+    by_id = {item['_id']: item for item in items}
+    expected = np.array([[python_totals(by_id, recipe)[name] for name in NUTRIENTS] for recipe in recipes])
+    assert np.allclose(totals, expected)
+
+
+def test_empty_recipes_are_left_alone():
+    items, recipes = synthetic_data(50, 3)
+    recipes = [{'_id': 'first', 'ingredients': []}] + recipes + [{'_id': 'last', 'ingredients': []}]
+    matrix = NutrientMatrix.from_items(items)
+    recipe_matrix = RecipeMatrix.from_recipes(recipes, matrix)
+    contributions, totals = recipe_matrix.multiply(matrix)
+    now = datetime.datetime(2024, 6, 1)
+    updates = recipe_updates(recipe_matrix, contributions, totals, now)
+    assert len(updates) == len(recipes)
+    for update in (updates[0], updates[-1]):
+        assert update._doc == {'$set': {'nutritionalInfo.lastCalculated': now}}
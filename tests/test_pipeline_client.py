@@ -0,0 +1,51 @@
+import asyncio
+
+from aiohttp import web
+
+from pipeline_client import PipelineClient, PipelineError, PipelineTimeout, PollPolicy
+
+
+def run_against_fake_server(kinds, timeout=2):
+    """Results of one client.run() per kind against a server answering get_pl_run per run_id."""
+    polls = {}
+
+    async def start(request):
+        return web.json_response({"run_id": (await request.json())["kind"]})
+
+    async def get_run(request):
+        run_id = request.query["run_id"]
+        polls[run_id] = polls.get(run_id, 0) + 1
+        if run_id == "empty":
+            return web.Response(text="")
+        if run_id == "list":
+            return web.json_response([1, 2])
+        done = run_id == "ok" and polls[run_id] > 2
+        return web.json_response({"state": "DONE" if done else "RUNNING", "outputs": {}})
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/start_pipeline", start)
+        app.router.add_get("/get_pl_run", get_run)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        policy = PollPolicy(initial_interval=0.05, max_interval=0.05, jitter=0)
+        try:
+            async with PipelineClient(f"http://127.0.0.1:{port}", "user", timeout=timeout,
+                                      poll_policy=policy) as client:
+                runs = [client.run("pipeline", {"kind": kind}) for kind in kinds]
+                return await asyncio.wait_for(asyncio.gather(*runs, return_exceptions=True), timeout + 3)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_malformed_poll_fails_only_its_run():
+    empty, listed, ok, slow = run_against_fake_server(["empty", "list", "ok", "slow"], timeout=1)
+    assert isinstance(empty, PipelineError) and empty.response is None
+    assert isinstance(listed, PipelineError) and listed.response == [1, 2]
+    assert ok["state"] == "DONE"
+    assert isinstance(slow, PipelineTimeout)
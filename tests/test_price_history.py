@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+import price_history
+from benchmarks import write_raw_csv
+
+
+def raw_frame(path):
+    frame = pd.read_csv(path, usecols=price_history.HISTORY_COLUMNS)
+    frame['seconds'] = pd.to_datetime(frame['nowtime']).to_numpy(dtype='datetime64[s]').astype(np.int64)
+    return frame.dropna(subset=['current_price'])
+
+
+def test_history_and_daily_match_pandas(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    write_raw_csv(raw, 20_000, 300)
+    frame = raw_frame(raw)
+    for workers in (1, 2):
+        store = price_history.build(str(raw), str(tmp_path / f'raw{workers}'), workers=workers)
+        daily = price_history.build(str(raw), str(tmp_path / f'daily{workers}'), daily=True, workers=workers)
+        assert store.meta['rows'] == len(frame)
+        expected = frame.assign(day=frame['seconds'] // price_history.DAY_SECONDS).groupby(
+            ['product_id', 'day'], sort=True).agg(close=('current_price', 'last'), low=('current_price', 'min'))
+        for product_id in frame['product_id'].drop_duplicates().head(20):
+            rows = frame[frame['product_id'] == product_id].sort_values('seconds', kind='stable')
+            assert store.history(product_id)['price'].tolist() == rows['current_price'].tolist()
+            history = daily.history(product_id)
+            assert history['price'].tolist() == expected.loc[product_id, 'close'].tolist()
+            assert history['min_price'].tolist() == expected.loc[product_id, 'low'].tolist()
+
+
+def test_price_drops_match_rows_as_of_loop(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    write_raw_csv(raw, 20_000, 300)
+    store = price_history.build(str(raw), str(tmp_path / 'store'))
+    drops = store.price_drops(10, days=3)
+    end = store.meta['latest']
+    start = end - 3 * price_history.DAY_SECONDS
+    frame = raw_frame(raw).sort_values(['product_id', 'seconds'], kind='stable')
+    expected = set()
+    for product_id, rows in frame.groupby('product_id'):
+        before = rows[rows['seconds'] <= start]
+        old = before['current_price'].iloc[-1] if len(before) else rows['current_price'].iloc[0]
+        new = rows.loc[rows['seconds'] <= end, 'current_price'].iloc[-1]
+        if old > 0 and (old - new) / old * 100 >= 10:
+            expected.add(product_id)
+    assert set(drops['product_id'].tolist()) == expected
+
+
+def test_empty_feed(tmp_path):
+    raw = tmp_path / 'raw.csv'
+    raw.write_text('nowtime,current_price,old_price,price_per_unit,other,product_id\n')
+    for daily in (False, True):
+        store = price_history.build(str(raw), str(tmp_path / f'store{daily}'), daily=daily)
+        assert len(store) == 0 and store.meta['rows'] == 0
+        assert store.price_drops(10).empty
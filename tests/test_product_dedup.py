@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from catalog_matcher import normalize_name
+from product_dedup import drop_near_duplicates, find_near_duplicates, synthetic_listings
+
+
+def test_clusters_are_exactly_the_products():
+    df = synthetic_listings(5_000)
+    canonical = find_near_duplicates(df)
+    same = df.assign(canonical=canonical, key=[normalize_name(n) for n in df['product_name']])
+    # Recall: listings of one product normalize to the same name here, so they must share a cluster
+    assert (same.groupby(['true_product', 'key'])['canonical'].nunique() == 1).all()
+    # Precision: names of different products can share half their trigrams, but no cluster mixes them
+    assert (same.groupby('canonical')['true_product'].nunique() == 1).all()
+
+
+def test_members_must_match_the_canonical_row():
+    a = 'organic whole milk homogenized'
+    b = 'organic whole milk homogenized lactose free'
+    c = 'whole milk homogenized lactose free'
+    # a ~ b and b ~ c, but a and c are not similar; a is canonical (most fields)
+    df = pd.DataFrame({'product_name': [a, b, c, c + '.'], 'units': ['1l'] * 4,
+                       'vendor': ['Metro', None, None, None]})
+    assert find_near_duplicates(df, threshold=0.65).tolist() == [0, 0, 2, 2]
+
+
+def test_blank_names_stay_separate():
+    df = pd.DataFrame({'product_name': [None, '', 'Milk 2%', '  ', np.nan, 'milk 2%'], 'units': ['1l'] * 6})
+    assert find_near_duplicates(df).tolist() == [0, 1, 2, 3, 4, 2]
+    assert len(drop_near_duplicates(df)) == 5
@@ -0,0 +1,104 @@
+import random
+import shutil
+
+import numpy as np
+import pytest
+
+import batch_receipts
+import receipt_images
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+ImageFilter = pytest.importorskip("PIL.ImageFilter")
+ImageFont = pytest.importorskip("PIL.ImageFont")
+
+WORDS = ["MILK", "BREAD", "EGGS", "BUTTER", "CHEDDAR", "YOGURT", "APPLES", "CHICKEN", "RICE", "PASTA", "COFFEE",
+         "JUICE", "CEREAL", "ONIONS", "SPINACH", "TOMATOES", "FLOUR", "SUGAR", "BACON", "SALMON"]
+ADJ = ["ORG", "PC", "NN", "LRG", "2%", "FRZ", "GOLD", "LITE", "XL"]
+
+
+def receipt(seed, items=12):
+    """A receipt from one store: same header and layout, seeded items and prices."""
+    rng = random.Random(seed)
+    font = ImageFont.load_default(size=22)
+    image = Image.new("L", (640, 330 + 30 * items + 260), 250)
+    draw = ImageDraw.Draw(image)
+    draw.text((320, 30), "LOBLAWS #1234", fill=20, font=ImageFont.load_default(size=34), anchor="mt")
+    draw.text((320, 80), "123 QUEEN ST W TORONTO ON", fill=20, font=font, anchor="mt")
+    draw.text((40, 170), f"2024/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}  TRN {rng.randint(1000, 9999)}",
+              fill=20, font=font)
+    y = 230
+    for _ in range(items):
+        name = " ".join([rng.choice(ADJ), rng.choice(WORDS), rng.choice(ADJ + WORDS)])
+        draw.text((40, y), name, fill=20, font=font)
+        draw.text((600, y), f"{rng.randint(0, 19)}.{rng.randint(0, 99):02d}", fill=20, font=font, anchor="ra")
+        y += 30
+    for label in ("SUBTOTAL", "HST 13%", "TOTAL"):
+        y += 30
+        draw.text((40, y), label, fill=20, font=font)
+        draw.text((600, y), f"{rng.randint(10, 199)}.{rng.randint(0, 99):02d}", fill=20, font=font, anchor="ra")
+    return image
+
+
+def photo(image, seed, path):
+    """The receipt photographed on a dark table: scaled, rotated, unevenly lit and blurred."""
+    rng = random.Random(seed)
+    scale = rng.uniform(0.8, 1.1)
+    image = image.resize((int(image.width * scale), int(image.height * scale)), Image.BICUBIC)
+    angle = rng.uniform(-6, 6)
+    mask = Image.new("L", image.size, 255).rotate(angle, expand=True)
+    image = image.rotate(angle, Image.BICUBIC, expand=True)
+    width, height = int(image.width * rng.uniform(1.3, 1.6)), int(image.height * rng.uniform(1.1, 1.2))
+    table = Image.new("L", (width, height), rng.randint(40, 110))
+    table.paste(image, (rng.randint(0, width - image.width), rng.randint(0, height - image.height)), mask)
+    light = np.linspace(rng.uniform(0.75, 1.0), 1.0, height)[:, None]
+    lit = Image.fromarray((np.asarray(table) * light).astype(np.uint8))
+    lit.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 1.0))).convert("RGB").save(path, quality=75)
+
+
+@pytest.fixture
+def receipts(tmp_path):
+    photo(receipt(1), 10, tmp_path / "a.jpg")
+    photo(receipt(1), 11, tmp_path / "a_again.jpg")
+    photo(receipt(2), 20, tmp_path / "b.jpg")
+    shutil.copy(tmp_path / "a.jpg", tmp_path / "c.jpg")
+    return tmp_path
+
+
+def prepare(directory, max_distance=receipt_images.MAX_DISTANCE):
+    loaded = batch_receipts.load_receipts(str(directory))
+    names = {rid: source.rsplit("/", 1)[-1] for rid, source in loaded}
+    return {names[rid]: (names.get(duplicate_of), names.get(similar_to))
+            for rid, _, duplicate_of, similar_to in receipt_images.prepare_all(loaded, max_distance=max_distance)}
+
+
+def test_re_photos_are_skipped_but_other_receipts_are_not(receipts):
+    results = prepare(receipts)
+    assert results["a.jpg"] == (None, None)
+    assert results["a_again.jpg"] == (None, "a.jpg")
+    # Same store, same number of lines, different items
+    assert results["b.jpg"] == (None, None)
+    assert results["c.jpg"] == ("a.jpg", None)
+
+
+def test_negative_max_distance_only_skips_exact_copies(receipts):
+    results = prepare(receipts, max_distance=-1)
+    assert results["a_again.jpg"] == (None, None)
+    assert results["c.jpg"] == ("a.jpg", None)
+
+
+def test_distances(receipts):
+    fingerprints = {name: receipt_images.fingerprint(Image.open(receipts / name))
+                    for name in ("a.jpg", "a_again.jpg", "b.jpg")}
+    assert fingerprints["a.jpg"][0] == fingerprints["b.jpg"][0] == 12 + 6
+    stored = np.stack([fingerprints["a.jpg"], fingerprints["b.jpg"]])
+    near, far = receipt_images.distances(stored, fingerprints["a_again.jpg"])
+    assert near <= receipt_images.MAX_DISTANCE < far
+    shorter = receipt_images.fingerprint(receipt(3, items=11))
+    assert np.isinf(receipt_images.distances(stored, shorter)).all()
+    decoded = receipt_images.decode_fingerprint(receipt_images.encode_fingerprint(fingerprints["b.jpg"]))
+    assert np.array_equal(decoded, fingerprints["b.jpg"])
+
+
+def test_blank_image_has_no_fingerprint():
+    assert receipt_images.fingerprint(Image.new("RGB", (300, 800), "white")) is None
@@ -0,0 +1,38 @@
+import numpy as np
+
+from recipe_ranking import RecipeIndex, naive_rank, synthetic_data
+
+
+def assert_matches_naive(index, recipes, households, now, k=5):
+    result = index.rank(households, k, now)
+    for household in households:
+        expected = naive_rank(recipes, household, len(recipes), now)
+        got = result[result['householdId'] == household['_id']]
+        assert np.allclose(got['score'], [score for _, score in expected[:k]], atol=1e-4)
+        # Ties may be ordered differently, but every recipe returned has its naive score
+        scores = dict(expected)
+        assert np.allclose(got['score'], [scores[recipe_id] for recipe_id in got['recipeId']], atol=1e-4)
+
+
+def test_rank_matches_naive_scan():
+    recipes, households, now = synthetic_data(2_000, 3_000, 20)
+    assert_matches_naive(RecipeIndex.from_recipes(recipes), recipes, households, now)
+
+
+def test_rank_matches_naive_scan_after_updates():
+    recipes, households, now = synthetic_data(500, 1_000, 15)
+    index = RecipeIndex.from_recipes(recipes[:600])
+    index.add_recipes(recipes[600:800])
+    # Replace recipes with the ingredients of others, in a later segment
+    replacements = [dict(recipe, _id=recipes[i]['_id']) for i, recipe in zip(range(0, 100), recipes[800:900])]
+    index.add_recipes(replacements)
+    removed = {recipe['_id'] for recipe in recipes[100:150]}
+    index.remove_recipes(removed)
+    current = {recipe['_id']: recipe for recipe in recipes[:800] if recipe['_id'] not in removed}
+    current.update({recipe['_id']: recipe for recipe in replacements})
+    current = list(current.values())
+    assert len(index) == len(current)
+    assert_matches_naive(index, current, households, now)
+    index.compact()
+    assert len(index.segments) == 1
+    assert_matches_naive(index, current, households, now)
@@ -0,0 +1,57 @@
+import result_cache
+from result_cache import ResultCache, normalize_url, payload_source
+
+
+def test_normalize_url_collapses_share_links_only():
+    video = 'https://www.youtube.com/watch?v=abc123'
+    assert normalize_url('https://youtu.be/abc123?si=x&t=42') == video
+    assert normalize_url('https://m.youtube.com/shorts/abc123?feature=share') == video
+    assert normalize_url('http://WWW.Example.com/recipe/?utm_source=a&fbclid=b#top') == 'https://example.com/recipe'
+    assert normalize_url('https://example.com/r?b=2&a=1') == normalize_url('https://example.com/r?a=1&b=2')
+    # t= and ref= can select the content outside YouTube
+    assert normalize_url('https://example.com/r?t=2') != normalize_url('https://example.com/r?t=3')
+    assert normalize_url('https://example.com/r?ref=a') != normalize_url('https://example.com/r')
+
+
+def test_payload_source_keys_on_whole_payload():
+    url = {'url': 'https://youtu.be/abc123'}
+    assert payload_source(url) == payload_source({'url': 'https://www.youtube.com/watch?v=abc123&t=9'})
+    assert payload_source({**url, 'servings': 2}) != payload_source({**url, 'servings': 4})
+    assert payload_source({'a': 1, 'b': 2}) == payload_source({'b': 2, 'a': 1})
+    assert payload_source({}) is None
+
+
+def test_ttl_expires_entries(tmp_path, monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), ttl=60)
+    cache.put('recipe', 'src', {'state': 'DONE'})
+    now[0] += 59
+    assert cache.get('recipe', 'src') == {'state': 'DONE'}
+    assert cache.get('other', 'src') is None
+    now[0] += 2
+    assert cache.get('recipe', 'src') is None
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_lru_eviction_and_persistence(tmp_path, monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(path, max_entries=2)
+    for source in ['a', 'b']:
+        now[0] += 1
+        cache.put('recipe', source, {'source': source})
+    now[0] += 1
+    assert cache.get('recipe', 'a') == {'source': 'a'}
+    now[0] += 1
+    cache.put('recipe', 'c', {'source': 'c'})
+    # b is the least recently used entry
+    assert cache.get('recipe', 'b') is None
+    cache.close()
+
+    reopened = ResultCache(path, max_entries=2)
+    assert reopened.get('recipe', 'a') == {'source': 'a'}
+    assert reopened.get('recipe', 'c') == {'source': 'c'}
+    reopened.close()
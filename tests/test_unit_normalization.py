@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from unit_normalization import parse_quantities, parse_unit_prices
+
+
+def test_parse_quantities():
+    parsed = parse_quantities(pd.Series(['500g', '1.36kg', '6 x 355 ml', '1 1/2 lb', '4 per pack', '$32.90/1kg',
+                                         None, 'bogus', '500g']))
+    assert parsed['base_unit'].tolist()[:5] == ['g', 'g', 'ml', 'g', 'each']
+    assert np.allclose(parsed['base_quantity'][:5], [500, 1360, 2130, 680.388, 4])
+    assert parsed['base_quantity'][5:8].isna().all()
+    assert parsed.iloc[8].equals(parsed.iloc[0])
+
+
+def test_parse_unit_prices():
+    parsed = parse_unit_prices(pd.Series(['$0.48/100g', '($6.59 per item)', None]))
+    assert parsed['base_unit'].tolist()[:2] == ['g', 'each']
+    assert np.allclose(parsed['unit_price'][:2], [0.0048, 6.59])
+    assert np.isnan(parsed['unit_price'][2])
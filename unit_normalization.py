@@ -0,0 +1,241 @@
+"""Column-at-a-time unit parsing and price-per-base-unit normalization.
+
+The hammer `units` column mixes package sizes ("500g", "1.36kg", "6 x 355 ml",
+"1 1/2 lb", "4 per pack") with vendor unit prices ("$32.90/1kg",
+"($6.59 per item)"), and `price_per_unit` holds strings like "$0.48/100g".
+This module parses whole columns, maps unit aliases onto the canonical units
+of kitchenassist/utils/unitConversion.ts and converts everything to its base
+unit (g for mass, ml for volume, each for discrete items).
+
+add_unit_prices() adds a float `price_per_base_unit` column, so cross-vendor
+price ranking is a sort within each `base_unit`. Distinct strings are parsed
+once (catalog units repeat heavily) and the arithmetic runs in NumPy.
+
+Usage:
+    python unit_normalization.py --catalog latest_grocery_data.parquet [--top 10]
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# Canonical unit -> (base unit, factor to base), as in normalizeQuantity()
+UNIT_FACTORS = {
+    'g': ('g', 1.0),
+    'kg': ('g', 1000.0),
+    'mg': ('g', 0.001),
+    'oz': ('g', 28.3495),
+    'lb': ('g', 453.592),
+    'ml': ('ml', 1.0),
+    'l': ('ml', 1000.0),
+    'tsp': ('ml', 4.92892),
+    'tbsp': ('ml', 14.7868),
+    'cup': ('ml', 236.588),
+    'fl oz': ('ml', 29.5735),
+    'pint': ('ml', 473.176),
+    'gallon': ('ml', 3785.41),
+    'each': ('each', 1.0),
+    'dozen': ('each', 12.0),
+}
+
+# Spellings seen in catalog and recipe text -> canonical unit
+UNIT_ALIASES = {
+    'g': 'g', 'gr': 'g', 'gram': 'g', 'grams': 'g', 'gramme': 'g', 'grammes': 'g',
+    'kg': 'kg', 'kgs': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'mg': 'mg', 'milligram': 'mg', 'milligrams': 'mg',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'ml': 'ml', 'millilitre': 'ml', 'millilitres': 'ml', 'milliliter': 'ml', 'milliliters': 'ml',
+    'l': 'l', 'litre': 'l', 'litres': 'l', 'liter': 'l', 'liters': 'l', 'ltr': 'l',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'tbsp': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'cup': 'cup', 'cups': 'cup',
+    'fl oz': 'fl oz', 'floz': 'fl oz', 'fl. oz': 'fl oz', 'fluid ounce': 'fl oz', 'fluid ounces': 'fl oz',
+    'pint': 'pint', 'pints': 'pint', 'pt': 'pint',
+    'gallon': 'gallon', 'gallons': 'gallon', 'gal': 'gallon',
+    'each': 'each', 'ea': 'each', 'unit': 'each', 'units': 'each', 'item': 'each', 'items': 'each',
+    'pc': 'each', 'pcs': 'each', 'piece': 'each', 'pieces': 'each', 'count': 'each', 'ct': 'each',
+    'pack': 'each', 'pk': 'each', 'per pack': 'each', 'bunch': 'each', 'clove': 'each', 'cloves': 'each',
+    'leaf': 'each', 'leaves': 'each', 'sprig': 'each', 'sprigs': 'each',
+    'serving': 'each', 'servings': 'each',
+    'dozen': 'dozen', 'doz': 'dozen',
+}
+
+# Known unit spellings only, longest first, so the regex skips "3 bananas" to reach "500g"
+_UNIT = r'(?P<unit>' + '|'.join(
+    re.escape(alias).replace(r'\ ', r'\s*') for alias in sorted(UNIT_ALIASES, key=len, reverse=True)) + r')\b'
+_NUMBER = r'(?:(?P<whole>\d+)\s+)?(?P<num>\d+)\s*/\s*(?P<den>\d+)|(?P<dec>\d*\.?\d+)'
+# Package size: optional "6 x " multipack count, then a number (decimal or fraction) and a unit
+QUANTITY_RE = rf'(?i)(?:(?P<count>\d+)\s*[x×]\s*)?(?:{_NUMBER})\s*{_UNIT}'
+# A unit on its own ("each", "per lb") is one of it
+BARE_UNIT_RE = rf'(?i)^\s*(?:per\s+)?{_UNIT}\s*$'
+# Unit price: "$0.48/100g", "$32.90/1kg", "($6.59 per item)"
+UNIT_PRICE_RE = r'(?i)\$\s*(?P<price>\d*\.?\d+)\s*(?:/|\bper\b)\s*(?P<per>\d*\.?\d+)?\s*' + _UNIT
+
+
+def canonical_units(units):
+    """Canonical unitConversion.ts unit for each unit string (NaN when unknown)."""
+    key = units.str.lower().str.replace(r'\s+', ' ', regex=True).str.replace('.', '', regex=False).str.strip()
+    return key.map(UNIT_ALIASES)
+
+
+def _base_columns(quantity, unit):
+    """(base unit, quantity in base units) for parsed quantities and canonical units."""
+    base_unit = unit.map({u: base for u, (base, _) in UNIT_FACTORS.items()})
+    factor = unit.map({u: factor for u, (_, factor) in UNIT_FACTORS.items()}).to_numpy(dtype=float)
+    return base_unit, quantity * factor
+
+
+def _parse_distinct(strings, parse):
+    """Apply a column parser to the distinct strings only, then broadcast back."""
+    codes, uniques = pd.factorize(strings)
+    parsed = parse(pd.Series(uniques, dtype=object))
+    taken = parsed.take(np.where(codes < 0, 0, codes)).reset_index(drop=True)
+    taken.loc[codes < 0] = np.nan
+    taken.index = strings.index
+    return taken
+
+
+def _numbers(parts):
+    """Float value of the decimal / fraction / mixed-number groups of _NUMBER."""
+    decimal = pd.to_numeric(parts['dec'], errors='coerce').to_numpy(dtype=float)
+    whole = pd.to_numeric(parts['whole'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    num = pd.to_numeric(parts['num'], errors='coerce').to_numpy(dtype=float)
+    den = pd.to_numeric(parts['den'], errors='coerce').to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = whole + num / den
+    return np.where(np.isnan(decimal), fraction, decimal)
+
+
+def _parse_quantities(strings):
+    parts = strings.str.extract(QUANTITY_RE)
+    bare = strings.str.extract(BARE_UNIT_RE)['unit']
+    parts['dec'] = parts['dec'].where(bare.isna(), '1')
+    parts['unit'] = parts['unit'].fillna(bare)
+    count = pd.to_numeric(parts['count'], errors='coerce').fillna(1).to_numpy(dtype=float)
+    quantity = _numbers(parts) * count
+    unit = canonical_units(parts['unit'])
+    # Unit prices ("$32.90/1kg") say nothing about the package size
+    quantity[strings.str.contains('$', regex=False).to_numpy(dtype=bool)] = np.nan
+    quantity[unit.isna().to_numpy()] = np.nan
+    base_unit, base_quantity = _base_columns(quantity, unit)
+    unit = unit.where(~np.isnan(quantity))
+    base_unit = base_unit.where(~np.isnan(quantity))
+    return pd.DataFrame({
+        'count': np.where(np.isnan(quantity), np.nan, count),
+        'quantity': quantity / count,
+        'unit': unit,
+        'base_unit': base_unit,
+        'base_quantity': base_quantity,
+    })
+
+
+def parse_quantities(units):
+    """Package size of each unit string.
+
+    Returns count (multipack count, 1 for single items), quantity (per
+    piece), canonical unit, base_unit and base_quantity (count x quantity in
+    g / ml / each). Rows without a recognizable size are NaN.
+    """
+    units = units.astype(object).where(units.notna())
+    return _parse_distinct(units, _parse_quantities)
+
+
+def _parse_unit_prices(strings):
+    parts = strings.str.extract(UNIT_PRICE_RE)
+    price = pd.to_numeric(parts['price'], errors='coerce').to_numpy(dtype=float)
+    per = pd.to_numeric(parts['per'], errors='coerce').fillna(1).to_numpy(dtype=float)
+    unit = canonical_units(parts['unit'])
+    base_unit, base_per = _base_columns(per, unit)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit_price = price / base_per
+    return pd.DataFrame({'base_unit': base_unit.where(~np.isnan(unit_price)), 'unit_price': unit_price})
+
+
+def parse_unit_prices(prices):
+    """Price per base unit from vendor unit-price strings ("$0.48/100g" -> 0.0048 per g)."""
+    prices = prices.astype(object).where(prices.notna())
+    return _parse_distinct(prices, _parse_unit_prices)
+
+
+def _to_price(values):
+    prices = pd.to_numeric(values, errors='coerce')
+    # Only strings like "$1,299.00" need cleaning
+    dirty = prices.isna() & values.notna()
+    if dirty.any():
+        cleaned = values[dirty].astype(str).str.replace(r'[$,\s]', '', regex=True)
+        prices[dirty] = pd.to_numeric(cleaned, errors='coerce')
+    return prices.to_numpy(dtype=float)
+
+
+def unit_prices(df, price_column='current_price', units_column='units', unit_price_column='price_per_unit'):
+    """base_unit, base_quantity and price_per_base_unit for each row of a catalog frame.
+
+    The package price divided by the parsed package size wins; rows sold by
+    weight or without a size fall back to the unit price in `units`, then to
+    `price_per_unit` when the frame has it.
+    """
+    sizes = parse_quantities(df[units_column])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_base = _to_price(df[price_column]) / sizes['base_quantity'].to_numpy()
+    per_base[~np.isfinite(per_base)] = np.nan
+    base_unit = sizes['base_unit'].copy()
+
+    fallbacks = [df[units_column]]
+    if unit_price_column in df:
+        fallbacks.append(df[unit_price_column])
+    for column in fallbacks:
+        missing = np.isnan(per_base)
+        if not missing.any():
+            break
+        quoted = parse_unit_prices(column)
+        fill = missing & ~np.isnan(quoted['unit_price'].to_numpy())
+        per_base[fill] = quoted['unit_price'].to_numpy()[fill]
+        base_unit[fill] = quoted['base_unit'][fill]
+
+    return pd.DataFrame({
+        'base_unit': base_unit,
+        'base_quantity': sizes['base_quantity'],
+        'price_per_base_unit': per_base,
+    }, index=df.index)
+
+
+def add_unit_prices(df, **columns):
+    """df with unit_prices() columns added."""
+    return df.assign(**unit_prices(df, **columns))
+
+
+def cheapest(df, base_unit, n=10):
+    """The n rows with the lowest price per base unit among those measured in base_unit."""
+    same_unit = df[df['base_unit'] == base_unit]
+    return same_unit.nsmallest(n, 'price_per_base_unit')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--catalog', default='latest_grocery_data.parquet')
+    parser.add_argument('--top', type=int, default=10, help='cheapest rows to show per base unit')
+    args = parser.parse_args(argv)
+
+    columns = ['vendor', 'product_name', 'units', 'current_price', 'price_per_unit']
+    if args.catalog.endswith('.parquet'):
+        df = pd.read_parquet(args.catalog, columns=columns)
+    else:
+        df = pd.read_json(args.catalog)[columns]
+
+    start = time.perf_counter()
+    df = add_unit_prices(df)
+    elapsed = time.perf_counter() - start
+    priced = df['price_per_base_unit'].notna()
+    print(f"{len(df)} rows normalized in {elapsed:.2f}s; {priced.mean():.1%} have a price per base unit")
+    print(df.loc[priced, 'base_unit'].value_counts().to_string())
+    for base_unit in ('g', 'ml', 'each'):
+        print(f"\nCheapest per {base_unit}:")
+        print(cheapest(df, base_unit, args.top)[['vendor', 'product_name', 'units', 'current_price',
+                                                 'price_per_base_unit']].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
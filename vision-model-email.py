@@ -1,11 +1,13 @@
-import requests
 import json
-import time
 import re
 import shutil
 from pathlib import Path
 import os
 
+from instrumentation import span
+from log_extraction import extract_created_jsons
+from pipeline_client import PipelineError, run_pipeline
+
 
 # Clear item_json and test_folders from previous runs
 for folder in (Path("test_folders"), Path("item_json")):
@@ -21,47 +23,19 @@ headers = {
 
 print("Request URL:", url)
 
-response = requests.post(url, headers=headers)
-print("\n--- Start pipeline response ---")
-print("Status Code:", response.status_code)
-print("Response Text:", response.text)
-
-result = response.json()
-run_id = result.get("run_id")
-
-if not run_id:
-    # Maybe synchronous: outputs returned directly
-    if "outputs" in result and result.get("state") == "DONE":
-        outputs = result["outputs"]
-        run_id = None  # skip polling
-    else:
-        print("No run_id in response. Full response:", json.dumps(result, indent=2))
-        exit(1)
-
-if run_id:
-    # Poll get_pl_run until DONE or FAILED
-    poll_url = os.getenv("BASE_URL") + "/get_pl_run"
-    timeout_sec = 120
-    poll_interval = 2
-    start = time.time()
-    while True:
-        if time.time() - start > timeout_sec:
-            print("Polling timed out")
-            exit(1)
-        r = requests.get(poll_url, params={"run_id": run_id, "user_id": os.getenv("USER_ID")}, headers=headers)
-        data = r.json()
-        state = data.get("state", "")
-        print(f"Run state: {state}")
-        if state == "DONE":
-            outputs = data.get("outputs", {})
-            break
-        if state == "FAILED":
-            print("Run failed:", json.dumps(data, indent=2))
-            exit(1)
-        time.sleep(poll_interval)
-
-# Full run response (from get_pl_run when we polled, or start_pipeline when synchronous)
-run_response = data if run_id else result
+try:
+    run_response = run_pipeline(
+        url,
+        base_url=os.getenv("BASE_URL"),
+        user_id=os.getenv("USER_ID"),
+        headers=headers,
+        on_state=lambda state: print(f"Run state: {state}"),
+    )
+except PipelineError as e:
+    print(e)
+    if e.response is not None:
+        print(json.dumps(e.response, indent=2))
+    exit(1)
 
 # Create test_folders and save each output as a JSON file
 out_dir = Path("test_folders")
@@ -83,6 +57,7 @@ def _to_serializable(obj):
     return obj
 
 
+outputs = run_response.get("outputs", {})
 saved = []
 for name, value in outputs.items():
     safe_name = _sanitize_filename(name) or "output"
@@ -120,22 +95,15 @@ else:
 # Extract "Successfully created JSON" entries from log and save to item_json
 item_dir = Path("item_json")
 item_dir.mkdir(exist_ok=True)
-prefix = "__standard__: Successfully created JSON: "
 item_saved = []
-all_objs = []
-for entry in run_response.get("log", []):
-    if isinstance(entry, str) and entry.startswith(prefix):
-        json_str = entry[len(prefix) :].strip()
-        try:
-            obj = json.loads(json_str)
-            all_objs.append(obj)
-            path = item_dir / f"item_{len(item_saved)}.json"
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(obj, f, indent=2, ensure_ascii=False)
-            item_saved.append(str(path))
-            print("Saved item JSON:", path)
-        except json.JSONDecodeError:
-            pass
+with span("extract_created_jsons"):
+    all_objs = extract_created_jsons(run_response)
+for obj in all_objs:
+    path = item_dir / f"item_{len(item_saved)}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    item_saved.append(str(path))
+    print("Saved item JSON:", path)
 def _has_location_address(obj):
     """True if the object has location/address fields (ignore such JSONs after the first)."""
     if not isinstance(obj, dict):
@@ -1,14 +1,17 @@
 # Vision Model
 
-import requests
 import json
-import time
 import re
 import shutil
 from pathlib import Path
 import os
 import base64
 
+import receipt_images
+from instrumentation import span
+from log_extraction import extract_created_jsons
+from pipeline_client import PipelineError, run_pipeline
+
 BASE_URL = os.getenv("BASE_URL")
 USER_ID = os.getenv("USER_ID")
 SAVED_ITEM_ID = os.getenv("SAVED_ITEM_ID")
@@ -26,54 +29,36 @@ headers = {
 }
 
 
-payload = {
-    "receipt_image": "https://media-cdn.tripadvisor.com/media/photo-s/17/9b/8e/b1/our-receipt.jpg"
-}
-
-print("Request URL:", url)
-print("Payload:", json.dumps(payload, indent=2))
-
-response = requests.post(url, json=payload, headers=headers)
-print("\n--- Start pipeline response ---")
-print("Status Code:", response.status_code)
-print("Response Text:", response.text)
+RECEIPT_IMAGE = "https://media-cdn.tripadvisor.com/media/photo-s/17/9b/8e/b1/our-receipt.jpg"
 
-result = response.json()
-run_id = result.get("run_id")
+# Downscale locally and send the image inline, so the pipeline doesn't fetch the full-size photo
+payload = {"receipt_image": RECEIPT_IMAGE}
+if receipt_images.available():
+    try:
+        with span("prepare_image"):
+            prepared = receipt_images.prepare_image(RECEIPT_IMAGE)
+        payload = prepared.payload()
+        print(f"Receipt image: {prepared.original_bytes} bytes -> {len(prepared.data)} bytes inline")
+    except OSError as e:
+        print(f"Could not fetch {RECEIPT_IMAGE} ({e}); sending the URL instead")
 
-if not run_id:
-    # Maybe synchronous: outputs returned directly
-    if "outputs" in result and result.get("state") == "DONE":
-        outputs = result["outputs"]
-        run_id = None  # skip polling
-    else:
-        print("No run_id in response. Full response:", json.dumps(result, indent=2))
-        exit(1)
-
-if run_id:
-    # Poll get_pl_run until DONE or FAILED
-    poll_url = f"{BASE_URL}/get_pl_run"
-    timeout_sec = 120
-    poll_interval = 2
-    start = time.time()
-    while True:
-        if time.time() - start > timeout_sec:
-            print("Polling timed out")
-            exit(1)
-        r = requests.get(poll_url, params={"run_id": run_id, "user_id": USER_ID}, headers=headers)
-        data = r.json()
-        state = data.get("state", "")
-        print(f"Run state: {state}")
-        if state == "DONE":
-            outputs = data.get("outputs", {})
-            break
-        if state == "FAILED":
-            print("Run failed:", json.dumps(data, indent=2))
-            exit(1)
-        time.sleep(poll_interval)
-
-# Full run response (from get_pl_run when we polled, or start_pipeline when synchronous)
-run_response = data if run_id else result
+print("Request URL:", url)
+print("Payload:", json.dumps({k: v[:80] + "..." if len(v) > 80 else v for k, v in payload.items()}, indent=2))
+
+try:
+    run_response = run_pipeline(
+        url,
+        payload,
+        base_url=BASE_URL,
+        user_id=USER_ID,
+        headers=headers,
+        on_state=lambda state: print(f"Run state: {state}"),
+    )
+except PipelineError as e:
+    print(e)
+    if e.response is not None:
+        print(json.dumps(e.response, indent=2))
+    exit(1)
 
 # Create test_folders and save each output as a JSON file
 out_dir = Path("test_folders")
@@ -95,6 +80,7 @@ def _to_serializable(obj):
     return obj
 
 
+outputs = run_response.get("outputs", {})
 saved = []
 for name, value in outputs.items():
     safe_name = _sanitize_filename(name) or "output"
@@ -132,22 +118,15 @@ else:
 # Extract "Successfully created JSON" entries from log and save to item_json
 item_dir = Path("item_json")
 item_dir.mkdir(exist_ok=True)
-prefix = "__standard__: Successfully created JSON: "
 item_saved = []
-all_objs = []
-for entry in run_response.get("log", []):
-    if isinstance(entry, str) and entry.startswith(prefix):
-        json_str = entry[len(prefix) :].strip()
-        try:
-            obj = json.loads(json_str)
-            all_objs.append(obj)
-            path = item_dir / f"item_{len(item_saved)}.json"
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(obj, f, indent=2, ensure_ascii=False)
-            item_saved.append(str(path))
-            print("Saved item JSON:", path)
-        except json.JSONDecodeError:
-            pass
+with span("extract_created_jsons"):
+    all_objs = extract_created_jsons(run_response)
+for obj in all_objs:
+    path = item_dir / f"item_{len(item_saved)}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    item_saved.append(str(path))
+    print("Saved item JSON:", path)
 # Build combined JSON: store is always the last JSON created; the rest are items
 store = all_objs[-1] if all_objs else {}
 items = all_objs[:-1]